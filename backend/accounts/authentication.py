@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from smartfinance.sharding import ShardMoving, activate_request_shard, sharding_enabled
+from transactions.versions import get_data_version, versions_shared
+
+DEFAULT_AUTH_USER_CACHE = {
+    'MAX_USERS': 10000,
+    'TTL': 60,
+}
+
+# What views read from request.user; other fields load on first access
+CACHED_USER_FIELDS = ('id', 'username', 'currency', 'is_active', 'shard', 'shard_moving')
+
+
+class UserCache:
+    """In-process LRU of user field values, each entry expiring after `ttl` seconds"""
+
+    def __init__(self, max_users, ttl):
+        self.max_users = max_users
+        self.ttl = ttl
+        # {user id: (expiry, profile data version, field values)}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic() or entry[1] != version:
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[2]
+
+    def set(self, user_id, version, values):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, version, values)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def user_cache_settings():
+    return {**DEFAULT_AUTH_USER_CACHE, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+def get_user_cache():
+    """The process-wide UserCache configured by settings.AUTH_USER_CACHE"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = user_cache_settings()
+                _user_cache = UserCache(config['MAX_USERS'], config['TTL'])
+    return _user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication resolving the token's user from a short-lived in-process cache
+
+    request.user only has CACHED_USER_FIELDS loaded; reading any other field
+    queries it. Entries are keyed by the user's 'profile' data version, which
+    every User save or delete bumps, and expire after AUTH_USER_CACHE['TTL']
+    seconds, which bounds staleness after queryset updates that send no signals.
+    Without versions shared between processes, a save or delete elsewhere
+    would go unnoticed, so every request loads the user instead.
+
+    With sharding on it also selects the user's shard for the request, and
+    turns away writes while rebalance_shards is moving the user's data.
+    Writes read the shard fields from the database rather than the cache: a
+    write let through on a stale entry would land on the source shard after
+    its rows were copied, and be deleted with them.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and sharding_enabled():
+            user = result[0]
+            if request.method not in SAFE_METHODS:
+                user.shard, user.shard_moving = self.user_model.objects.using(DEFAULT_DB_ALIAS).filter(
+                    pk=user.pk).values_list('shard', 'shard_moving').get()
+                if user.shard_moving:
+                    raise ShardMoving()
+            activate_request_shard(user)
+        return result
+
+    def get_user(self, validated_token):
+        # Revocation compares the password hash, which isn't cached
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False) or api_settings.USER_ID_FIELD != 'id':
+            return super().get_user(validated_token)
+
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        except (TypeError, ValueError):
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        # from_db() expects values in the model's field order
+        field_names = [field.attname for field in self.user_model._meta.concrete_fields
+                       if field.attname in CACHED_USER_FIELDS]
+        cache = get_user_cache() if versions_shared() else None
+        version = values = None
+        if cache is not None:
+            version = get_data_version(user_id, 'profile')
+            values = cache.get(user_id, version)
+        if values is None:
+            values = self.user_model.objects.filter(pk=user_id).values_list(*field_names).first()
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            if cache is not None:
+                cache.set(user_id, version, values)
+
+        user = self.user_model.from_db(router.db_for_read(self.user_model), field_names, values)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
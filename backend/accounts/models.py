@@ -1,13 +1,18 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from smartfinance.money import MoneyField
 
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
-    monthly_income = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    monthly_income = MoneyField(default=0)
     currency = models.CharField(max_length=3, default='USD')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Database alias holding the user's data when sharding is on; blank is 'default'
+    shard = models.CharField(max_length=32, blank=True)
+    # Set while rebalance_shards copies the user's data; their writes get 503s
+    shard_moving = models.BooleanField(default=False)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
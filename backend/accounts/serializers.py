@@ -1,18 +1,20 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
+from smartfinance.instrumentation import TimedSerializerMixin
+from smartfinance.money import MoneySerializerMixin
 
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, MoneySerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'monthly_income', 'currency', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(MoneySerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     password2 = serializers.CharField(write_only=True, min_length=8)
 
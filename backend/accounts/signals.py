@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from smartfinance.sharding import get_ring, sharding_enabled
+from transactions.sharding import delete_user_data, mirror_user
+from .authentication import get_user_cache
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Profile edits and deactivation apply to this process's next request at once;
+    # other processes see the bumped profile version
+    get_user_cache().invalidate(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def place_new_user(sender, instance, created, using, raw=False, **kwargs):
+    # Users live on 'default'; their rows go to the shard the ring picks
+    if not created or raw or using != DEFAULT_DB_ALIAS or not sharding_enabled() or instance.shard:
+        return
+    instance.shard = get_ring().node_for(instance.pk)
+    sender.objects.using(using).filter(pk=instance.pk).update(shard=instance.shard)
+    mirror_user(instance.pk, instance.shard)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def delete_sharded_user_data(sender, instance, using, **kwargs):
+    # The delete only cascades on 'default'
+    if using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    shard = sender.objects.using(using).filter(pk=instance.pk).values_list('shard', flat=True).first()
+    if shard and shard != DEFAULT_DB_ALIAS:
+        delete_user_data(instance.pk, shard)
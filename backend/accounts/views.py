@@ -2,10 +2,14 @@ from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.contrib.auth import authenticate
+from django.contrib.auth import authenticate, get_user_model
+from django.utils.decorators import method_decorator
 from rest_framework_simplejwt.tokens import RefreshToken
+from transactions.conditional import PROFILE_SCOPES, versioned_response
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer
 
+User = get_user_model()
+
 
 class RegisterView(generics.CreateAPIView):
     permission_classes = [AllowAny]
@@ -48,9 +52,11 @@ class LoginView(APIView):
             )
 
 
+@method_decorator(versioned_response(PROFILE_SCOPES), name='get')
 class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
 
     def get_object(self):
-        return self.request.user
+        # request.user only has the fields authentication caches; load the rest at once
+        return User.objects.get(pk=self.request.user.pk)
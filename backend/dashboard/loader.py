@@ -0,0 +1,122 @@
+import asyncio
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from accounts.serializers import UserSerializer
+from ml_insights import worker
+from ml_insights.accumulators import get_accumulated_insights
+from ml_insights.feature_cache import aget_user_features, get_user_features
+from ml_insights.jobs import get_result, precompute_enabled
+from ml_insights.ml_engine import FinanceMLEngine
+from ml_insights.registry import get_model_registry
+from smartfinance.db_router import analytics_db
+from smartfinance.money import from_minor, minor_array
+from transactions.categories import visible_categories
+from transactions.models import Budget, SavingsGoal
+from transactions.serializers import BudgetSerializer, CategorySerializer, SavingsGoalSerializer
+from transactions.summary import reduce_summary, summary_rows, summary_source
+
+User = get_user_model()
+
+# Stands in for a precomputed section ml_worker hasn't produced yet
+PENDING = {'status': 'pending'}
+
+SECTIONS = ('profile', 'summary', 'budgets', 'savings_goals', 'categories', 'prediction', 'insights')
+
+
+class DashboardLoader:
+    """Builds dashboard sections for one user, sharing data loads between sections"""
+
+    def __init__(self, user, start_date, end_date):
+        self.user = user
+        self.start_date = start_date
+        self.end_date = end_date
+        self._budgets = None
+        self._daily_rows = None
+        self._features = None
+
+    def load(self, sections):
+        return {section: getattr(self, f'load_{section}')() for section in sections}
+
+    async def aload(self, sections, executor):
+        """load() for async views: the prediction runs on `executor` while the other sections query the database"""
+        predict = 'prediction' in sections and not precompute_enabled()
+        db_sections = [section for section in sections if not (predict and section == 'prediction')]
+        loaded, prediction = await asyncio.gather(
+            sync_to_async(self.load)(db_sections),
+            self.aload_prediction(executor) if predict else asyncio.sleep(0),
+        )
+        if predict:
+            loaded['prediction'] = prediction
+        return {section: loaded[section] for section in sections}
+
+    async def aload_prediction(self, executor):
+        features = await aget_user_features(self.user, executor)
+        return await executor.run(worker.predict_expenses, features, self.user.pk)
+
+    def budgets(self):
+        if self._budgets is None:
+            self._budgets = list(Budget.objects.using(analytics_db(self.user.pk)).filter(user=self.user))
+        return self._budgets
+
+    def daily_rows(self):
+        """Per-day, per-category income/expense sums covering the summary window and every budget"""
+        if self._daily_rows is None:
+            start_date, end_date = self.start_date, self.end_date
+            for budget in self.budgets():
+                start_date = min(start_date, budget.start_date)
+                end_date = max(end_date, budget.end_date)
+            source, date_field, amount_field = summary_source(self.user, start_date, end_date)
+            self._daily_rows = list(summary_rows(source, 'day', date_field, amount_field))
+        return self._daily_rows
+
+    def features(self):
+        if self._features is None:
+            self._features = get_user_features(self.user)
+        return self._features
+
+    def load_profile(self):
+        # The authenticated user only has the fields authentication caches
+        return UserSerializer(User.objects.get(pk=self.user.pk)).data
+
+    def load_summary(self):
+        rows = [row for row in self.daily_rows() if self.start_date <= row['bucket'] <= self.end_date]
+        summary = reduce_summary(rows, visible_categories(self.user.pk))
+        summary['start_date'] = self.start_date
+        summary['end_date'] = self.end_date
+        return summary
+
+    def load_budgets(self):
+        # Spend comes from the same daily rows as the summary rather than a subquery per budget:
+        # one masked int64 sum over their expense columns per budget
+        rows = [row for row in self.daily_rows() if row['expense'] and row['category_id'] is not None]
+        categories = np.array([row['category_id'] for row in rows], dtype=np.int64)
+        days = np.array([row['bucket'] for row in rows], dtype='datetime64[D]')
+        expenses = minor_array([row['expense'] for row in rows])
+
+        budgets = self.budgets()
+        for budget in budgets:
+            in_budget = (
+                (categories == budget.category_id)
+                & (days >= np.datetime64(budget.start_date, 'D'))
+                & (days <= np.datetime64(budget.end_date, 'D'))
+            )
+            budget.spent_amount = from_minor(expenses[in_budget].sum())
+        return BudgetSerializer(budgets, many=True).data
+
+    def load_savings_goals(self):
+        return SavingsGoalSerializer(SavingsGoal.objects.filter(user=self.user), many=True).data
+
+    def load_categories(self):
+        return CategorySerializer(visible_categories(self.user.pk).categories, many=True).data
+
+    def load_prediction(self):
+        if precompute_enabled():
+            return get_result(self.user, 'prediction') or PENDING
+        ml_engine = FinanceMLEngine(registry=get_model_registry())
+        return ml_engine.predict_from_features(self.features(), user_id=self.user.pk)
+
+    def load_insights(self):
+        if precompute_enabled():
+            return get_result(self.user, 'insights') or PENDING
+        return get_accumulated_insights(self.user)
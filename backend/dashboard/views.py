@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+from django.utils.decorators import method_decorator
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from ml_insights.executor import ExecutorBusy, get_ml_executor
+from ml_insights.views import busy_response
+from transactions.async_views import AsyncAPIView
+from transactions.conditional import DASHBOARD_SCOPES, SHARED_SCOPES, versioned_response
+from .loader import SECTIONS, DashboardLoader
+
+
+class DashboardView(AsyncAPIView):
+    """Everything the dashboard needs in one request, with ETag-based conditional GET"""
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(versioned_response(DASHBOARD_SCOPES, SHARED_SCOPES))
+    async def get(self, request):
+        sections = request.query_params.get('sections')
+        if sections:
+            sections = [name.strip() for name in sections.split(',') if name.strip()]
+            unknown = set(sections) - set(SECTIONS)
+            if unknown:
+                return Response(
+                    {'error': f"Unknown section(s): {', '.join(sorted(unknown))}. "
+                              f"Choose from: {', '.join(SECTIONS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            sections = SECTIONS
+
+        try:
+            end_date = date.fromisoformat(request.query_params['end_date'])
+            start_date = date.fromisoformat(request.query_params['start_date'])
+        except KeyError:
+            end_date = datetime.now().date()
+            start_date = end_date - timedelta(days=30)
+        except ValueError:
+            return Response(
+                {'error': 'start_date and end_date must be YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            data = await DashboardLoader(request.user, start_date, end_date).aload(sections, get_ml_executor())
+        except ExecutorBusy:
+            return busy_response()
+
+        return Response(data)
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import datetime
+import pandas as pd
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, Sum
+from smartfinance.money import MINOR_UNITS, Minor
+from transactions.categories import visible_categories
+from transactions.models import Transaction
+from .ml_engine import FinanceMLEngine
+from .models import InsightAccumulator
+
+# Daily slots kept for the trend windows (last 30 days and the 30 before), with slack
+RING_DAYS = 64
+TREND_DAYS = 30
+
+
+def _category_key(category_id):
+    return '' if category_id is None else str(category_id)
+
+
+def _empty_accumulator(user_id):
+    return InsightAccumulator(
+        user_id=user_id,
+        weekdays=[[0, 0] for _ in range(7)],
+        ring_days=[0] * RING_DAYS,
+        ring_totals=[0] * RING_DAYS,
+    )
+
+
+def accumulate(accumulator, category_id, trans_type, day, cents, count, today):
+    """Fold `count` transactions totalling `cents` into an accumulator (negative to remove); O(1)"""
+    accumulator.transaction_count += count
+    if trans_type != 'expense':
+        return
+    accumulator.expense_count += count
+
+    key = _category_key(category_id)
+    entry = accumulator.categories.setdefault(key, [0, 0])
+    entry[0] += cents
+    entry[1] += count
+    if entry[1] == 0:
+        del accumulator.categories[key]
+
+    weekday = accumulator.weekdays[day.weekday()]
+    weekday[0] += cents
+    weekday[1] += count
+
+    ordinal = day.toordinal()
+    if ordinal > today.toordinal():
+        # Ring slots only move forward with the calendar, so dates still ahead wait here
+        key = str(ordinal)
+        accumulator.future_days[key] = accumulator.future_days.get(key, 0) + cents
+        if not accumulator.future_days[key]:
+            del accumulator.future_days[key]
+    elif ordinal > today.toordinal() - RING_DAYS:
+        # A slot holding another day holds one at least RING_DAYS older: expired
+        slot = ordinal % RING_DAYS
+        if accumulator.ring_days[slot] == ordinal:
+            accumulator.ring_totals[slot] += cents
+        else:
+            accumulator.ring_days[slot] = ordinal
+            accumulator.ring_totals[slot] = cents
+
+
+def _prune_future_days(accumulator, today):
+    oldest = today.toordinal() - RING_DAYS
+    accumulator.future_days = {
+        key: cents for key, cents in accumulator.future_days.items() if int(key) > oldest
+    }
+
+
+def rebuild_accumulator(user_id, today=None):
+    """Recompute a user's accumulator from their transactions, one row per day, category and type"""
+    today = today or datetime.now().date()
+    with transaction.atomic(using=router.db_for_write(InsightAccumulator)):
+        # Hold the row lock while reading so no concurrent delta lands in between
+        existing = InsightAccumulator.objects.select_for_update().filter(user_id=user_id).first()
+        accumulator = _empty_accumulator(user_id)
+        if existing is not None:
+            accumulator.pk = existing.pk
+
+        rows = Transaction.objects.filter(user_id=user_id).order_by().values(
+            'category_id', 'type', 'date'
+        ).annotate(total=Minor(Sum('amount')), count=Count('id'))
+        for row in rows.iterator():
+            accumulate(accumulator, row['category_id'], row['type'], row['date'], row['total'], row['count'], today)
+
+        try:
+            with transaction.atomic(using=router.db_for_write(InsightAccumulator)):
+                accumulator.save()
+        except IntegrityError:
+            # Created concurrently; recompute under its lock so nothing is lost
+            return rebuild_accumulator(user_id, today)
+    return accumulator
+
+
+def apply_changes(added=(), removed=(), today=None):
+    """Fold written transactions into their users' accumulators, as transaction_state() snapshots"""
+    today = today or datetime.now().date()
+    changes = defaultdict(list)
+    for sign, states in ((-1, removed), (1, added)):
+        for state in states:
+            changes[state[0]].append((state, sign))
+
+    with transaction.atomic(using=router.db_for_write(InsightAccumulator)):
+        for user_id, user_changes in changes.items():
+            accumulator = InsightAccumulator.objects.select_for_update().filter(user_id=user_id).first()
+            if accumulator is None:
+                # Built from the table on first read, which already has these writes
+                continue
+            for (_, category_id, trans_type, day, cents), sign in user_changes:
+                accumulate(accumulator, category_id, trans_type, day, cents * sign, sign, today)
+            _prune_future_days(accumulator, today)
+            accumulator.save()
+
+
+def merge_category(category_id, into=None):
+    """Move a category's totals to another key, e.g. to uncategorized after the category is deleted"""
+    source, target = _category_key(category_id), _category_key(into)
+    with transaction.atomic(using=router.db_for_write(InsightAccumulator)):
+        for accumulator in InsightAccumulator.objects.select_for_update().filter(categories__has_key=source):
+            cents, count = accumulator.categories.pop(source)
+            entry = accumulator.categories.setdefault(target, [0, 0])
+            entry[0] += cents
+            entry[1] += count
+            accumulator.save(update_fields=['categories', 'updated_at'])
+
+
+def insights_from_accumulator(accumulator, today=None):
+    """Spending insights from a user's accumulator, named from the category directory; no transaction scan"""
+    today = today or datetime.now().date()
+    categories = visible_categories(accumulator.user_id)
+
+    category_cents = defaultdict(int)
+    for key, (cents, _) in accumulator.categories.items():
+        category = categories.get(int(key)) if key else None
+        category_cents[category.name if category is not None else 'Uncategorized'] += cents
+    category_totals = pd.Series(
+        {name: cents / MINOR_UNITS for name, cents in category_cents.items()}, dtype='float64'
+    ).sort_index()
+
+    day_of_week_avg = pd.Series(
+        {weekday: cents / MINOR_UNITS / count for weekday, (cents, count) in enumerate(accumulator.weekdays) if count},
+        dtype='float64'
+    )
+
+    recent_start = today.toordinal() - TREND_DAYS
+    previous_start = recent_start - TREND_DAYS
+    days = list(zip(accumulator.ring_days, accumulator.ring_totals))
+    days += [(int(key), cents) for key, cents in accumulator.future_days.items()]
+    recent = sum(cents for ordinal, cents in days if ordinal >= recent_start)
+    previous = sum(cents for ordinal, cents in days if previous_start <= ordinal < recent_start)
+
+    return FinanceMLEngine().insights_from_statistics(
+        accumulator.transaction_count,
+        accumulator.expense_count,
+        category_totals,
+        day_of_week_avg,
+        (recent / MINOR_UNITS, previous / MINOR_UNITS)
+    )
+
+
+def get_accumulated_insights(user):
+    """A user's spending insights, building their accumulator on first use"""
+    accumulator = InsightAccumulator.objects.filter(user=user).first()
+    if accumulator is None:
+        accumulator = rebuild_accumulator(user.pk)
+    return insights_from_accumulator(accumulator)
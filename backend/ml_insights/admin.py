@@ -1,3 +1,6 @@
 from django.contrib import admin
+from .models import TrainedModel, MLJob, PrecomputedResult
 
-# Register your models here.
+admin.site.register(TrainedModel)
+admin.site.register(MLJob)
+admin.site.register(PrecomputedResult)
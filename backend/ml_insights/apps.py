@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MlInsightsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ml_insights'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,281 @@
+import hashlib
+import threading
+import time
+from collections import deque
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from smartfinance.instrumentation import stage
+from smartfinance.money import MINOR_UNITS, Minor, minor_array
+from smartfinance.sharding import home_shard, shard_aliases, sharding_enabled
+from transactions.models import Category, Transaction
+from .registry import get_model_registry
+
+# Checked in order; the first category with any keyword in the description wins
+KEYWORD_RULES = {
+    'food': ['food', 'restaurant', 'grocery', 'lunch', 'dinner', 'breakfast'],
+    'transport': ['uber', 'taxi', 'gas', 'fuel', 'transport', 'parking'],
+    'entertainment': ['movie', 'game', 'netflix', 'spotify', 'entertainment'],
+    'shopping': ['amazon', 'shop', 'store', 'mall', 'clothing'],
+    'utilities': ['electric', 'water', 'internet', 'phone', 'utility'],
+    'health': ['doctor', 'hospital', 'pharmacy', 'medical', 'health'],
+}
+
+KEYWORD_CONFIDENCE = 0.8
+FALLBACK_CATEGORY = 'other'
+FALLBACK_CONFIDENCE = 0.3
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over every keyword rule, run over a whole batch with NumPy
+
+    All descriptions advance through the automaton together, one character
+    per step, so a batch costs one pass over its characters whatever the
+    number of rules. Each state holds the lowest rule index among the
+    keywords ending there; a description's minimum over the states it visits
+    is the first rule, in order, with any keyword in it.
+    """
+
+    def __init__(self, rules):
+        self.labels = [*rules, None]
+        keywords = [(keyword.lower(), index) for index, words in enumerate(rules.values()) for keyword in words]
+        chars = sorted({char for keyword, _ in keywords for char in keyword})
+        # Character code -> symbol; 0 stands for every character no keyword contains
+        self.symbols = np.zeros(ord(chars[-1]) + 2 if chars else 1, dtype=np.intp)
+        for symbol, char in enumerate(chars, 1):
+            self.symbols[ord(char)] = symbol
+        self.transitions, self.rules = self._compile(keywords, len(chars) + 1)
+
+    def _compile(self, keywords, width):
+        """(transition table, rule index per state), failure links folded into both"""
+        no_match = len(self.labels) - 1
+        children, rules = [{}], [no_match]
+        for keyword, index in keywords:
+            state = 0
+            for char in keyword:
+                symbol = self.symbols[ord(char)]
+                if symbol not in children[state]:
+                    children[state][symbol] = len(children)
+                    children.append({})
+                    rules.append(no_match)
+                state = children[state][symbol]
+            rules[state] = min(rules[state], index)
+
+        transitions = np.zeros((len(children), width), dtype=np.intp)
+        fail = [0] * len(children)
+        queue = deque(children[0].values())
+        for symbol, child in children[0].items():
+            transitions[0, symbol] = child
+        # Breadth first, so a state's failure target is complete before the state
+        while queue:
+            state = queue.popleft()
+            rules[state] = min(rules[state], rules[fail[state]])
+            transitions[state] = transitions[fail[state]]
+            for symbol, child in children[state].items():
+                fail[child] = transitions[fail[state], symbol]
+                transitions[state, symbol] = child
+                queue.append(child)
+        return transitions, np.array(rules, dtype=np.intp)
+
+    def match(self, description):
+        return self.match_many([description])[0]
+
+    def match_many(self, descriptions):
+        """The first matching rule's category for each description, or None"""
+        lowered = [description.lower() for description in descriptions]
+        lengths = np.fromiter(map(len, lowered), dtype=np.intp, count=len(lowered))
+        codes = np.frombuffer(''.join(lowered).encode('utf-32-le'), dtype=np.uint32)
+        symbols = self.symbols[np.minimum(codes, len(self.symbols) - 1)]
+
+        # Longest first, so the descriptions still running at each step are a prefix
+        order = np.argsort(-lengths, kind='stable')
+        starts = (np.cumsum(lengths) - lengths)[order]
+        running = len(lengths) - np.searchsorted(np.sort(lengths), np.arange(lengths.max(initial=0)), side='right')
+        states = np.zeros(len(lengths), dtype=np.intp)
+        best = np.full(len(lengths), self.rules[0])
+        for step, count in enumerate(running):
+            states[:count] = self.transitions[states[:count], symbols[starts[:count] + step]]
+            np.minimum(best[:count], self.rules[states[:count]], out=best[:count])
+
+        matched = np.empty_like(best)
+        matched[order] = best
+        return [self.labels[index] for index in matched]
+
+
+class TextCategoryModel:
+    """Linear classifier over hashed character n-grams of the description plus the amount"""
+    vectorizer = HashingVectorizer(
+        analyzer='char_wb',
+        ngram_range=(3, 5),
+        n_features=2 ** 18,
+        alternate_sign=False,
+        lowercase=True
+    )
+
+    def __init__(self):
+        self.classifier = LogisticRegression(C=10.0, max_iter=300)
+
+    def features(self, descriptions, amounts):
+        text = self.vectorizer.transform(descriptions)
+        magnitude = np.log1p(np.abs(np.asarray(amounts, dtype=np.float64))) / 10
+        return sparse.hstack([text, sparse.csr_matrix(magnitude.reshape(-1, 1))], format='csr')
+
+    @stage('ml.fit')
+    def fit(self, descriptions, amounts, labels):
+        self.classifier.fit(self.features(descriptions, amounts), labels)
+        return self
+
+    @stage('ml.predict')
+    def predict(self, descriptions, amounts):
+        """Labels and probabilities for a whole batch in one matrix product"""
+        probabilities = self.classifier.predict_proba(self.features(descriptions, amounts))
+        best = probabilities.argmax(axis=1)
+        return self.classifier.classes_[best], probabilities[np.arange(len(best)), best]
+
+
+class CategoryClassifier:
+    """Keyword fast path in front of per-user (or global) trained text models"""
+    model_type = 'category_text'
+
+    def __init__(self, registry=None, min_samples=20, max_samples=50000, refresh_interval=300):
+        self.registry = registry
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.refresh_interval = refresh_interval
+        self.keywords = KeywordMatcher(KEYWORD_RULES)
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+
+    def classify(self, descriptions, amounts, user_id=None):
+        """Classify a batch of descriptions; returns one prediction dict per item"""
+        descriptions = [description or '' for description in descriptions]
+        results = [None] * len(descriptions)
+        misses = []
+        for index, category in enumerate(self.keywords.match_many(descriptions)):
+            if category is None:
+                misses.append(index)
+            else:
+                results[index] = {'predicted_category': category, 'confidence': KEYWORD_CONFIDENCE, 'source': 'keyword'}
+
+        model, source = self.model_for(user_id) if misses else (None, None)
+        if model is not None:
+            labels, confidences = model.predict(
+                [descriptions[index] for index in misses],
+                [amounts[index] for index in misses]
+            )
+            for index, label, confidence in zip(misses, labels, confidences):
+                results[index] = {'predicted_category': str(label), 'confidence': float(confidence), 'source': source}
+        else:
+            for index in misses:
+                results[index] = {
+                    'predicted_category': FALLBACK_CATEGORY,
+                    'confidence': FALLBACK_CONFIDENCE,
+                    'source': 'default'
+                }
+        return results
+
+    def model_for(self, user_id):
+        """The user's own model when they have enough labelled data, else the global one"""
+        if self.registry is None:
+            return None, None
+        if user_id is not None:
+            model = self._model(user_id)
+            if model is not None:
+                return model, 'user_model'
+        model = self._model(None)
+        return (model, 'global_model') if model is not None else (None, None)
+
+    def _training_sources(self, owner):
+        """Querysets of labelled rows: the owner's, or for the global model one per shard"""
+        rows = Transaction.objects.filter(category__isnull=False).exclude(description='')
+        if owner is not None:
+            return [rows.filter(user_id=owner)]
+        # Only shared categories, so one user's labels never leak to another
+        rows = rows.filter(category__is_default=True)
+        if sharding_enabled():
+            return [rows.using(alias) for alias in shard_aliases()]
+        return [rows]
+
+    def _model(self, owner):
+        fingerprint = self._fingerprint(owner)
+        if fingerprint is None:
+            return None
+
+        def train():
+            # The newest rows across every source
+            rows = sorted(
+                (row for source in self._training_sources(owner) for row in source.order_by('-id').values_list(
+                    'id', 'description', Minor('amount'), 'category__name'
+                )[:self.max_samples]),
+                reverse=True
+            )[:self.max_samples]
+            _, descriptions, amounts, labels = zip(*rows)
+            return TextCategoryModel().fit(list(descriptions), minor_array(amounts) / MINOR_UNITS, list(labels))
+
+        return self.registry.get_or_train(
+            owner, self.model_type, fingerprint, train,
+            metrics=lambda model: {'classes': len(model.classifier.classes_)}
+        )
+
+    def _fingerprint(self, owner):
+        """Cheap summary of the training set; None when there is too little to train on"""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.fingerprints.get(owner)
+        if cached is not None and now - cached[0] < self.refresh_interval:
+            return cached[1]
+
+        sources = self._training_sources(owner)
+        stats = [
+            source.aggregate(
+                rows=Count('id'),
+                classes=Count('category', distinct=True),
+                last_id=Max('id'),
+                last_updated=Max('updated_at')
+            )
+            for source in sources
+        ]
+        rows = sum(source_stats['rows'] for source_stats in stats)
+        if len(sources) == 1:
+            classes = stats[0]['classes']
+        else:
+            classes = len({
+                category_id for source in sources
+                for category_id in source.order_by().values_list('category_id', flat=True).distinct()
+            })
+        if rows < self.min_samples or classes < 2:
+            fingerprint = None
+        else:
+            if owner is None:
+                categories = Category.objects.using(home_shard() if sharding_enabled() else None).filter(is_default=True)
+            else:
+                categories = Category.objects.visible_to(owner)
+            names = sorted(categories.values_list('id', 'name'))
+            # Category renames change labels without touching any transaction
+            fingerprint = hashlib.sha256(repr((stats, names, self.max_samples)).encode()).hexdigest()
+
+        with self.lock:
+            self.fingerprints[owner] = (now, fingerprint)
+        return fingerprint
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_category_classifier():
+    """The process-wide category classifier, sharing the model registry"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = CategoryClassifier(
+                    get_model_registry(),
+                    min_samples=settings.ML_CATEGORIZER_MIN_SAMPLES,
+                    max_samples=settings.ML_CATEGORIZER_MAX_SAMPLES,
+                    refresh_interval=settings.ML_CATEGORIZER_REFRESH_SECONDS
+                )
+    return _classifier
@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from smartfinance.instrumentation import current_profile
+from .worker import call_task, init_worker_process
+
+DEFAULT_ML_EXECUTOR = {
+    'BACKEND': 'thread',
+    'MAX_WORKERS': 4,
+    'MAX_PENDING': 32,
+}
+
+
+class ExecutorBusy(Exception):
+    """Every worker is busy and the backlog is full; the caller should retry later"""
+
+
+class BoundedExecutor:
+    """Thread or process pool for CPU-bound ML work that refuses work past a fixed backlog"""
+
+    def __init__(self, backend='thread', max_workers=4, max_pending=32):
+        if backend == 'thread':
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ml')
+        elif backend == 'process':
+            # Spawned (not forked) so no child inherits the server's DB connections
+            self.pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker_process
+            )
+        else:
+            raise ValueError(f"Unknown ML executor backend '{backend}'")
+        # Running plus queued tasks; the pool's own queue is unbounded
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    async def run(self, task, *args):
+        """Await `task(*args)` on the pool; raises ExecutorBusy instead of queueing without bound"""
+        if not self.slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        try:
+            future = self.pool.submit(call_task, task, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        result, stages = await asyncio.wrap_future(future)
+        profile = current_profile()
+        if profile is not None:
+            profile.merge_stages(stages)
+        return result
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_ml_executor():
+    """The process-wide ML executor configured by settings.ML_EXECUTOR"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = {**DEFAULT_ML_EXECUTOR, **getattr(settings, 'ML_EXECUTOR', {})}
+                _executor = BoundedExecutor(config['BACKEND'], config['MAX_WORKERS'], config['MAX_PENDING'])
+    return _executor
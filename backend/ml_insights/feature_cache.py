@@ -0,0 +1,194 @@
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from smartfinance.db_router import analytics_db
+from smartfinance.sharding import shard_groups, sharding_enabled, use_shard
+from transactions.categories import visible_categories
+from transactions.models import Transaction, TransactionRollup
+from transactions.rollups import rollups_enabled
+from transactions.versions import get_data_version, versions_shared
+from . import worker
+from .ml_engine import FinanceMLEngine
+
+DEFAULT_FEATURE_CACHE = {
+    'BACKEND': 'lru',
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 3600,
+}
+
+
+def estimate_size(features):
+    """Approximate in-memory size of a features dict in bytes"""
+    size = 0
+    for value in features.values():
+        if isinstance(value, pd.DataFrame):
+            size += int(value.memory_usage(deep=True).sum())
+        elif isinstance(value, pd.Series):
+            size += int(value.memory_usage(deep=True))
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+
+class LRUFeatureCache:
+    """In-process cache holding one features entry per user, evicted by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id, version):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, version, features):
+        size = estimate_size(features)
+        with self.lock:
+            previous = self.entries.pop(user_id, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            if size > self.max_bytes:
+                return
+            self.entries[user_id] = (version, features, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class DjangoFeatureCache:
+    """Features stored in a Django cache backend, shared between processes"""
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    def _key(self, user_id, version):
+        return f'ml-features:{user_id}:{version}'
+
+    def get(self, user_id, version):
+        return caches[self.alias].get(self._key(user_id, version))
+
+    def set(self, user_id, version, features):
+        caches[self.alias].set(self._key(user_id, version), features, self.timeout)
+
+    def clear(self):
+        pass
+
+
+_feature_cache = None
+_feature_cache_lock = threading.Lock()
+
+
+def get_feature_cache():
+    """The process-wide feature cache configured by settings.ML_FEATURE_CACHE"""
+    global _feature_cache
+    if _feature_cache is None:
+        with _feature_cache_lock:
+            if _feature_cache is None:
+                config = {**DEFAULT_FEATURE_CACHE, **getattr(settings, 'ML_FEATURE_CACHE', {})}
+                if config['BACKEND'] == 'django':
+                    _feature_cache = DjangoFeatureCache(config['CACHE_ALIAS'], config['TIMEOUT'])
+                elif config['BACKEND'] == 'lru':
+                    _feature_cache = LRUFeatureCache(config['MAX_BYTES'])
+                else:
+                    raise ValueError(f"Unknown ML feature cache backend '{config['BACKEND']}'")
+    return _feature_cache
+
+
+def fetch_user_columns(user):
+    """(source, columns): the raw columns a user's features are built from, in one query"""
+    ml_engine = FinanceMLEngine()
+    categories = visible_categories(user.pk)
+    db = analytics_db(user.pk)
+    if rollups_enabled():
+        return 'rollups', ml_engine.fetch_rollup_columns(TransactionRollup.objects.using(db).filter(user=user), categories)
+    return 'transactions', ml_engine.fetch_transaction_columns(
+        Transaction.objects.using(db).filter(user=user), categories
+    )
+
+
+def features_from_columns(source, columns):
+    ml_engine = FinanceMLEngine()
+    if source == 'rollups':
+        return ml_engine.features_from_rollup_columns(columns)
+    return ml_engine.features_from_transaction_columns(columns)
+
+
+def fetch_monthly_totals(user_ids=None):
+    """Monthly totals for FinanceMLEngine.predict_batch(), for the given or all users, one query per shard"""
+    if sharding_enabled():
+        columns = []
+        for alias, shard_user_ids in shard_groups(user_ids).items():
+            with use_shard(alias):
+                columns.append(_fetch_monthly_totals(shard_user_ids))
+        # Column-wise concatenation; predict_batch() groups rows by user itself
+        return [sum((tuple(shard[index]) for shard in columns), ()) for index in range(len(columns[0]))]
+    return _fetch_monthly_totals(user_ids)
+
+
+def _fetch_monthly_totals(user_ids):
+    ml_engine = FinanceMLEngine()
+    db = analytics_db(*(user_ids or ()))
+    if rollups_enabled():
+        rollups = TransactionRollup.objects.using(db)
+        if user_ids is not None:
+            rollups = rollups.filter(user_id__in=user_ids)
+        return ml_engine.fetch_monthly_totals_from_rollups(rollups)
+    transactions = Transaction.objects.using(db)
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=user_ids)
+    return ml_engine.fetch_monthly_totals(transactions)
+
+
+def build_user_features(user):
+    """Compute a user's ML features from rollups or raw transactions"""
+    return features_from_columns(*fetch_user_columns(user))
+
+
+def get_user_features(user):
+    """A user's ML features, rebuilt only after their transactions change"""
+    if not versions_shared():
+        # Writes in other processes wouldn't invalidate the entry
+        return build_user_features(user)
+    # Read the version before building: a write that lands mid-build bumps it,
+    # so the entry stored below is never served for the newer data
+    version = get_data_version(user.pk)
+    cache = get_feature_cache()
+    features = cache.get(user.pk, version)
+    if features is None:
+        features = build_user_features(user)
+        cache.set(user.pk, version, features)
+    return features
+
+
+async def aget_user_features(user, executor):
+    """get_user_features() for async views: the DB read runs off the event loop, the
+    DataFrame work on `executor`"""
+    if not versions_shared():
+        source, columns = await sync_to_async(fetch_user_columns)(user)
+        return await executor.run(worker.build_features, source, columns)
+    version = await sync_to_async(get_data_version)(user.pk)
+    cache = get_feature_cache()
+    features = await sync_to_async(cache.get)(user.pk, version)
+    if features is None:
+        source, columns = await sync_to_async(fetch_user_columns)(user)
+        features = await executor.run(worker.build_features, source, columns)
+        await sync_to_async(cache.set)(user.pk, version, features)
+    return features
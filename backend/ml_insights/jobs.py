@@ -0,0 +1,135 @@
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.versions import bump_data_version, bump_data_versions, get_data_version, versions_shared
+from .accumulators import get_accumulated_insights
+from .feature_cache import build_user_features, fetch_monthly_totals, get_user_features
+from .ml_engine import FinanceMLEngine
+from .models import MLJob, PrecomputedResult
+from .registry import get_model_registry
+
+
+def precompute_enabled():
+    # Stored results are matched to data versions the worker process must see too
+    return getattr(settings, 'ML_PRECOMPUTE', False) and versions_shared()
+
+
+def compute_results(user, features=None):
+    """Compute every precomputable ML response for a user"""
+    if features is None:
+        features = get_user_features(user)
+    ml_engine = FinanceMLEngine(registry=get_model_registry())
+    return {
+        'prediction': ml_engine.predict_from_features(features, user_id=user.pk),
+        'insights': get_accumulated_insights(user),
+    }
+
+
+def store_results(user_id, results, data_version):
+    computed_at = timezone.now()
+    for kind, payload in results.items():
+        PrecomputedResult.objects.update_or_create(
+            user_id=user_id,
+            kind=kind,
+            defaults={'payload': payload, 'data_version': data_version, 'computed_at': computed_at}
+        )
+    bump_data_version(user_id, 'ml')
+
+
+def store_batch_predictions(user_ids):
+    """Refresh many users' precomputed predictions from one grouped query, without a model fit each"""
+    # Versions first, as in run_job(), so no result is marked fresher than its inputs
+    versions = {user_id: get_data_version(user_id) for user_id in user_ids}
+    predictions = FinanceMLEngine().predict_batch(fetch_monthly_totals(user_ids), user_ids=user_ids)
+    computed_at = timezone.now()
+    PrecomputedResult.objects.bulk_create(
+        [
+            PrecomputedResult(
+                user_id=user_id, kind='prediction', payload=payload,
+                data_version=versions[user_id], computed_at=computed_at
+            )
+            for user_id, payload in predictions.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'kind'],
+        update_fields=['payload', 'data_version', 'computed_at']
+    )
+    bump_data_versions(user_ids, 'ml')
+    return len(predictions)
+
+
+def enqueue_precompute(user_id):
+    """Queue a refresh for a user unless one is already pending"""
+    try:
+        with transaction.atomic():
+            MLJob.objects.create(user_id=user_id)
+    except IntegrityError:
+        pass
+
+
+def get_result(user, kind):
+    """The latest precomputed response with freshness info, or None while the first one is computed
+
+    Misses and stale results queue a refresh for ml_worker; the request
+    never runs the models itself.
+    """
+    version = get_data_version(user.pk)
+    result = PrecomputedResult.objects.filter(user=user, kind=kind).first()
+
+    if result is None or result.data_version != version:
+        # Serve what we have, if anything, and let the worker catch up
+        enqueue_precompute(user.pk)
+    if result is None:
+        return None
+
+    return {
+        **result.payload,
+        'computed_at': result.computed_at,
+        'is_stale': result.data_version != version,
+    }
+
+
+def claim_jobs(limit):
+    """Atomically move up to `limit` pending jobs to running and return their ids"""
+    claimed = []
+    for job_id in MLJob.objects.filter(status='pending').values_list('id', flat=True)[:limit]:
+        if MLJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now()):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs(timeout):
+    """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    requeued = 0
+    for job in MLJob.objects.filter(status='running', started_at__lt=cutoff):
+        try:
+            with transaction.atomic():
+                MLJob.objects.filter(pk=job.pk).update(status='pending', started_at=None)
+            requeued += 1
+        except IntegrityError:
+            # A newer pending job for the user already covers it
+            job.delete()
+    return requeued
+
+
+def run_job(job_id):
+    """Execute one claimed job; runs inside a worker process"""
+    job = MLJob.objects.select_related('user').get(pk=job_id)
+    try:
+        # Read the version first so results are never marked fresher than their inputs
+        version = get_data_version(job.user_id)
+        with use_shard(shard_for_user(job.user)):
+            results = compute_results(job.user, build_user_features(job.user))
+        store_results(job.user_id, results, version)
+    except Exception:
+        MLJob.objects.filter(pk=job_id).update(
+            status='failed', error=traceback.format_exc(), finished_at=timezone.now()
+        )
+        return False
+    # The result row is the record of success; the queue entry is no longer needed
+    MLJob.objects.filter(pk=job_id).delete()
+    return True
@@ -0,0 +1,47 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from django.core.management.base import BaseCommand
+from django.db import connections
+from ml_insights.jobs import claim_jobs, requeue_stale_jobs
+from ml_insights.worker import init_worker_process, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued ML precomputation jobs with a local process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs that have been running longer than this many seconds')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        # Spawned (not forked) workers so no process inherits this one's DB connections
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        running = {}
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                 initializer=init_worker_process) as pool:
+            while True:
+                for job_id in claim_jobs(processes - len(running)):
+                    running[pool.submit(run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    ok = future.exception() is None and future.result()
+                    status = 'done' if ok else 'failed'
+                    self.stdout.write(f"Job {job_id} {status}")
@@ -0,0 +1,29 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from ml_insights.jobs import store_batch_predictions
+
+
+class Command(BaseCommand):
+    help = 'Recompute precomputed expense predictions for many users with batch scoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (can be repeated)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Users scored per query')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if user_ids is None:
+            user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        user_ids = list(user_ids)
+
+        started = time.monotonic()
+        refreshed = 0
+        batch_size = options['batch_size']
+        for offset in range(0, len(user_ids), batch_size):
+            refreshed += store_batch_predictions(user_ids[offset:offset + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {refreshed} predictions in {time.monotonic() - started:.1f}s"
+        ))
@@ -1,79 +1,202 @@
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
 from datetime import datetime, timedelta
-import joblib
-import os
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import CharField, Count, F, Q, Sum
+from django.db.models.functions import Cast, Coalesce, TruncMonth
+from smartfinance.instrumentation import stage
+from smartfinance.money import MINOR_UNITS, Minor, minor_array
+from .categorizer import CategoryClassifier
+from .registry import fingerprint_arrays
+
+INSUFFICIENT_DATA = {
+    'prediction': 0,
+    'confidence': 'low',
+    'message': 'Insufficient data for prediction'
+}
+
+INSUFFICIENT_EXPENSES = {
+    'prediction': 0,
+    'confidence': 'low',
+    'message': 'Insufficient expense data'
+}
+
+
+def confidence_for_score(score):
+    """Confidence label for a trend line's R² score"""
+    return 'high' if score > 0.7 else 'medium' if score > 0.4 else 'low'
+
+
+def average_prediction(amount):
+    return {
+        'prediction': float(amount),
+        'confidence': 'medium',
+        'message': 'Prediction based on historical average'
+    }
 
 
 class FinanceMLEngine:
-    def __init__(self):
+    def __init__(self, registry=None, categorizer=None):
         self.expense_predictor = None
-        self.category_predictor = None
+        self.registry = registry
+        self.categorizer = categorizer or CategoryClassifier(registry)
 
     def prepare_transaction_data(self, transactions):
-        """Convert transactions to DataFrame"""
-        data = []
-        for trans in transactions:
-            data.append({
-                'amount': float(trans.amount),
-                'type': trans.type,
-                'category': trans.category.name if trans.category else 'Uncategorized',
-                'date': trans.date,
-                'day_of_week': trans.date.weekday(),
-                'day_of_month': trans.date.day,
-                'month': trans.date.month,
-            })
-        return pd.DataFrame(data)
+        """Load a transaction queryset into a typed DataFrame with one query; amounts in minor units"""
+        return self._build_frame(*self.fetch_transaction_columns(transactions))
+
+    def fetch_transaction_columns(self, transactions, categories=None):
+        """(amounts, types, categories, dates) columns for a transaction queryset
+
+        Amounts are an int64 array of minor units, the rest tuples. Category
+        names come from `categories`, the owner's UserCategories, when given,
+        and from a join otherwise.
+        """
+        columns = self._fetch_columns(transactions, {
+            'amount': Minor('amount'),
+            'type': F('type'),
+            'category': F('category__name' if categories is None else 'category_id'),
+            'date': Cast('date', CharField()),
+        })
+        columns[0] = minor_array(columns[0])
+        return self._name_categories(columns, 2, categories)
+
+    def fetch_rollup_columns(self, rollups, categories=None):
+        """(dates, types, categories, totals, counts) columns for daily rollup rows; totals as fetch_transaction_columns()"""
+        columns = self._fetch_columns(rollups.filter(granularity='day'), {
+            'period': Cast('period', CharField()),
+            'type': F('type'),
+            'category': F('category__name' if categories is None else 'category_id'),
+            'total': Minor('total'),
+            'count': F('count'),
+        })
+        columns[3] = minor_array(columns[3])
+        return self._name_categories(columns, 2, categories)
+
+    def _name_categories(self, columns, index, categories):
+        if categories is not None and columns[index]:
+            columns[index] = tuple(categories.names(columns[index]))
+        return columns
+
+    @stage('ml.load')
+    def _fetch_columns(self, queryset, expressions):
+        """Run a queryset's SQL on the raw cursor and return one tuple per column"""
+        # Amounts are read as integer minor units and dates cast to ISO text in SQL so
+        # no per-row Python converters run; ordering is dropped because callers group anyway
+        annotations = {f'col_{name}': expression for name, expression in expressions.items()}
+        queryset = queryset.order_by().annotate(**annotations).values_list(*annotations)
+        try:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            rows = []
+        else:
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+        if not rows:
+            return [()] * len(expressions)
+        return list(zip(*rows))
+
+    @stage('ml.frame')
+    def _build_frame(self, amounts, types, categories, dates):
+        """Assemble the feature frame and derive date features with vectorized ops
+
+        'amount' stays int64 minor units, so the group sums are exact integer adds.
+        """
+        df = pd.DataFrame({
+            'amount': minor_array(amounts),
+            'type': np.array(types, dtype=object),
+            'category': np.array(categories, dtype=object),
+            'date': pd.to_datetime(np.array(dates, dtype='datetime64[D]')),
+        })
+        df['category'] = df['category'].fillna('Uncategorized')
+        df['day_of_week'] = df['date'].dt.weekday
+        df['day_of_month'] = df['date'].dt.day
+        df['month'] = df['date'].dt.month
+        return df
+
+    def build_features(self, transactions):
+        """Aggregate a transaction queryset into the features used by predictions and insights"""
+        return self.features_from_transaction_columns(self.fetch_transaction_columns(transactions))
+
+    def build_features_from_rollups(self, rollups):
+        """Aggregate a user's daily TransactionRollup rows into the same features"""
+        return self.features_from_rollup_columns(self.fetch_rollup_columns(rollups))
+
+    def features_from_transaction_columns(self, columns):
+        """CPU-only half of build_features(); needs no database access"""
+        df = self._build_frame(*columns)
+        df['count'] = 1
+        return self._features_from_frame(df)
+
+    def features_from_rollup_columns(self, columns):
+        """CPU-only half of build_features_from_rollups(); needs no database access"""
+        dates, types, categories, totals, counts = columns
+        df = self._build_frame(totals, types, categories, dates)
+        df['count'] = np.array(counts, dtype=np.int64)
+        return self._features_from_frame(df)
+
+    @stage('ml.frame')
+    def _features_from_frame(self, df):
+        """Reduce a frame whose rows each stand for `count` transactions; amounts come out in major units"""
+        expense_df = df[df['type'] == 'expense']
+
+        # Group by month on the integer-backed period, then format only the group keys
+        monthly = expense_df.groupby(expense_df['date'].dt.to_period('M'))['amount'].sum()
+        weekday = expense_df.groupby('day_of_week')[['amount', 'count']].sum()
+
+        return {
+            'frame': df,
+            'transaction_count': int(df['count'].sum()),
+            'expense_count': int(expense_df['count'].sum()),
+            'monthly_expenses': pd.DataFrame({
+                'year_month': monthly.index.strftime('%Y-%m'),
+                'amount': monthly.values / MINOR_UNITS,
+            }),
+            'category_totals': expense_df.groupby('category')['amount'].sum() / MINOR_UNITS,
+            'day_of_week_avg': weekday['amount'] / MINOR_UNITS / weekday['count'],
+            'daily_expenses': expense_df.groupby('date')['amount'].sum() / MINOR_UNITS,
+        }
 
     def predict_next_month_expenses(self, transactions):
         """Predict next month's expenses using linear regression"""
-        if len(transactions) < 10:
-            return {
-                'prediction': 0,
-                'confidence': 'low',
-                'message': 'Insufficient data for prediction'
-            }
+        return self.predict_from_features(self.build_features(transactions))
 
-        df = self.prepare_transaction_data(transactions)
-        expense_df = df[df['type'] == 'expense'].copy()
+    def predict_next_month_expenses_from_rollups(self, rollups):
+        """Predict next month's expenses from a user's TransactionRollup rows"""
+        return self.predict_from_features(self.build_features_from_rollups(rollups))
 
-        if len(expense_df) < 5:
-            return {
-                'prediction': 0,
-                'confidence': 'low',
-                'message': 'Insufficient expense data'
-            }
+    def predict_from_features(self, features, user_id=None):
+        """Predict next month's expenses from prepared features"""
+        if features['transaction_count'] < 10:
+            return dict(INSUFFICIENT_DATA)
+
+        if features['expense_count'] < 5:
+            return dict(INSUFFICIENT_EXPENSES)
 
-        # Group by month
-        expense_df['year_month'] = expense_df['date'].apply(lambda x: x.strftime('%Y-%m'))
-        monthly_expenses = expense_df.groupby('year_month')['amount'].sum().reset_index()
+        monthly_expenses = features['monthly_expenses'].copy()
         monthly_expenses['month_index'] = range(len(monthly_expenses))
 
         if len(monthly_expenses) < 3:
-            avg_expense = monthly_expenses['amount'].mean()
-            return {
-                'prediction': float(avg_expense),
-                'confidence': 'medium',
-                'message': 'Prediction based on historical average'
-            }
+            return average_prediction(monthly_expenses['amount'].mean())
 
         # Train model
         X = monthly_expenses[['month_index']].values
         y = monthly_expenses['amount'].values
 
-        model = LinearRegression()
-        model.fit(X, y)
+        model = self._expense_model(X, y, user_id)
+        self.expense_predictor = model
 
         # Predict next month
         next_month_index = len(monthly_expenses)
-        prediction = model.predict([[next_month_index]])[0]
+        with stage('ml.predict'):
+            prediction = model.predict([[next_month_index]])[0]
 
-        # Calculate confidence based on R² score
-        score = model.score(X, y)
-        confidence = 'high' if score > 0.7 else 'medium' if score > 0.4 else 'low'
+            # Calculate confidence based on R² score
+            score = model.score(X, y)
+        confidence = confidence_for_score(score)
 
         return {
             'prediction': float(max(0, prediction)),
@@ -85,22 +208,168 @@ class FinanceMLEngine:
             ]
         }
 
+    def fetch_monthly_totals(self, transactions):
+        """(user ids, months, expense totals, expense counts, transaction counts), one row per user and month
+
+        Expense totals are an int64 array of minor units, the rest tuples.
+        """
+        return self._fetch_monthly(transactions.annotate(month=TruncMonth('date')), 'month', 'amount', Count, 'id')
+
+    def fetch_monthly_totals_from_rollups(self, rollups):
+        """fetch_monthly_totals() read from monthly TransactionRollup rows"""
+        return self._fetch_monthly(rollups.filter(granularity='month'), 'period', 'total', Sum, 'count')
+
+    def _fetch_monthly(self, queryset, month_field, amount_field, count_aggregate, count_field):
+        # Transactions are counted, rollups carry their own counts to sum
+        expense = Q(type='expense')
+        columns = self._fetch_columns(queryset.values('user_id', month_field), {
+            'user': F('user_id'),
+            'month': Cast(month_field, CharField()),
+            'expense': Coalesce(Minor(Sum(amount_field, filter=expense)), 0),
+            'expense_count': Coalesce(count_aggregate(count_field, filter=expense), 0),
+            'count': count_aggregate(count_field),
+        })
+        columns[2] = minor_array(columns[2])
+        return columns
+
+    @stage('ml.predict')
+    def predict_batch(self, monthly_totals, user_ids=()):
+        """Predict next month's expenses for many users at once
+
+        Takes fetch_monthly_totals() columns and returns {user id: the dict
+        predict_from_features() would}. Every user's trend line and R² is solved
+        in closed form with segmented sums over a user-indexed array rather than
+        a LinearRegression per user. A flat history counts as a perfect fit.
+        `user_ids` without any rows get the insufficient-data response.
+        """
+        users, months, expenses, expense_counts, counts = monthly_totals
+        users = np.array(users, dtype=np.int64)
+        # 'YYYY-MM-DD' text truncated to the month label
+        months = np.array(months, dtype='U7')
+        expenses = minor_array(expenses) / MINOR_UNITS
+        expense_counts = np.array(expense_counts, dtype=np.int64)
+        counts = np.array(counts, dtype=np.int64)
+
+        order = np.lexsort((months, users))
+        owners, owner_index = np.unique(users[order], return_inverse=True)
+        size = len(owners)
+        transaction_count = np.bincount(owner_index, weights=counts[order], minlength=size)
+        expense_count = np.bincount(owner_index, weights=expense_counts[order], minlength=size)
+
+        # Each user's series is their months with any expenses, indexed 0..n-1 in order
+        in_series = expense_counts[order] > 0
+        group = owner_index[in_series]
+        y = expenses[order][in_series]
+        labels = months[order][in_series]
+        n = np.bincount(group, minlength=size)
+        starts = np.cumsum(n) - n
+        x = np.arange(len(group)) - starts[group]
+
+        # Least squares on deviations from each user's means, for precision
+        x_mean = (n - 1) / 2
+        y_mean = np.bincount(group, weights=y, minlength=size) / np.maximum(n, 1)
+        dx = x - x_mean[group]
+        dy = y - y_mean[group]
+        sxx = n * (n * n - 1) / 12
+        sxy = np.bincount(group, weights=dx * dy, minlength=size)
+        syy = np.bincount(group, weights=dy * dy, minlength=size)
+        flat = syy <= 1e-12 * np.bincount(group, weights=y * y, minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(sxx > 0, sxy / sxx, 0.0)
+            score = np.where(flat, 1.0, slope * sxy / syy)
+        prediction = np.maximum(y_mean + slope * (n - x_mean), 0)
+
+        # Plain lists from here: indexing numpy arrays one scalar at a time is slow
+        labels, amounts = labels.tolist(), y.tolist()
+        results = {}
+        for user_id, transactions, expense_transactions, months_seen, start, mean, predicted, fit in zip(
+            owners.tolist(), transaction_count.tolist(), expense_count.tolist(), n.tolist(),
+            starts.tolist(), y_mean.tolist(), prediction.tolist(), score.tolist()
+        ):
+            if transactions < 10:
+                results[user_id] = dict(INSUFFICIENT_DATA)
+            elif expense_transactions < 5:
+                results[user_id] = dict(INSUFFICIENT_EXPENSES)
+            elif months_seen < 3:
+                results[user_id] = average_prediction(mean)
+            else:
+                end = start + months_seen
+                results[user_id] = {
+                    'prediction': predicted,
+                    'confidence': confidence_for_score(fit),
+                    'score': fit,
+                    'historical_data': [
+                        {'month': month, 'amount': amount}
+                        for month, amount in zip(labels[start:end], amounts[start:end])
+                    ]
+                }
+
+        for user_id in user_ids:
+            results.setdefault(user_id, dict(INSUFFICIENT_DATA))
+        return results
+
+    @stage('ml.fit')
+    def _expense_model(self, X, y, user_id):
+        """Fit the trend model, or reuse the persisted one when the training data is unchanged"""
+        def train():
+            return LinearRegression().fit(X, y)
+
+        if self.registry is None or user_id is None:
+            return train()
+        return self.registry.get_or_train(
+            user_id, 'expense_trend', fingerprint_arrays(X, y), train,
+            metrics=lambda model: {'r2': float(model.score(X, y)), 'months': len(y)}
+        )
+
     def get_spending_insights(self, transactions):
         """Generate insights from transaction data"""
-        if not transactions:
+        return self.insights_from_features(self.build_features(transactions))
+
+    def get_spending_insights_from_rollups(self, rollups):
+        """Generate insights from a user's TransactionRollup rows"""
+        return self.insights_from_features(self.build_features_from_rollups(rollups))
+
+    def insights_from_features(self, features):
+        """Generate insights from prepared features"""
+        trend = None
+        if features['transaction_count'] > 30:
+            daily_expenses = features['daily_expenses']
+            today = pd.Timestamp(datetime.now().date())
+            recent_start = today - timedelta(days=30)
+            previous_start = today - timedelta(days=60)
+
+            recent_expense = daily_expenses[daily_expenses.index >= recent_start].sum()
+            previous_expense = daily_expenses[(daily_expenses.index >= previous_start) &
+                                              (daily_expenses.index < recent_start)].sum()
+            trend = (recent_expense, previous_expense)
+
+        return self.insights_from_statistics(
+            features['transaction_count'],
+            features['expense_count'],
+            features['category_totals'],
+            features['day_of_week_avg'],
+            trend
+        )
+
+    def insights_from_statistics(self, transaction_count, expense_count, category_totals, day_of_week_avg, trend):
+        """Generate insights from summary statistics
+
+        `category_totals` and `day_of_week_avg` are expense Series indexed by
+        category name and weekday; `trend` is (last 30 days, the 30 before)
+        expense totals, only needed with more than 30 transactions.
+        """
+        if transaction_count == 0:
             return {
                 'insights': [],
                 'message': 'No transactions available for analysis'
             }
 
-        df = self.prepare_transaction_data(transactions)
         insights = []
 
         # Top spending categories
-        expense_df = df[df['type'] == 'expense']
-        if len(expense_df) > 0:
-            top_categories = expense_df.groupby('category')['amount'].sum().sort_values(ascending=False).head(3)
-            total_expenses = expense_df['amount'].sum()
+        if expense_count > 0:
+            top_categories = category_totals.sort_values(ascending=False).head(3)
+            total_expenses = category_totals.sum()
 
             for category, amount in top_categories.items():
                 percentage = (amount / total_expenses) * 100
@@ -113,8 +382,8 @@ class FinanceMLEngine:
                 })
 
         # Day of week analysis
-        if len(expense_df) > 7:
-            daily_avg = expense_df.groupby('day_of_week')['amount'].mean()
+        if expense_count > 7:
+            daily_avg = day_of_week_avg
             max_day = daily_avg.idxmax()
             days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
@@ -126,13 +395,8 @@ class FinanceMLEngine:
             })
 
         # Trend analysis
-        if len(df) > 30:
-            recent_30 = df[df['date'] >= (datetime.now().date() - timedelta(days=30))]
-            previous_30 = df[(df['date'] >= (datetime.now().date() - timedelta(days=60))) &
-                           (df['date'] < (datetime.now().date() - timedelta(days=30)))]
-
-            recent_expense = recent_30[recent_30['type'] == 'expense']['amount'].sum()
-            previous_expense = previous_30[previous_30['type'] == 'expense']['amount'].sum()
+        if transaction_count > 30:
+            recent_expense, previous_expense = trend
 
             if previous_expense > 0:
                 change = ((recent_expense - previous_expense) / previous_expense) * 100
@@ -148,31 +412,13 @@ class FinanceMLEngine:
 
         return {
             'insights': insights,
-            'total_analyzed': len(df)
+            'total_analyzed': transaction_count
         }
 
-    def predict_category(self, amount, description):
+    def predict_category(self, amount, description, user_id=None):
         """Predict transaction category based on amount and description"""
-        # Simple rule-based prediction (can be enhanced with ML)
-        categories = {
-            'food': ['food', 'restaurant', 'grocery', 'lunch', 'dinner', 'breakfast'],
-            'transport': ['uber', 'taxi', 'gas', 'fuel', 'transport', 'parking'],
-            'entertainment': ['movie', 'game', 'netflix', 'spotify', 'entertainment'],
-            'shopping': ['amazon', 'shop', 'store', 'mall', 'clothing'],
-            'utilities': ['electric', 'water', 'internet', 'phone', 'utility'],
-            'health': ['doctor', 'hospital', 'pharmacy', 'medical', 'health'],
-        }
+        return self.predict_categories([description], [amount], user_id=user_id)[0]
 
-        description_lower = description.lower()
-
-        for category, keywords in categories.items():
-            if any(keyword in description_lower for keyword in keywords):
-                return {
-                    'predicted_category': category,
-                    'confidence': 0.8
-                }
-
-        return {
-            'predicted_category': 'other',
-            'confidence': 0.3
-        }
+    def predict_categories(self, descriptions, amounts, user_id=None):
+        """Predict categories for many transactions in one batch"""
+        return self.categorizer.classify(descriptions, amounts, user_id=user_id)
@@ -1,4 +1,104 @@
 from django.db import models
+from django.contrib.auth import get_user_model
 
-# ML models will use external storage (pickle files)
-# This is just a placeholder for Django app structure
+User = get_user_model()
+
+
+class TrainedModel(models.Model):
+    """Metadata for a fitted model whose artifact is stored on disk with joblib"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trained_models', null=True, blank=True)
+    model_type = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)
+    artifact = models.CharField(max_length=255)
+    metrics = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'model_type', 'fingerprint'], name='unique_trained_model'),
+        ]
+        indexes = [
+            models.Index(fields=['last_used_at'], name='trained_model_last_used_idx'),
+        ]
+
+    def __str__(self):
+        owner = self.user_id or 'global'
+        return f"{owner} - {self.model_type} - {self.fingerprint[:12]}"
+
+
+class MLJob(models.Model):
+    """Queued precomputation of a user's predictions and insights"""
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ml_jobs')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        constraints = [
+            # At most one queued job per user; later writes fold into it
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='pending'),
+                                    name='unique_pending_ml_job'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ml_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.status}"
+
+
+class PrecomputedResult(models.Model):
+    """Latest background-computed ML response for a user"""
+    KINDS = (
+        ('prediction', 'Prediction'),
+        ('insights', 'Insights'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ml_results')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    payload = models.JSONField()
+    data_version = models.BigIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_precomputed_result'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.kind} @ {self.computed_at}"
+
+
+class InsightAccumulator(models.Model):
+    """Running per-user statistics behind spending insights, updated on every transaction write
+
+    Amounts are integer cents. Daily expense totals for the rolling trend
+    windows live in a fixed ring of (day ordinal, cents) slots; transactions
+    dated after the day they were written go to `future_days` instead.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='insight_accumulator')
+    transaction_count = models.IntegerField(default=0)
+    expense_count = models.IntegerField(default=0)
+    # {category id ('' for none): [cents, count]}
+    categories = models.JSONField(default=dict)
+    # [[cents, count]] per weekday, Monday first
+    weekdays = models.JSONField(default=list)
+    ring_days = models.JSONField(default=list)
+    ring_totals = models.JSONField(default=list)
+    # {day ordinal: cents}
+    future_days = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.transaction_count} transactions"
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from .models import TrainedModel
+
+
+def fingerprint_arrays(*arrays):
+    """Stable hash of the training data a model was fitted on"""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.dtype.str, array.shape)).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Per-user joblib model artifacts with TrainedModel metadata and an LRU of loaded models"""
+
+    def __init__(self, model_dir, max_loaded=128, max_artifacts=1000):
+        self.model_dir = Path(model_dir)
+        self.max_loaded = max_loaded
+        self.max_artifacts = max_artifacts
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_train(self, user_id, model_type, fingerprint, train, metrics=None):
+        """Return the model fitted on this fingerprint, training and persisting it on a miss"""
+        key = (user_id, model_type, fingerprint)
+        with self.lock:
+            if key in self.loaded:
+                self.loaded.move_to_end(key)
+                return self.loaded[key]
+
+        model = self._load(user_id, model_type, fingerprint)
+        if model is None:
+            model = train()
+            self._save(user_id, model_type, fingerprint, model, metrics(model) if metrics else {})
+
+        with self.lock:
+            self.loaded[key] = model
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+        return model
+
+    def _artifact_path(self, user_id, model_type, fingerprint):
+        owner = str(user_id) if user_id is not None else 'global'
+        return Path(owner) / f'{model_type}-{fingerprint[:32]}.joblib'
+
+    def _load(self, user_id, model_type, fingerprint):
+        record = TrainedModel.objects.filter(
+            user_id=user_id, model_type=model_type, fingerprint=fingerprint
+        ).first()
+        if record is None:
+            return None
+
+        try:
+            model = joblib.load(self.model_dir / record.artifact)
+        except (OSError, EOFError, ValueError):
+            # Artifact missing or unreadable: drop the record and retrain
+            record.delete()
+            return None
+
+        TrainedModel.objects.filter(pk=record.pk).update(last_used_at=timezone.now())
+        return model
+
+    def _save(self, user_id, model_type, fingerprint, model, metrics):
+        artifact = self._artifact_path(user_id, model_type, fingerprint)
+        path = self.model_dir / artifact
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial artifact
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        joblib.dump(model, temp_path)
+        os.replace(temp_path, path)
+
+        try:
+            TrainedModel.objects.create(
+                user_id=user_id,
+                model_type=model_type,
+                fingerprint=fingerprint,
+                artifact=str(artifact),
+                metrics=metrics
+            )
+        except IntegrityError:
+            # Another worker registered the same model concurrently
+            return
+        self.prune()
+
+    def prune(self):
+        """Delete the least recently used artifacts beyond max_artifacts"""
+        stale = TrainedModel.objects.order_by('-last_used_at', '-pk')[self.max_artifacts:]
+        for record in list(stale):
+            try:
+                os.remove(self.model_dir / record.artifact)
+            except FileNotFoundError:
+                pass
+            record.delete()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """The process-wide model registry configured from settings"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(
+                    settings.ML_MODEL_DIR,
+                    max_loaded=settings.ML_MODEL_CACHE_SIZE,
+                    max_artifacts=settings.ML_MODEL_MAX_ARTIFACTS
+                )
+    return _registry
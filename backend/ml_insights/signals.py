@@ -0,0 +1,63 @@
+from django.db import router, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from smartfinance.sharding import on_instance_shard
+from transactions.bulk import row_signals_suppressed, transactions_bulk_changed
+from transactions.models import Category, Transaction
+from transactions.rollups import transaction_state
+from . import accumulators
+from .jobs import enqueue_precompute, precompute_enabled
+
+
+@receiver(post_save, sender=Transaction)
+@on_instance_shard
+def accumulate_on_save(sender, instance, raw=False, **kwargs):
+    if raw or row_signals_suppressed():
+        return
+    # Captured by the rollup pre_save receiver; None for new rows
+    previous = getattr(instance, '_previous_state', None)
+    current = transaction_state(instance)
+    if previous != current:
+        accumulators.apply_changes(added=[current], removed=[previous] if previous is not None else [])
+
+
+@receiver(post_delete, sender=Transaction)
+@on_instance_shard
+def accumulate_on_delete(sender, instance, **kwargs):
+    if row_signals_suppressed():
+        return
+    accumulators.apply_changes(removed=[transaction_state(instance)])
+
+
+@receiver(transactions_bulk_changed, sender=Transaction)
+def accumulate_on_bulk_change(sender, added=(), removed=(), **kwargs):
+    accumulators.apply_changes(added=added, removed=removed)
+
+
+@receiver(post_delete, sender=Category)
+@on_instance_shard
+def uncategorize_accumulated_totals(sender, instance, **kwargs):
+    # Its transactions were set to no category with an UPDATE that sends no signals
+    accumulators.merge_category(instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def queue_precompute_on_transaction_change(sender, instance, raw=False, using=None, **kwargs):
+    if raw or row_signals_suppressed() or not precompute_enabled():
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: enqueue_precompute(user_id), using=using)
+
+
+@receiver(transactions_bulk_changed, sender=Transaction)
+def queue_precompute_on_bulk_change(sender, user_ids, **kwargs):
+    if not precompute_enabled():
+        return
+    user_ids = list(user_ids)
+
+    def enqueue_all():
+        for user_id in user_ids:
+            enqueue_precompute(user_id)
+
+    transaction.on_commit(enqueue_all, using=router.db_for_write(Transaction))
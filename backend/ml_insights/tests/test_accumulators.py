@@ -0,0 +1,140 @@
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.models import Category, Transaction
+from transactions.tests.helpers import FreshCacheMixin, create_user
+from ml_insights.accumulators import RING_DAYS, get_accumulated_insights
+from ml_insights.ml_engine import FinanceMLEngine
+from ml_insights.models import InsightAccumulator
+
+START = date(2024, 3, 1)
+
+
+class FrozenDatetime(datetime):
+    today_value = START
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.combine(cls.today_value, datetime.min.time(), tz)
+
+
+class AccumulatorTests(FreshCacheMixin, TestCase):
+    """Insights from the running accumulators must equal a full recompute from the transactions"""
+    databases = '__all__'
+
+    def setUp(self):
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        for module in ('accumulators', 'ml_engine'):
+            stack.enter_context(mock.patch(f'ml_insights.{module}.datetime', FrozenDatetime))
+        self.set_today(START)
+
+        self.user = create_user('accumulated')
+        stack.enter_context(use_shard(shard_for_user(self.user)))
+        self.food = Category.objects.create(name='Food', type='expense', is_default=True)
+        self.rent = Category.objects.create(name='Rent', type='expense', user=self.user)
+        self.fun = Category.objects.create(name='Fun', type='expense', user=self.user)
+
+    def set_today(self, day):
+        FrozenDatetime.today_value = day
+
+    def add(self, days_ago, amount, category=None, kind='expense'):
+        today = FrozenDatetime.today_value
+        return Transaction.objects.create(user=self.user, type=kind, amount=Decimal(amount), category=category,
+                                          date=today - timedelta(days=days_ago))
+
+    def assert_matches_full_recompute(self):
+        accumulated = get_accumulated_insights(self.user)
+        full = FinanceMLEngine().get_spending_insights(Transaction.objects.filter(user=self.user))
+        self.assert_same(accumulated, full)
+        return accumulated
+
+    def assert_same(self, first, second, path='insights'):
+        # Sums of cents and sums of floats may differ in the last bits
+        if isinstance(first, float):
+            self.assertAlmostEqual(first, second, places=9, msg=path)
+        elif isinstance(first, dict):
+            self.assertEqual(first.keys(), second.keys(), path)
+            for key in first:
+                self.assert_same(first[key], second[key], f'{path}.{key}')
+        elif isinstance(first, list):
+            self.assertEqual(len(first), len(second), path)
+            for index, (left, right) in enumerate(zip(first, second)):
+                self.assert_same(left, right, f'{path}[{index}]')
+        else:
+            self.assertEqual(first, second, path)
+
+    def seed(self):
+        # Amounts differ per category so the top three have no ties to order
+        for index in range(45):
+            category = (self.food, self.rent, self.fun, None)[index % 4]
+            self.add(index * 2 % 70, f'{10 + index * 3.17:.2f}', category)
+        for index in range(5):
+            self.add(index * 9, '1500.00', kind='income')
+        # Dated ahead of today
+        self.add(-3, '42.42', self.fun)
+
+    def test_built_accumulator_matches(self):
+        self.seed()
+        insights = self.assert_matches_full_recompute()
+        self.assertEqual({insight['type'] for insight in insights['insights']},
+                         {'category_spending', 'spending_pattern', 'trend'})
+        self.assertTrue(InsightAccumulator.objects.filter(user=self.user).exists())
+
+    def test_signal_updates_match(self):
+        self.seed()
+        # Built now; every step below reaches it through the transaction signals
+        self.assert_matches_full_recompute()
+        created = self.add(1, '77.70', self.food)
+
+        def update(**changes):
+            for field, value in changes.items():
+                setattr(created, field, value)
+            created.save()
+
+        steps = [
+            ('update amount', lambda: update(amount=Decimal('12.34'))),
+            ('recategorize', lambda: update(category=self.rent)),
+            ('move to the previous window', lambda: update(date=FrozenDatetime.today_value - timedelta(days=45))),
+            ('expense to income', lambda: update(type='income')),
+            ('delete', lambda: Transaction.objects.filter(user=self.user, category=self.fun).first().delete()),
+            ('delete the updated one', created.delete),
+            ('delete a category', self.fun.delete),
+            ('delete a category with rows from the signals', lambda: (self.add(5, '3.00', self.rent),
+                                                                      self.rent.delete())),
+        ]
+        for name, step in steps:
+            with self.subTest(name):
+                step()
+                self.assert_matches_full_recompute()
+
+    def test_rolling_past_the_ring(self):
+        self.seed()
+        self.assert_matches_full_recompute()
+
+        # Days move through the trend windows and out of the ring, the future day into the past
+        for shift in (1, 5, 31, RING_DAYS - 1, RING_DAYS + 10, 3 * RING_DAYS):
+            with self.subTest(days_later=shift):
+                self.set_today(START + timedelta(days=shift))
+                self.assert_matches_full_recompute()
+                # Writes made on the later day land in slots that held expired days
+                self.add(0, '9.99', self.food)
+                self.add(35, '19.99', self.rent)
+                self.add(-2, '4.44')
+                self.assert_matches_full_recompute()
+
+    def test_updates_after_rolling(self):
+        self.seed()
+        self.assert_matches_full_recompute()
+        old = Transaction.objects.filter(user=self.user, type='expense').order_by('date').first()
+
+        self.set_today(START + timedelta(days=RING_DAYS + 7))
+        recent = self.add(3, '55.00', self.fun)
+        # An expired day is removed and a current one moved back into the previous window
+        old.delete()
+        recent.date = FrozenDatetime.today_value - timedelta(days=40)
+        recent.save()
+        self.assert_matches_full_recompute()
@@ -0,0 +1,75 @@
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.models import Transaction
+from transactions.tests.helpers import FreshCacheMixin, create_user
+from ml_insights.feature_cache import fetch_monthly_totals
+from ml_insights.ml_engine import FinanceMLEngine
+
+# (month, expense amounts, income amounts) per user
+HISTORIES = {
+    'trend': [(1, ['100.10', '20.05', '3.00'], ['2500']), (2, ['140.00', '35.50'], []),
+              (3, ['90.00', '61.99', '7.25'], ['2500']), (5, ['210.00'], ['10.00']), (6, ['180.40', '0.01'], [])],
+    # Months without expenses are left out of the series, not counted as zero
+    'gaps': [(1, ['50.00', '60.00'], []), (2, [], ['900', '900', '900']), (3, ['75.00', '25.00'], []),
+             (4, [], ['100']), (7, ['10.00', '5.00'], [])],
+    'one-month': [(3, ['12.00', '13.00', '14.00', '15.00', '16.00', '17.00'], ['1', '2', '3', '4'])],
+    'two-months': [(1, ['30.00', '30.00', '30.00'], ['5', '5']), (2, ['45.00', '45.00', '45.00'], ['5', '5'])],
+    'flat': [(month, ['40.00', '60.00'], ['500']) for month in (1, 2, 3, 4)],
+    'few-transactions': [(1, ['10.00', '20.00'], []), (2, ['30.00'], ['40'])],
+    'few-expenses': [(1, ['10.00', '20.00'], ['1'] * 6), (2, ['30.00'], ['1'] * 4)],
+}
+
+
+class BatchPredictionTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {}
+        for name, history in HISTORIES.items():
+            user = cls.users[name] = create_user(name)
+            with use_shard(shard_for_user(user)):
+                for month, expenses, incomes in history:
+                    for day, (kind, amount) in enumerate(
+                            [('expense', amount) for amount in expenses] + [('income', amount) for amount in incomes]):
+                        Transaction.objects.create(user=user, type=kind, amount=Decimal(amount),
+                                                   date=date(2023, month, day % 28 + 1))
+        cls.without_rows = create_user('no-transactions')
+
+    def per_user(self, user):
+        with use_shard(shard_for_user(user)):
+            return FinanceMLEngine().predict_next_month_expenses(Transaction.objects.filter(user=user))
+
+    def assert_matches_per_user(self, batch):
+        for name, user in self.users.items():
+            with self.subTest(name):
+                expected, result = self.per_user(user), batch[user.pk]
+                self.assertEqual(result.keys(), expected.keys())
+                self.assertAlmostEqual(result['prediction'], expected['prediction'], places=6)
+                self.assertEqual(result['confidence'], expected['confidence'])
+                self.assertEqual(result.get('message'), expected.get('message'))
+                if 'score' in expected:
+                    self.assertAlmostEqual(result['score'], expected['score'], places=6)
+                    self.assertEqual(
+                        [(row['month'], round(row['amount'], 2)) for row in result['historical_data']],
+                        [(row['month'], round(row['amount'], 2)) for row in expected['historical_data']]
+                    )
+
+    def test_batch_matches_the_per_user_fit(self):
+        user_ids = [user.pk for user in self.users.values()] + [self.without_rows.pk]
+        for rollups in (True, False):
+            with self.subTest(rollups=rollups), override_settings(USE_TRANSACTION_ROLLUPS=rollups):
+                batch = FinanceMLEngine().predict_batch(fetch_monthly_totals(user_ids), user_ids=user_ids)
+                self.assert_matches_per_user(batch)
+                self.assertEqual(batch[self.without_rows.pk], self.per_user(self.without_rows))
+
+    def test_cases_reach_every_branch(self):
+        results = {name: self.per_user(user) for name, user in self.users.items()}
+        self.assertEqual(results['one-month']['message'], 'Prediction based on historical average')
+        self.assertEqual(results['two-months']['message'], 'Prediction based on historical average')
+        self.assertEqual(results['flat']['score'], 1.0)
+        self.assertEqual(len(results['gaps']['historical_data']), 3)
+        self.assertEqual(results['few-transactions']['message'], 'Insufficient data for prediction')
+        self.assertEqual(results['few-expenses']['message'], 'Insufficient expense data')
@@ -0,0 +1,55 @@
+from datetime import date
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.models import Transaction
+from transactions.tests.helpers import FreshCacheMixin, client_for, create_user
+from ml_insights.jobs import claim_jobs, run_job
+from ml_insights.models import MLJob
+
+
+@override_settings(ML_PRECOMPUTE=True)
+class PrecomputedResultTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = create_user('precomputed')
+        self.client = client_for(self.user)
+
+    def run_worker(self):
+        for job_id in claim_jobs(10):
+            self.assertTrue(run_job(job_id), MLJob.objects.filter(pk=job_id).values_list('error', flat=True).first())
+
+    def test_first_request_queues_the_job_instead_of_computing(self):
+        for url in ('/api/ml/predict-expenses/', '/api/ml/insights/'):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.data['status'], 'pending')
+                self.assertIn('Retry-After', response)
+                self.assertNotIn('ETag', response)
+        self.assertEqual(MLJob.objects.filter(user=self.user, status='pending').count(), 1)
+
+        response = self.client.get('/api/dashboard/', {'sections': 'prediction,insights'})
+        self.assertEqual(response.data, {'prediction': {'status': 'pending'}, 'insights': {'status': 'pending'}})
+
+        self.run_worker()
+        response = self.client.get('/api/ml/insights/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_stale'])
+
+    def test_stale_results_are_served_while_a_refresh_is_queued(self):
+        self.client.get('/api/ml/insights/')
+        self.run_worker()
+        with use_shard(shard_for_user(self.user)):
+            Transaction.objects.create(user=self.user, type='expense', amount=Decimal('12.00'),
+                                       date=date(2024, 1, 1))
+
+        response = self.client.get('/api/ml/insights/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_stale'])
+        self.assertTrue(MLJob.objects.filter(user=self.user, status='pending').exists())
+
+        self.run_worker()
+        response = self.client.get('/api/ml/insights/')
+        self.assertFalse(response.data['is_stale'])
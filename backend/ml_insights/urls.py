@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import PredictExpensesView, SpendingInsightsView, PredictCategoryView
+from .views import PredictExpensesView, SpendingInsightsView, PredictCategoryView, PredictCategoriesView
 
 urlpatterns = [
     path('predict-expenses/', PredictExpensesView.as_view(), name='predict-expenses'),
     path('insights/', SpendingInsightsView.as_view(), name='insights'),
     path('predict-category/', PredictCategoryView.as_view(), name='predict-category'),
+    path('predict-category/batch/', PredictCategoriesView.as_view(), name='predict-categories'),
 ]
@@ -1,30 +1,75 @@
+import math
+from asgiref.sync import sync_to_async
+from django.utils.decorators import method_decorator
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from transactions.models import Transaction
+from transactions.async_views import AsyncAPIView
+from transactions.conditional import ML_SCOPES, SHARED_SCOPES, versioned_response
+from . import worker
+from .accumulators import get_accumulated_insights
+from .categorizer import get_category_classifier
+from .executor import ExecutorBusy, get_ml_executor
+from .feature_cache import aget_user_features
+from .jobs import get_result, precompute_enabled
 from .ml_engine import FinanceMLEngine
 
 
-class PredictExpensesView(APIView):
+def parse_amount(value):
+    amount = float(value or 0)
+    if not math.isfinite(amount):
+        raise ValueError('amount must be finite')
+    return amount
+
+
+def pending_response():
+    """For a precomputed result ml_worker hasn't produced yet"""
+    return Response(
+        {'status': 'pending', 'detail': 'Your results are being computed, please retry shortly'},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Retry-After': '5'}
+    )
+
+
+def busy_response():
+    return Response(
+        {'error': 'The ML workers are busy, please retry shortly'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': '1'}
+    )
+
+
+class PredictExpensesView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        transactions = Transaction.objects.filter(user=request.user).order_by('date')
+    @method_decorator(versioned_response(ML_SCOPES, SHARED_SCOPES))
+    async def get(self, request):
+        if precompute_enabled():
+            result = await sync_to_async(get_result)(request.user, 'prediction')
+            return pending_response() if result is None else Response(result)
 
-        ml_engine = FinanceMLEngine()
-        prediction = ml_engine.predict_next_month_expenses(transactions)
+        executor = get_ml_executor()
+        try:
+            features = await aget_user_features(request.user, executor)
+            prediction = await executor.run(worker.predict_expenses, features, request.user.pk)
+        except ExecutorBusy:
+            return busy_response()
 
         return Response(prediction)
 
 
-class SpendingInsightsView(APIView):
+class SpendingInsightsView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        transactions = Transaction.objects.filter(user=request.user).order_by('date')
+    @method_decorator(versioned_response(ML_SCOPES, SHARED_SCOPES))
+    async def get(self, request):
+        if precompute_enabled():
+            result = await sync_to_async(get_result)(request.user, 'insights')
+            return pending_response() if result is None else Response(result)
 
-        ml_engine = FinanceMLEngine()
-        insights = ml_engine.get_spending_insights(transactions)
+        # A lookup of the user's running statistics; nothing CPU-bound to offload
+        insights = await sync_to_async(get_accumulated_insights)(request.user)
 
         return Response(insights)
 
@@ -36,7 +81,41 @@ class PredictCategoryView(APIView):
         amount = request.data.get('amount', 0)
         description = request.data.get('description', '')
 
-        ml_engine = FinanceMLEngine()
-        prediction = ml_engine.predict_category(amount, description)
+        try:
+            amount = parse_amount(amount)
+        except (TypeError, ValueError):
+            return Response({'error': 'amount must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ml_engine = FinanceMLEngine(categorizer=get_category_classifier())
+        prediction = ml_engine.predict_category(amount, str(description), user_id=request.user.pk)
 
         return Response(prediction)
+
+
+class PredictCategoriesView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 10000
+
+    def post(self, request):
+        items = request.data.get('transactions')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'transactions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            return Response(
+                {'error': f'At most {self.max_batch_size} transactions per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            descriptions = [str(item.get('description', '')) for item in items]
+            amounts = [parse_amount(item.get('amount')) for item in items]
+        except (AttributeError, TypeError, ValueError):
+            return Response(
+                {'error': 'Each transaction needs a description and a numeric amount'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ml_engine = FinanceMLEngine(categorizer=get_category_classifier())
+        predictions = ml_engine.predict_categories(descriptions, amounts, user_id=request.user.pk)
+
+        return Response({'predictions': predictions})
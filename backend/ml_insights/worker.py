@@ -0,0 +1,43 @@
+"""Process pool entry points for ml_worker and the ML executor.
+
+Spawned workers unpickle these by reference before Django is configured, so
+this module must not import models at import time.
+"""
+
+
+def init_worker_process():
+    """Process pool initializer for spawned workers"""
+    import django
+    django.setup()
+
+
+def run_job(job_id):
+    from .jobs import run_job
+    return run_job(job_id)
+
+
+def call_task(task, *args):
+    """Run an ML executor task, then drop any DB connection it opened in this thread
+
+    Returns (result, stage timings) so the request that submitted the task
+    can report the stages that ran in the pool.
+    """
+    from django.db import close_old_connections
+    from smartfinance.instrumentation import profiled
+    try:
+        with profiled() as profile:
+            result = task(*args)
+        return result, dict(profile.stages)
+    finally:
+        close_old_connections()
+
+
+def build_features(source, columns):
+    from .feature_cache import features_from_columns
+    return features_from_columns(source, columns)
+
+
+def predict_expenses(features, user_id):
+    from .ml_engine import FinanceMLEngine
+    from .registry import get_model_registry
+    return FinanceMLEngine(registry=get_model_registry()).predict_from_features(features, user_id=user_id)
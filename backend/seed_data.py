@@ -5,6 +5,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartfinance.settings')
 django.setup()
 
 from django.contrib.auth import get_user_model
+from smartfinance.sharding import home_shard, sharding_enabled, use_shard
 from transactions.models import Category
 
 User = get_user_model()
@@ -26,21 +27,23 @@ default_categories = [
     {'name': 'Other', 'type': 'expense', 'icon': 'more-horizontal', 'color': '#6B7280', 'is_default': True},
 ]
 
-print("Creating default categories...")
-for cat_data in default_categories:
-    category, created = Category.objects.get_or_create(
-        name=cat_data['name'],
-        type=cat_data['type'],
-        defaults={
-            'icon': cat_data['icon'],
-            'color': cat_data['color'],
-            'is_default': cat_data['is_default']
-        }
-    )
-    if created:
-        print(f"✓ Created category: {category.name}")
-    else:
-        print(f"- Category already exists: {category.name}")
+# Written to the home shard, and copied from there to the others when sharding is on
+with use_shard(home_shard() if sharding_enabled() else None):
+    print("Creating default categories...")
+    for cat_data in default_categories:
+        category, created = Category.objects.get_or_create(
+            name=cat_data['name'],
+            type=cat_data['type'],
+            defaults={
+                'icon': cat_data['icon'],
+                'color': cat_data['color'],
+                'is_default': cat_data['is_default']
+            }
+        )
+        if created:
+            print(f"✓ Created category: {category.name}")
+        else:
+            print(f"- Category already exists: {category.name}")
 
 print("\n✅ Seed data created successfully!")
 print("\nYou can now run the server with: python manage.py runserver")
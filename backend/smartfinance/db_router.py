@@ -0,0 +1,144 @@
+"""Read replicas for analytics reads
+
+Summaries, budget spend and ML feature loads are heavy reads that tolerate
+a little replication lag, so they run on `.using(analytics_db(user_id))`.
+That is a healthy replica from settings.READ_REPLICAS['ALIASES'], unless:
+
+* none is configured or reachable,
+* the code runs inside a transaction on the primary, or
+* the user wrote within READ_YOUR_WRITES_SECONDS (read-your-writes): the
+  per-user data versions every write bumps double as write timestamps. They
+  only tell when the versions are shared, so that a write served by one
+  worker is seen by the next request on another; otherwise every user
+  counts as having just written.
+
+In each of those cases it's 'default'. Everything else reads and writes the
+primary; ReplicaRouter keeps writes there even for instances loaded from a
+replica. Replicas only cover the unsharded layout: with sharding on, these
+reads go to the user's shard like any other.
+"""
+import threading
+import time
+import zlib
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from transactions.versions import get_data_versions, versions_shared
+from .sharding import sharding_enabled
+
+DEFAULT_READ_REPLICAS = {
+    'ALIASES': (),
+    'READ_YOUR_WRITES_SECONDS': 5,
+    'HEALTH_CHECK_INTERVAL': 10,
+}
+
+# Scopes whose writes analytics reads must see
+WRITE_SCOPES = ('transactions', 'categories', 'budgets')
+
+
+def replica_settings():
+    return {**DEFAULT_READ_REPLICAS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+class ReplicaHealth:
+    """Per-process replica status, rechecked at most every `interval` seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        # {alias: (checked at, healthy)}
+        self.status = {}
+        self.lock = threading.Lock()
+
+    def is_healthy(self, alias):
+        with self.lock:
+            checked = self.status.get(alias)
+        if checked is not None and time.monotonic() - checked[0] < self.interval:
+            return checked[1]
+        healthy = self.check(alias)
+        with self.lock:
+            self.status[alias] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, alias):
+        # Reading a table catches empty or unmigrated replicas as well as unreachable ones
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+                cursor.fetchone()
+            return True
+        except DatabaseError:
+            connection.close()
+            return False
+
+    def clear(self):
+        with self.lock:
+            self.status.clear()
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_replica_health():
+    """The process-wide ReplicaHealth configured by settings.READ_REPLICAS"""
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                _health = ReplicaHealth(replica_settings()['HEALTH_CHECK_INTERVAL'])
+    return _health
+
+
+def wrote_recently(user_ids, seconds):
+    """Whether any of the users changed their data within the last `seconds`"""
+    if not versions_shared():
+        # Writes in other processes are invisible here
+        return True
+    cutoff = time.time_ns() - int(seconds * 1e9)
+    for user_id in user_ids:
+        if max(get_data_versions(user_id, WRITE_SCOPES).values()) > cutoff:
+            return True
+    return False
+
+
+def analytics_db(*user_ids):
+    """Database alias for an analytics read of the given users' data (of everyone's without ids)"""
+    if sharding_enabled():
+        # None leaves the shard to ShardRouter
+        return None
+    config = replica_settings()
+    aliases = [alias for alias in config['ALIASES'] if alias in connections]
+    if not aliases or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    if wrote_recently(user_ids, config['READ_YOUR_WRITES_SECONDS']):
+        return DEFAULT_DB_ALIAS
+
+    health = get_replica_health()
+    healthy = [alias for alias in aliases if health.is_healthy(alias)]
+    if not healthy:
+        return DEFAULT_DB_ALIAS
+    # A user keeps to one replica, so their reads in a request see one snapshot
+    key = zlib.crc32(','.join(map(str, user_ids)).encode())
+    return healthy[key % len(healthy)]
+
+
+class ReplicaRouter:
+    """Writes, migrations and unrouted reads go to the primary; replicas are read-only copies of it"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects load from where the instance came from
+            return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_settings()['ALIASES']}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,308 @@
+"""Per-request performance instrumentation
+
+InstrumentationMiddleware records, for every request, the SQL queries run
+(count, time, statements repeated within the request) and the time spent in
+named stages: serialization and the FinanceMLEngine load / frame / fit /
+predict steps. Requests report them in a Server-Timing header and feed
+in-process Prometheus metrics served at /metrics.
+
+Code marks a stage with `with stage('name'):` (or `@stage('name')`); outside
+a request it only costs a context variable lookup.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'METRICS_TOKEN': '',
+    'REPEATED_QUERY_WARNING': 10,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_profile = ContextVar('request_profile', default=None)
+
+
+def get_config():
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestProfile:
+    """What one request (or one ML executor task) spent its time on"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.stages = defaultdict(float)
+        self.active = set()
+
+    @property
+    def repeated_queries(self):
+        """Queries whose SQL already ran in this request: the N+1 signature"""
+        return sum(count - 1 for count in self.statements.values() if count > 1)
+
+    def record_query(self, sql, seconds):
+        self.query_count += 1
+        self.db_time += seconds
+        self.statements[sql] += 1
+
+    def merge_stages(self, stages):
+        for name, seconds in stages.items():
+            self.stages[name] += seconds
+
+
+def current_profile():
+    return _profile.get()
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to the current request's `name` stage"""
+    profile = _profile.get()
+    # Nested or recursive blocks of the same stage count once
+    if profile is None or name in profile.active:
+        yield
+        return
+    profile.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.stages[name] += time.perf_counter() - started
+        profile.active.discard(name)
+
+
+@contextmanager
+def profiled():
+    """Record into a fresh RequestProfile for the duration of the block"""
+    profile = RequestProfile()
+    token = _profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _profile.reset(token)
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record_query(sql, time.perf_counter() - started)
+
+
+def _install_query_recorder(connection, **kwargs):
+    # Fires on every (re)connect of a per-thread connection; wrap it once
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install_query_recorder():
+    connection_created.connect(_install_query_recorder, dispatch_uid='instrumentation_query_recorder')
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # {label values: [bucket counts..., +Inf count, sum]}
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, series in sorted(self.series.items()):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{labels}}} {series[-1]}'
+            yield f'{self.name}_count{{{labels}}} {cumulative}'
+
+
+class CounterMetric:
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.series = defaultdict(float)
+
+    def inc(self, label_values, amount=1):
+        self.series[label_values] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for label_values, value in sorted(self.series.items()):
+            yield f'{self.name}{{{_format_labels(self.labels, label_values)}}} {value}'
+
+
+def _format_labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class MetricsRegistry:
+    """Request metrics of this process, in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = Histogram(
+            'http_request_duration_seconds', 'Time to produce a response, by view',
+            ('method', 'view', 'status'), LATENCY_BUCKETS
+        )
+        self.queries = Histogram(
+            'http_request_db_queries', 'SQL queries per request',
+            ('view',), QUERY_COUNT_BUCKETS
+        )
+        self.db_time = Histogram(
+            'http_request_db_duration_seconds', 'Time per request spent in SQL queries',
+            ('view',), LATENCY_BUCKETS
+        )
+        self.repeated = CounterMetric(
+            'http_request_repeated_queries_total', 'Queries repeating SQL already run in the same request',
+            ('view',)
+        )
+        self.stages = Histogram(
+            'http_request_stage_duration_seconds', 'Time per request spent in a named stage',
+            ('view', 'stage'), LATENCY_BUCKETS
+        )
+
+    def observe(self, method, view, status, duration, profile):
+        with self.lock:
+            self.latency.observe((method, view, str(status)), duration)
+            self.queries.observe((view,), profile.query_count)
+            self.db_time.observe((view,), profile.db_time)
+            if profile.repeated_queries:
+                self.repeated.inc((view,), profile.repeated_queries)
+            for name, seconds in profile.stages.items():
+                self.stages.observe((view, name), seconds)
+
+    def render(self):
+        with self.lock:
+            metrics = (self.latency, self.queries, self.db_time, self.repeated, self.stages)
+            return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(profile, duration):
+    """Server-Timing header value for a finished request"""
+    entries = [
+        f'db;dur={profile.db_time * 1000:.1f};desc="{profile.query_count} queries, '
+        f'{profile.repeated_queries} repeated"'
+    ]
+    entries.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(profile.stages.items()))
+    entries.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware:
+    """Profile each request: Server-Timing header, Prometheus metrics, repeated-query warnings"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.server_timing = config['SERVER_TIMING']
+        self.repeated_query_warning = config['REPEATED_QUERY_WARNING']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_query_recorder()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with profiled() as profile:
+            response = self.get_response(request)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        with profiled() as profile:
+            response = await self.get_response(request)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        # Streamed bodies are produced after this returns and are not included
+        duration = time.perf_counter() - profile.started
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        registry.observe(request.method, view, response.status_code, duration, profile)
+
+        if profile.statements:
+            sql, count = profile.statements.most_common(1)[0]
+            if count >= self.repeated_query_warning:
+                logger.warning('%s %s ran the same query %d times: %s', request.method, request.path, count, sql)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(profile, duration)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires `Authorization: Bearer <METRICS_TOKEN>`, and is
+    only open without one when DEBUG is on"""
+    token = get_config()['METRICS_TOKEN']
+    if token:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        # Per-view latency and query counts are not for the public internet
+        authorized = settings.DEBUG
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that counts rendering towards the 'serialize' stage"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with stage('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedSerializerMixin:
+    """Serializer mixin counting to_representation() towards the 'serialize' stage"""
+
+    def to_representation(self, instance):
+        with stage('serialize'):
+            return super().to_representation(instance)
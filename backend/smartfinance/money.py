@@ -0,0 +1,215 @@
+"""Money stored as whole minor units (cents)
+
+MoneyField keeps amounts in BIGINT columns, so the database sums integers
+exactly and NumPy code loads them as int64 without a Decimal per row. In
+Python a MoneyField value is still a two-place Decimal, so models, forms,
+serializers and the JSON API see what they saw with DecimalField.
+
+Code that aggregates reads raw minor units instead: Minor() wraps a money
+expression (a field name or an aggregate over one) so it skips the Decimal
+conversion, and minor_array() turns those values into a contiguous int64
+array. Divide by MINOR_UNITS only where floats are needed.
+
+Databases created before MoneyField have decimal money columns;
+decimal_money_columns() finds them and convert_money_columns() rescales
+them in place (the convert_money_columns command runs it on every database).
+"""
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from django import forms
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.apps import apps
+from django.db import migrations, models, router
+from django.db.models import F
+from django.db.migrations.state import ProjectState
+from django.db.models.functions import Cast, Round
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+DECIMAL_PLACES = 2
+MINOR_UNITS = 10 ** DECIMAL_PLACES
+
+
+def to_minor(value):
+    """Minor units (an int) for a Decimal, int, float or numeric string, rounded half to even
+
+    Raises ValueError for anything that isn't a finite number.
+    """
+    try:
+        # str() so floats convert as written (0.1, not its binary expansion)
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+        if not amount.is_finite():
+            raise ValueError(f"Amount must be finite, got {value!r}")
+        return int(amount.scaleb(DECIMAL_PLACES).to_integral_value())
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount {value!r}")
+
+
+def from_minor(value):
+    """The Decimal amount for a number of minor units, e.g. 1250 -> Decimal('12.50')"""
+    return Decimal(int(value)).scaleb(-DECIMAL_PLACES)
+
+
+def minor_array(values):
+    """Contiguous int64 array of minor units from a sequence (or array) of them"""
+    return np.ascontiguousarray(values, dtype=np.int64)
+
+
+class Minor(Cast):
+    """A money expression as its raw integer minor units, with no conversion to Decimal
+
+    Minor('amount'), Minor(Sum('amount')). The cast is a no-op on the stored
+    integers; it gives aggregates an integer type on every backend (PostgreSQL
+    sums BIGINTs as NUMERIC).
+    """
+
+    def __init__(self, expression):
+        super().__init__(expression, output_field=models.BigIntegerField())
+
+
+class MoneyField(models.BigIntegerField):
+    """An amount of money: minor units in the database, a Decimal with DECIMAL_PLACES in Python
+
+    `max_digits` bounds the amount like DecimalField's does and is what
+    serializers validate against.
+    """
+    description = 'Money amount stored in minor units'
+
+    def __init__(self, *args, max_digits=10, **kwargs):
+        self.max_digits = max_digits
+        self.decimal_places = DECIMAL_PLACES
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits != 10:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @cached_property
+    def validators(self):
+        # In place of the BIGINT range checks, which would be in minor units
+        return [*self.default_validators, *self._validators,
+                validators.DecimalValidator(self.max_digits, self.decimal_places)]
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_minor(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal) and value.as_tuple().exponent == -DECIMAL_PLACES:
+            return value
+        try:
+            return from_minor(to_minor(value))
+        except ValueError:
+            raise ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value}
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return value
+        try:
+            return to_minor(value)
+        except ValueError as exc:
+            raise ValueError(f"Field '{self.name}' expected a money amount but got {value!r}.") from exc
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': self.decimal_places,
+            **kwargs,
+        })
+
+
+class MoneySerializerMixin:
+    """ModelSerializer mixin mapping MoneyFields to DecimalFields, so the API keeps decimal strings"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        MoneyField: serializers.DecimalField,
+    }
+
+
+def minor_units_operations(app_label, model_name, name, field):
+    """Migration operations turning an existing decimal money column into `field`, a MoneyField
+
+    Use them in place of the AlterField makemigrations generates for the
+    column. The values are scaled to minor units while still decimal (in a
+    column widened so they fit) and only then retyped, so no cents are lost.
+    Reversible.
+    """
+    decimal = models.DecimalField(max_digits=field.max_digits + DECIMAL_PLACES, decimal_places=DECIMAL_PLACES,
+                                  null=field.null)
+
+    def scale(factor):
+        def run(apps, schema_editor):
+            model = apps.get_model(app_label, model_name)
+            # Rounded: SQLite keeps fractional decimals as floats, so 12.34 * 100 is 1233.9999...
+            model._base_manager.using(schema_editor.connection.alias).update(
+                **{name: Round(F(name) * factor, DECIMAL_PLACES)})
+        return run
+
+    return [
+        migrations.AlterField(model_name, name, decimal),
+        migrations.RunPython(scale(MINOR_UNITS), scale(Decimal(1) / MINOR_UNITS)),
+        migrations.AlterField(model_name, name, field),
+    ]
+
+
+def decimal_money_columns(connection):
+    """{model: [MoneyFields]} whose columns on `connection` are still decimal
+
+    Only models the routers migrate there and whose tables exist count.
+    """
+    candidates = {
+        model: [field for field in model._meta.concrete_fields if isinstance(field, MoneyField)]
+        for model in apps.get_models() if router.allow_migrate_model(connection.alias, model)
+    }
+    candidates = {model: fields for model, fields in candidates.items() if fields}
+    if not candidates:
+        return {}
+    tables = set(connection.introspection.table_names())
+    found = {}
+    for model, fields in candidates.items():
+        if model._meta.db_table not in tables:
+            continue
+        with connection.cursor() as cursor:
+            description = connection.introspection.get_table_description(cursor, model._meta.db_table)
+        types = {column.name: connection.introspection.get_field_type(column.type_code, column)
+                 for column in description}
+        decimal = [field for field in fields if types.get(field.column) == 'DecimalField']
+        if decimal:
+            found[model] = decimal
+    return found
+
+
+def convert_money_columns(connection, model, fields):
+    """Turn the decimal columns of `fields` (MoneyFields of `model`) into minor units, atomically
+
+    As in minor_units_operations(): widen, scale, then retype. All of a
+    model's columns go together, since SQLite rebuilds the whole table from
+    the model for each change and would retype the others unscaled. The
+    rebuilds use the model as migrations see it, whose abstract bases are
+    flattened, so inherited many-to-many tables aren't created again.
+    """
+    model = ProjectState.from_apps(apps).apps.get_model(model._meta.label)
+    fields = [model._meta.get_field(field.name) for field in fields]
+
+    def decimal(field, max_digits):
+        column = models.DecimalField(max_digits=max_digits, decimal_places=DECIMAL_PLACES, null=field.null)
+        column.set_attributes_from_name(field.name)
+        column.model = model
+        return column
+
+    with connection.schema_editor() as schema_editor:
+        for field in fields:
+            schema_editor.alter_field(model, decimal(field, field.max_digits),
+                                      decimal(field, field.max_digits + DECIMAL_PLACES))
+        model._base_manager.using(connection.alias).update(
+            **{field.name: Round(F(field.name) * MINOR_UNITS) for field in fields})
+        for field in fields:
+            schema_editor.alter_field(model, decimal(field, field.max_digits + DECIMAL_PLACES), field)
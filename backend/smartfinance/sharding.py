@@ -0,0 +1,299 @@
+"""User-sharded data layout
+
+With settings.SHARDING enabled, each user's categories, transactions,
+budgets, savings goals and the state derived from them (rollups, insight
+accumulators) live on one database alias, `User.shard`. New users are
+placed by a consistent hash ring over their id; `rebalance_shards` moves
+existing users to the ring's choice after shards are added. Users, auth and
+ML job / model tables stay on 'default', and default categories are copied
+to every shard.
+
+Queries on sharded models go to the shard that is in use:
+
+* in API requests, the authenticated user's (ShardMiddleware plus
+  CachedJWTAuthentication select it);
+* elsewhere, the one selected with `with use_shard(shard_for_user(user)):`.
+
+Querysets given an explicit `.using()` and related-object access on
+instances loaded from a shard need neither. Querying sharded models with
+no shard selected raises ShardNotSelected rather than guessing.
+"""
+import bisect
+import copy
+import functools
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.base import ModelState
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULT_SHARDING = {
+    'ENABLED': False,
+    'SHARDS': [DEFAULT_DB_ALIAS],
+    'VNODES': 64,
+    'ID_BLOCK_SIZE': 1000,
+}
+
+# Models stored on the owner's shard, by app_label.model_name
+SHARDED_MODELS = {
+    'transactions.category',
+    'transactions.transaction',
+    'transactions.budget',
+    'transactions.savingsgoal',
+    'transactions.transactionrollup',
+    'ml_insights.insightaccumulator',
+}
+
+
+class ShardNotSelected(RuntimeError):
+    pass
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Your data is being moved; try again in a few seconds.'
+    default_code = 'shard_moving'
+    # Sent as Retry-After by DRF's exception handler
+    wait = 5
+
+
+def get_config():
+    return {**DEFAULT_SHARDING, **getattr(settings, 'SHARDING', {})}
+
+
+def sharding_enabled():
+    return get_config()['ENABLED']
+
+
+def shard_aliases():
+    return list(get_config()['SHARDS'])
+
+
+def home_shard():
+    """The shard new default categories are written to before being copied to the rest"""
+    return shard_aliases()[0]
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring: adding a node only takes over keys from the others, ~1/N of them"""
+
+    def __init__(self, nodes, vnodes=64):
+        points = sorted((_hash(f'{node}#{index}'), node) for node in nodes for index in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        index = bisect.bisect(self.hashes, _hash(str(key))) % len(self.hashes)
+        return self.nodes[index]
+
+
+_ring = None
+
+
+def get_ring():
+    """The HashRing over settings.SHARDING['SHARDS']"""
+    global _ring
+    config = get_config()
+    if _ring is None or _ring[0] != (tuple(config['SHARDS']), config['VNODES']):
+        _ring = ((tuple(config['SHARDS']), config['VNODES']), HashRing(config['SHARDS'], config['VNODES']))
+    return _ring[1]
+
+
+def shard_for_user(user):
+    """Alias holding a user's data, for a User or a user id; None when sharding is off
+
+    None suits `.using()` and use_shard(), which then leave routing as it is.
+    Users placed before sharding was enabled have no shard and stay on 'default'.
+    """
+    if not sharding_enabled():
+        return None
+    if hasattr(user, '_meta'):
+        return user.shard or DEFAULT_DB_ALIAS
+    from django.contrib.auth import get_user_model
+    shard = get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(pk=user).values_list('shard', flat=True).first()
+    return shard or DEFAULT_DB_ALIAS
+
+
+def users_by_shard(user_ids):
+    """{alias: [user ids]} with one query; {None: user ids} when sharding is off"""
+    user_ids = list(user_ids)
+    if not sharding_enabled():
+        return {None: user_ids}
+    from django.contrib.auth import get_user_model
+    shards = dict(get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(pk__in=user_ids).values_list('pk', 'shard'))
+    grouped = {}
+    for user_id in user_ids:
+        grouped.setdefault(shards.get(user_id) or DEFAULT_DB_ALIAS, []).append(user_id)
+    return grouped
+
+
+def shard_groups(user_ids=None):
+    """users_by_shard(), but every shard mapped to None (all its users) without ids"""
+    if user_ids is not None:
+        return users_by_shard(user_ids)
+    if not sharding_enabled():
+        return {None: None}
+    return {alias: None for alias in shard_aliases()}
+
+
+_shard = ContextVar('shard', default=None)
+# One mutable slot per request, so a shard selected while authenticating is seen
+# by everything else the request runs, whichever context copy it runs in
+_request_shard = ContextVar('request_shard', default=None)
+
+
+@contextmanager
+def use_shard(alias):
+    """Send queries on sharded models to `alias` inside the block; None changes nothing"""
+    if alias is None:
+        yield
+        return
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def current_shard():
+    alias = _shard.get()
+    if alias is None:
+        slot = _request_shard.get()
+        alias = slot[0] if slot is not None else None
+    return alias
+
+
+def activate_request_shard(user):
+    """Select the authenticated user's shard for the rest of the request"""
+    slot = _request_shard.get()
+    if slot is not None:
+        slot[0] = shard_for_user(user)
+
+
+def on_instance_shard(receiver):
+    """Run a model signal receiver on the shard its instance was written to"""
+    @functools.wraps(receiver)
+    def wrapper(sender, instance, **kwargs):
+        if not sharding_enabled():
+            return receiver(sender, instance, **kwargs)
+        with use_shard(kwargs.get('using') or instance._state.db):
+            return receiver(sender, instance, **kwargs)
+    return wrapper
+
+
+def copy_to(instance, alias):
+    """Insert or update a copy of `instance`, same primary key, on another database
+
+    Saved raw, so receivers that skip fixture loads skip it too.
+    """
+    clone = copy.copy(instance)
+    clone._state = ModelState()
+    clone.save_base(using=alias, raw=True)
+    return clone
+
+
+class ShardRouter:
+    """Routes sharded models to the selected shard; defers everything else to the next router"""
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints, read=True)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def _route(self, model, hints, read=False):
+        if not sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if not is_sharded(model):
+            # Users and ML state reached from a shard row live on 'default'
+            if instance is not None and instance._state.db not in (None, DEFAULT_DB_ALIAS) \
+                    and is_sharded(type(instance)):
+                return DEFAULT_DB_ALIAS
+            return None
+
+        if instance is not None:
+            if instance._meta.label_lower == settings.AUTH_USER_MODEL.lower():
+                # A user's related rows (user.transactions, Transaction(user=user))
+                return shard_for_user(instance)
+            if read and instance._meta.label_lower == 'transactions.category' and instance.user_id is None \
+                    and current_shard() is not None:
+                # Rows under a default category are on every shard; read the selected one's
+                return current_shard()
+            if is_sharded(type(instance)) and instance._state.db:
+                return instance._state.db
+            if getattr(instance, 'user_id', None) is not None:
+                return shard_for_user(instance.user_id)
+        alias = current_shard()
+        if alias is None:
+            if instance is not None and model._meta.label_lower == 'transactions.category':
+                # A new default category; copied to the other shards once saved
+                return home_shard()
+            raise ShardNotSelected(
+                f"No shard selected for a {model.__name__} query: run it in an authenticated "
+                f"request, inside use_shard(), or on a queryset with .using()"
+            )
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        shards = set(shard_aliases())
+        if not sharding_enabled():
+            # Shards set up ahead of sharding only hold what migrate() put there
+            shards.discard(DEFAULT_DB_ALIAS)
+        elif is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            # Users are mirrored onto their shard and default categories onto every shard
+            return True
+        # Anything else only within one database (e.g. auth tables migrate() fills on each shard)
+        if obj1._state.db in shards or obj2._state.db in shards:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Every shard gets the full schema: sharded rows keep their foreign keys. Also
+        # before sharding is turned on, so shards can be migrated ahead of it
+        if db in shard_aliases():
+            return True
+        return None
+
+
+class ShardMiddleware:
+    """Give each request a slot for its user's shard, which authentication fills in"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _request_shard.set([None])
+        try:
+            return self.get_response(request)
+        finally:
+            _request_shard.reset(token)
+
+    async def __acall__(self, request):
+        token = _request_shard.set([None])
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_shard.reset(token)
@@ -3,10 +3,16 @@ URL configuration for smartfinance project.
 """
 from django.contrib import admin
 from django.urls import path, include
+from transactions.admin import shard_sites
+from .instrumentation import metrics_view
 
 urlpatterns = [
+    # Sharded models of each shard but the first (see transactions.admin)
+    *(path(f'admin/{alias}/', site.urls) for alias, site in shard_sites.items()),
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
     path('api/transactions/', include('transactions.urls')),
     path('api/ml/', include('ml_insights.urls')),
+    path('api/dashboard/', include('dashboard.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
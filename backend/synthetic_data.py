@@ -0,0 +1,24 @@
+import argparse
+import os
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartfinance.settings')
+django.setup()
+
+from transactions.synthetic import generate_user
+
+parser = argparse.ArgumentParser(description='Create users with synthetic transaction histories')
+parser.add_argument('--users', type=int, default=1, help='Number of users to create')
+parser.add_argument('--transactions', type=int, default=1000, help='Transactions per user (1k to 1M)')
+parser.add_argument('--days', type=int, default=730, help='Days of history per user')
+parser.add_argument('--prefix', default='synthetic', help='Username prefix')
+parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+args = parser.parse_args()
+
+for index in range(args.users):
+    username = f"{args.prefix}{index + 1}"
+    print(f"Creating {username} with {args.transactions} transactions...")
+    generate_user(username, args.transactions, days=args.days, seed=args.seed + index)
+    print(f"✓ Created user: {username} (password: benchmark-password)")
+
+print("\n✅ Synthetic data created successfully!")
@@ -1,7 +1,54 @@
 from django.contrib import admin
+from smartfinance.sharding import home_shard, shard_aliases, sharding_enabled, use_shard
 from .models import Category, Transaction, Budget, SavingsGoal
 
-admin.site.register(Category)
-admin.site.register(Transaction)
-admin.site.register(Budget)
-admin.site.register(SavingsGoal)
+SHARDED_ADMIN_MODELS = (Category, Transaction, Budget, SavingsGoal)
+
+
+class ShardModelAdmin(admin.ModelAdmin):
+    """Admin for a sharded model on one shard (`shard`; None for the home shard, or no shard with sharding off)
+
+    Each view runs and renders inside use_shard(), so the model's queries,
+    its signal receivers and the delete confirmation all go to that shard.
+    """
+    shard = None
+
+    def get_shard(self):
+        if self.shard is None and sharding_enabled():
+            return home_shard()
+        return self.shard
+
+    def _on_shard(self, view, request, *args):
+        with use_shard(self.get_shard()):
+            response = view(request, *args)
+            # Template responses evaluate their querysets when rendered
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        return self._on_shard(super().changelist_view, request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return self._on_shard(super().changeform_view, request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        return self._on_shard(super().delete_view, request, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        return self._on_shard(super().history_view, request, object_id, extra_context)
+
+
+def register_sharded_models(site, shard):
+    model_admin = type('ShardModelAdmin', (ShardModelAdmin,), {'shard': shard})
+    for model in SHARDED_ADMIN_MODELS:
+        site.register(model, model_admin)
+
+
+# admin.site shows the home shard; each other configured shard gets a site at /admin/<alias>/
+register_sharded_models(admin.site, None)
+shard_sites = {}
+for alias in shard_aliases()[1:]:
+    shard_sites[alias] = admin.AdminSite(name=f'admin-{alias}')
+    shard_sites[alias].site_header = f'{admin.site.site_header}: {alias}'
+    register_sharded_models(shard_sites[alias], alias)
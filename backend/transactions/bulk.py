@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from .ids import assign_ids
+from .models import Transaction
+from .rollups import STATE_FIELDS, apply_states, transaction_state
+from .versions import bump_data_version
+
+# Sent once per bulk write with the affected user ids and the added / removed
+# transaction_state() snapshots. bulk_create/update/delete bypass the per-row
+# model signals, so derived state listens here instead.
+transactions_bulk_changed = Signal()
+
+_row_signals_suppressed = ContextVar('row_signals_suppressed', default=False)
+
+
+@contextmanager
+def suppress_row_signals():
+    """Make per-row Transaction receivers no-ops; the bulk caller does their work once"""
+    token = _row_signals_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _row_signals_suppressed.reset(token)
+
+
+def row_signals_suppressed():
+    return _row_signals_suppressed.get()
+
+
+def bulk_create_transactions(transactions, batch_size=1000):
+    """Insert Transactions in one DB transaction and refresh derived state once"""
+    created, _, _ = bulk_write_transactions(created=transactions, batch_size=batch_size)
+    return created
+
+
+def bulk_write_transactions(created=(), updated=(), deleted=None, batch_size=1000):
+    """Apply creates, updates and deletes in one DB transaction and refresh derived state once
+
+    `created` holds unsaved Transactions, `updated` (instance, changes) pairs and
+    `deleted` a Transaction queryset. Returns (created, updated, deleted ids).
+    """
+    added_states, removed_states = [], []
+    updated_instances = []
+
+    created = list(created)
+    assign_ids(created)
+    with transaction.atomic(using=router.db_for_write(Transaction)), suppress_row_signals():
+        created = Transaction.objects.bulk_create(created, batch_size=batch_size) if created else []
+        added_states.extend(transaction_state(trans) for trans in created)
+
+        fields = {'updated_at'}
+        now = timezone.now()
+        for instance, changes in updated:
+            removed_states.append(transaction_state(instance))
+            for field, value in changes.items():
+                setattr(instance, field, value)
+            instance.updated_at = now
+            fields.update(changes)
+            added_states.append(transaction_state(instance))
+            updated_instances.append(instance)
+        if updated_instances:
+            Transaction.objects.bulk_update(updated_instances, sorted(fields), batch_size=batch_size)
+
+        deleted_ids = []
+        if deleted is not None:
+            rows = list(deleted.values_list('pk', *STATE_FIELDS))
+            deleted_ids = [row[0] for row in rows]
+            # Same shape as transaction_state()
+            removed_states.extend(row[1:] for row in rows)
+            if deleted_ids:
+                Transaction.objects.filter(pk__in=deleted_ids).delete()
+
+        if removed_states:
+            apply_states(removed_states, sign=-1)
+        if added_states:
+            apply_states(added_states)
+
+    user_ids = {state[0] for state in added_states} | {state[0] for state in removed_states}
+    if user_ids:
+        notify_bulk_change(user_ids, added_states, removed_states)
+    return created, updated_instances, deleted_ids
+
+
+def notify_bulk_change(user_ids, added=(), removed=()):
+    for user_id in user_ids:
+        bump_data_version(user_id)
+    transactions_bulk_changed.send(sender=Transaction, user_ids=user_ids, added=added, removed=removed)
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from .models import Category
+from .versions import SHARED, get_data_version, versions_shared
+
+
+class UserCategories:
+    """The categories one user can see (shared defaults plus their own), indexed by id and name
+
+    A snapshot shared between requests: treat the Category instances as read-only.
+    Ids of categories the user can't see resolve to None, like no category.
+    """
+
+    def __init__(self, defaults, own):
+        by_id = {category.pk: category for category in defaults}
+        by_id.update((category.pk, category) for category in own)
+        self.categories = tuple(by_id[pk] for pk in sorted(by_id))
+        self.by_id = by_id
+
+        # A user's own category wins over a default with the same name
+        self.ids_by_name = {}
+        for category in defaults:
+            self.ids_by_name.setdefault(category.name.casefold(), category.pk)
+        for category in own:
+            self.ids_by_name[category.name.casefold()] = category.pk
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def id_for(self, name):
+        """Id of the category called `name` (case-insensitive), or None"""
+        return self.ids_by_name.get(name.casefold())
+
+    def names(self, category_ids):
+        """Category names for a sequence of ids; None for no (or an unknown) category"""
+        names = {pk: category.name for pk, category in self.by_id.items()}
+        return [names.get(category_id) for category_id in category_ids]
+
+
+class CategoryDirectory:
+    """Process-wide category lookups: the defaults loaded once, per-user overlays in an LRU
+
+    Entries are keyed by the 'categories' data versions, which every Category
+    write bumps, so changes made by other processes are picked up too. That
+    needs versions every process shares; without them each call reads the
+    database.
+    """
+
+    def __init__(self, max_users=1024):
+        self.max_users = max_users
+        self.defaults = None
+        # {user id: (user version, own categories, shared version, UserCategories)}
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def for_user(self, user_id):
+        if not versions_shared():
+            return UserCategories(
+                tuple(Category.objects.filter(is_default=True).order_by('pk')),
+                tuple(Category.objects.filter(user_id=user_id).order_by('pk'))
+            )
+        # Versions are read before loading, so a write landing mid-load bumps
+        # them and the snapshot stored below is never served for the newer data
+        shared_version = get_data_version(SHARED, 'categories')
+        user_version = get_data_version(user_id, 'categories')
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is not None and entry[0] == user_version and entry[2] == shared_version:
+                self.users.move_to_end(user_id)
+                return entry[3]
+
+        if entry is not None and entry[0] == user_version:
+            own = entry[1]
+        else:
+            own = tuple(Category.objects.filter(user_id=user_id).order_by('pk'))
+        view = UserCategories(self._defaults(shared_version), own)
+
+        with self.lock:
+            self.users[user_id] = (user_version, own, shared_version, view)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        return view
+
+    def _defaults(self, version):
+        with self.lock:
+            defaults = self.defaults
+        if defaults is not None and defaults[0] == version:
+            return defaults[1]
+        categories = tuple(Category.objects.filter(is_default=True).order_by('pk'))
+        with self.lock:
+            self.defaults = (version, categories)
+        return categories
+
+    def clear(self):
+        with self.lock:
+            self.defaults = None
+            self.users.clear()
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_category_directory():
+    """The process-wide CategoryDirectory, holding up to settings.CATEGORY_CACHE_SIZE users"""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = CategoryDirectory(getattr(settings, 'CATEGORY_CACHE_SIZE', 1024))
+    return _directory
+
+
+def visible_categories(user_id):
+    """Shortcut for get_category_directory().for_user(user_id)"""
+    return get_category_directory().for_user(user_id)
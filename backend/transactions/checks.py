@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Error, register
+from django.db import DatabaseError, connections
+from smartfinance.money import decimal_money_columns
+from .versions import VERSION_CACHE_ALIAS, versions_shared
+
+
+@register()
+def check_version_cache(app_configs, **kwargs):
+    """Data versions invalidate caches in every process, so they must live in a shared cache"""
+    if versions_shared():
+        return []
+    backend = settings.CACHES[VERSION_CACHE_ALIAS]['BACKEND']
+    return [Error(
+        f'Per-user data versions are stored in {backend}, which other processes cannot see.',
+        hint=('Web workers, ml_worker and management commands must share the version cache: set '
+              'CACHE_BACKEND to a shared backend (Redis, Memcached, or FileBasedCache with '
+              'CACHE_LOCATION on a directory every process can write).'),
+        id='transactions.E001',
+    )]
+
+
+@register()
+def check_money_columns(app_configs, **kwargs):
+    """MoneyField reads integers; a decimal column left from before it would read 12.34 as 0.12"""
+    errors = []
+    for alias in connections:
+        try:
+            found = decimal_money_columns(connections[alias])
+        except DatabaseError:
+            # Not created or not reachable yet: nothing to misread
+            continue
+        for model, fields in found.items():
+            errors.extend(Error(
+                f'{model._meta.db_table}.{field.column} on database {alias!r} still stores decimal amounts.',
+                hint='Run `python manage.py convert_money_columns` to rescale them to minor units.',
+                obj=field,
+                id='transactions.E002',
+            ) for field in fields)
+    return errors
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+from datetime import datetime, time, timezone as dt_timezone
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .versions import SHARED, get_data_versions, versions_shared
+
+# Data version scopes each kind of response depends on
+TRANSACTION_SCOPES = ('transactions',)
+CATEGORY_SCOPES = ('categories',)
+BUDGET_SCOPES = ('budgets', 'transactions')
+SAVINGS_GOAL_SCOPES = ('savings_goals',)
+PROFILE_SCOPES = ('profile',)
+ML_SCOPES = ('transactions', 'ml')
+DASHBOARD_SCOPES = ('profile', 'transactions', 'budgets', 'savings_goals', 'categories', 'ml')
+# Default categories are shared; their names and colours appear in most responses
+SHARED_SCOPES = ('categories',)
+
+
+def _request_versions(request, scopes, shared_scopes):
+    # The ETag and Last-Modified are both derived from these; read the cache once
+    versions = getattr(request, '_data_versions', None)
+    if versions is None:
+        versions = {
+            **{('user', scope): version for scope, version in get_data_versions(request.user.pk, scopes).items()},
+            **{('shared', scope): version for scope, version in get_data_versions(SHARED, shared_scopes).items()},
+        }
+        request._data_versions = versions
+    return versions
+
+
+def _validators(request, versions):
+    """(quoted ETag, Last-Modified timestamp) for a request given its data versions"""
+    # Query string and Accept change the representation; the date matters for
+    # views whose default window or trend is relative to today
+    key = repr((
+        request.user.pk,
+        sorted(versions.items()),
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        timezone.localdate().isoformat(),
+    ))
+    etag = quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+    changed = datetime.fromtimestamp(max(versions.values()) / 1e9, tz=dt_timezone.utc)
+    # Never older than today's midnight, so If-Modified-Since alone can't
+    # revalidate yesterday's "last 30 days"
+    midnight = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    return etag, int(max(changed, midnight).timestamp())
+
+
+def _finish(request, response, etag, last_modified):
+    # Validators describe the data: not an error about the request, nor a result still being computed
+    if etag is not None and response.status_code in (200, 304) and request.method in ('GET', 'HEAD'):
+        if not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified)
+        response.headers.setdefault('ETag', etag)
+    # Per-user content: browsers revalidate every time, shared caches keep out
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def versioned_response(scopes, shared_scopes=()):
+    """View decorator: ETag/Last-Modified from per-user data versions, 304 before the handler runs
+
+    `scopes` are the user's data version scopes the response depends on and
+    `shared_scopes` those of data shared between users (default categories).
+    Works on sync and async views alike. Without a shared version store no
+    validators are sent: a worker that missed a write would answer 304 for
+    data it never saw change.
+    """
+    def validators(request):
+        if not request.user.is_authenticated or not versions_shared():
+            return None, None
+        return _validators(request, _request_versions(request, scopes, shared_scopes))
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag, last_modified = await sync_to_async(validators)(request)
+                response = None
+                if etag is not None:
+                    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag, last_modified = validators(request)
+            response = None
+            if etag is not None:
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _finish(request, response, etag, last_modified)
+        return wrapper
+
+    return decorator
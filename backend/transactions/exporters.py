@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = [
+    'id', 'date', 'type', 'amount', 'category_id', 'category__name',
+    'description', 'created_at', 'updated_at'
+]
+
+# The transaction list index read backwards, so exports need no sort
+EXPORT_ORDERING = ('date', 'created_at', 'id')
+
+# Column names as they appear in exported files
+EXPORT_HEADERS = {
+    'category__name': 'category_name',
+}
+
+
+class ExportFormatError(Exception):
+    """The requested export format can't be produced here"""
+
+
+def export_rows(queryset, include_user=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream (header, row iterator) for a transaction queryset in a stable order"""
+    columns = (['user_id'] if include_user else []) + EXPORT_COLUMNS
+    rows = queryset.order_by(*EXPORT_ORDERING).values_list(*columns).iterator(chunk_size=chunk_size)
+    return [EXPORT_HEADERS.get(column, column) for column in columns], rows
+
+
+def stream_csv(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield CSV text a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _json_value(value):
+    # Amounts keep their exact decimal text; dates and datetimes become ISO 8601
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_ndjson(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one JSON object per line, a chunk of rows at a time"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, row)), default=_json_value))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(header):
+    types = {
+        'user_id': pa.int64(),
+        'id': pa.int64(),
+        'date': pa.date32(),
+        'type': pa.string(),
+        'amount': pa.decimal128(10, 2),
+        'category_id': pa.int64(),
+        'category_name': pa.string(),
+        'description': pa.string(),
+        'created_at': pa.timestamp('us', tz='UTC'),
+        'updated_at': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types[name]) for name in header])
+
+
+def stream_parquet(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write one Parquet row group per chunk so only a chunk is ever held in memory"""
+    schema = parquet_schema(header)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write_chunk(chunk):
+        columns = list(zip(*chunk))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        ))
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            write_chunk(chunk)
+            chunk = []
+            yield sink.drain()
+    if chunk:
+        write_chunk(chunk)
+    writer.close()
+    yield sink.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'parquet': (stream_parquet, 'application/vnd.apache.parquet'),
+}
+
+
+def export_stream(queryset, file_format, include_user=False):
+    """(content chunks, content type) for exporting a queryset in the given format"""
+    if file_format not in EXPORT_FORMATS:
+        raise ExportFormatError(f"file_format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if file_format == 'parquet' and pa is None:
+        raise ExportFormatError('Parquet export requires pyarrow to be installed')
+
+    writer, content_type = EXPORT_FORMATS[file_format]
+    header, rows = export_rows(queryset, include_user=include_user)
+    return writer(header, rows), content_type
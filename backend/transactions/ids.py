@@ -0,0 +1,74 @@
+"""Primary keys for sharded tables that stay unique across shards"""
+import threading
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Max
+from smartfinance.sharding import get_config, shard_aliases, sharding_enabled
+from .models import IdSequence
+
+
+class IdAllocator:
+    """Hands out primary keys from blocks reserved in IdSequence, one open block per table"""
+
+    def __init__(self, block_size):
+        self.block_size = block_size
+        # {table: (next id, end of block)}
+        self.blocks = {}
+        self.lock = threading.Lock()
+
+    def allocate(self, model, count=1):
+        table = model._meta.db_table
+        with self.lock:
+            next_id, end = self.blocks.get(table, (0, 0))
+            if end - next_id < count:
+                # What's left of the old block is skipped; ids only need to be unique
+                size = max(self.block_size, count)
+                next_id = self._reserve(model, size)
+                end = next_id + size
+            self.blocks[table] = (next_id + count, end)
+        return range(next_id, next_id + count)
+
+    def _reserve(self, model, size):
+        table = model._meta.db_table
+        sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+        while True:
+            current = sequences.filter(table=table).values_list('next_id', flat=True).first()
+            if current is None:
+                # First block: continue after every id already on any shard
+                start = 1 + max(
+                    model._base_manager.using(alias).aggregate(top=Max('pk'))['top'] or 0
+                    for alias in shard_aliases()
+                )
+                try:
+                    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                        sequences.create(table=table, next_id=start + size)
+                    return start
+                except IntegrityError:
+                    continue
+            # Compare-and-set, so two processes never reserve the same block
+            if sequences.filter(table=table, next_id=current).update(next_id=current + size):
+                return current
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_id_allocator():
+    """The process-wide IdAllocator, reserving settings.SHARDING['ID_BLOCK_SIZE'] ids at a time"""
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = IdAllocator(get_config()['ID_BLOCK_SIZE'])
+    return _allocator
+
+
+def assign_ids(instances):
+    """Give unsaved instances of one moved model allocator ids; a no-op without sharding"""
+    if not sharding_enabled():
+        return
+    pending = [instance for instance in instances if instance.pk is None]
+    if pending:
+        ids = get_id_allocator().allocate(type(pending[0]), len(pending))
+        for instance, pk in zip(pending, ids):
+            instance.pk = pk
@@ -0,0 +1,152 @@
+import csv
+import io
+import re
+from rest_framework.exceptions import ValidationError
+from .bulk import bulk_create_transactions
+from .categories import visible_categories
+from .models import Transaction
+from .serializers import TransactionImportRowSerializer
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+CSV_COLUMNS = {'date', 'amount', 'type', 'category', 'description'}
+REQUIRED_CSV_COLUMNS = {'date', 'amount'}
+
+OFX_TOKEN = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+OFX_CHUNK_SIZE = 64 * 1024
+
+
+class ImportFormatError(Exception):
+    """The uploaded file can't be read as the requested format"""
+
+
+def text_stream(upload):
+    # Wrap the upload's file object so rows are decoded as they are read
+    return io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def parse_csv(upload):
+    """Yield (row number, row) from a CSV with date, amount and optional type/category/description"""
+    reader = csv.reader(text_stream(upload))
+    try:
+        header = [name.strip().lower() for name in next(reader)]
+    except StopIteration:
+        raise ImportFormatError('The file is empty')
+    except csv.Error as exc:
+        raise ImportFormatError(f'Invalid CSV: {exc}')
+
+    missing = REQUIRED_CSV_COLUMNS - set(header)
+    if missing:
+        raise ImportFormatError(f"Missing column(s): {', '.join(sorted(missing))}")
+    columns = [(index, name) for index, name in enumerate(header) if name in CSV_COLUMNS]
+
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            raise ImportFormatError(f'Invalid CSV at line {reader.line_num}: {exc}')
+        if not any(value.strip() for value in values):
+            continue
+        # Blank cells count as missing so optional columns fall back to their defaults
+        yield reader.line_num, {
+            name: values[index].strip()
+            for index, name in columns
+            if index < len(values) and values[index].strip()
+        }
+
+
+def parse_ofx(upload):
+    """Yield (row number, row) for each STMTTRN in an OFX/QFX statement (SGML or XML)"""
+    stream = text_stream(upload)
+    buffer = ''
+    current = None
+    number = 0
+    while True:
+        chunk = stream.read(OFX_CHUNK_SIZE)
+        buffer += chunk
+        # The last tag may continue in the next chunk, so stop short of it
+        end = len(buffer) if not chunk else max(buffer.rfind('<'), 0)
+        for match in OFX_TOKEN.finditer(buffer, 0, end):
+            closing, tag, value = match.group(1), match.group(2).upper(), match.group(3).strip()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {}
+                elif current is not None:
+                    number += 1
+                    yield number, ofx_row(current)
+                    current = None
+            elif current is not None and not closing and value:
+                current[tag] = value
+        buffer = buffer[end:]
+        if not chunk:
+            return
+
+
+def ofx_row(fields):
+    row = {}
+    if 'DTPOSTED' in fields:
+        posted = fields['DTPOSTED'][:8]
+        row['date'] = f'{posted[:4]}-{posted[4:6]}-{posted[6:8]}'
+    if 'TRNAMT' in fields:
+        row['amount'] = fields['TRNAMT'].replace(',', '.')
+    description = ' - '.join(fields[tag] for tag in ('NAME', 'MEMO') if fields.get(tag))
+    if description:
+        row['description'] = description
+    return row
+
+
+IMPORT_PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+    'qfx': parse_ofx,
+}
+
+
+def import_transactions(user, rows, batch_size=IMPORT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """Validate and bulk insert parsed rows, one DB transaction per batch"""
+    serializer = TransactionImportRowSerializer()
+    # Case-insensitive names; a user's own category wins over a default
+    categories = visible_categories(user.pk)
+    result = {'created': 0, 'failed': 0, 'errors': []}
+    batch = []
+
+    def flush():
+        result['created'] += len(bulk_create_transactions(batch, batch_size=batch_size))
+        batch.clear()
+
+    try:
+        for row_number, row in rows:
+            try:
+                data = serializer.run_validation(row)
+                category_id = None
+                if data['category']:
+                    category_id = categories.id_for(data['category'])
+                    if category_id is None:
+                        raise ValidationError({'category': [f"Unknown category '{data['category']}'"]})
+            except ValidationError as exc:
+                result['failed'] += 1
+                if len(result['errors']) < max_errors:
+                    result['errors'].append({'row': row_number, 'errors': exc.detail})
+                continue
+
+            batch.append(Transaction(
+                user=user,
+                type=data['type'],
+                amount=data['amount'],
+                category_id=category_id,
+                description=data['description'],
+                date=data['date']
+            ))
+            if len(batch) >= batch_size:
+                flush()
+    except ImportFormatError as exc:
+        # Batches already written stay written; report where the file broke
+        result['error'] = str(exc)
+
+    if batch:
+        flush()
+    result['errors_truncated'] = result['failed'] > len(result['errors'])
+    return result
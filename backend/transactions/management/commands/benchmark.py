@@ -0,0 +1,238 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from ml_insights.feature_cache import get_feature_cache
+from transactions.synthetic import generate_user
+
+PASSWORD = 'benchmark-password'
+
+
+def _scenarios(user):
+    today = date.today()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    return {
+        'login': ('post', '/api/auth/login/', {'username': user.username, 'password': PASSWORD}),
+        'transactions': ('get', '/api/transactions/', None),
+        'summary': ('get', f'/api/transactions/summary/?start_date={year_ago}&end_date={today}&group_by=month', None),
+        'budgets': ('get', '/api/transactions/budgets/', None),
+        'predict-expenses': ('get', '/api/ml/predict-expenses/', None),
+        'insights': ('get', '/api/ml/insights/', None),
+        'predict-category': ('post', '/api/ml/predict-category/', {'description': 'dinner with friends', 'amount': 42}),
+        'dashboard': ('get', '/api/dashboard/', None),
+    }
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+@contextmanager
+def benchmark_environment():
+    """Run against test databases, never the configured ones
+
+    The test databases are kept between runs, so benchmark users are
+    generated once. SQLite ones are files next to the real database rather
+    than in memory, which would time differently. Cache keys and model
+    artifacts get their own prefix and directory, since benchmark user ids
+    overlap real ones.
+    """
+    for conn in connections.all():
+        test_settings = conn.settings_dict['TEST']
+        if conn.vendor == 'sqlite' and not test_settings['NAME'] and not conn.is_in_memory_db():
+            path = Path(conn.settings_dict['NAME'])
+            test_settings['NAME'] = str(path.with_name(f'test_{path.name}'))
+
+    caches = {
+        alias: {**config, 'KEY_PREFIX': f"benchmark{config.get('KEY_PREFIX', '')}"}
+        for alias, config in settings.CACHES.items()
+    }
+    with override_settings(CACHES=caches, ML_MODEL_DIR=Path(settings.ML_MODEL_DIR) / 'benchmark'):
+        # Serializing kept data for TransactionTestCase rollbacks would read every row
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=True, serialized_aliases=set())
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=True)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the API hot paths on synthetic users in test databases; compare against a '
+            'baseline JSON file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, action='append', dest='sizes',
+                            help='Transactions of a benchmark user (can be repeated; default 1000 and 10000)')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (can be repeated)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests before timing')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the ML feature cache before every request')
+        parser.add_argument('--seed', type=int, default=0, help='Synthetic data seed')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Fail on regressions against this earlier --output file')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative p95 latency / peak memory increase (default 0.2 = 20%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Ignore p95 increases smaller than this, which are noise')
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        sizes = options['sizes'] or [1000, 10000]
+        results = {}
+        for size in sizes:
+            user = self.benchmark_user(size, options['seed'])
+            scenarios = _scenarios(user)
+            unknown = set(options['scenarios'] or ()) - set(scenarios)
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}. "
+                                   f"Choose from: {', '.join(scenarios)}")
+            for name, scenario in scenarios.items():
+                if options['scenarios'] and name not in options['scenarios']:
+                    continue
+                key = f'{name}@{size}'
+                results[key] = self.run_scenario(user, *scenario, options)
+                self.stdout.write(
+                    f"{key:<28} p50 {results[key]['p50_ms']:>9.2f} ms  p95 {results[key]['p95_ms']:>9.2f} ms  "
+                    f"{results[key]['queries']:>4} queries  {results[key]['peak_memory_kb']:>9} KiB peak"
+                )
+
+        report = {
+            'meta': {
+                'commit': _commit(),
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if options['baseline']:
+            self.compare(options['baseline'], results, options['threshold'], options['min_delta_ms'])
+
+    def benchmark_user(self, size, seed):
+        """The benchmark user for `size` transactions, generated on first use and reused after"""
+        username = f'benchmark-{size}-{seed}'
+        user = get_user_model().objects.filter(username=username).first()
+        if user is not None and user.transactions.count() != size:
+            user.delete()
+            user = None
+        if user is None:
+            self.stdout.write(f"Generating {username}...")
+            started = time.monotonic()
+            user = generate_user(username, size, seed=seed, password=PASSWORD)
+            self.stdout.write(f"  {size} transactions in {time.monotonic() - started:.1f}s")
+        return user
+
+    def run_scenario(self, user, method, path, data, options):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+        def request():
+            if options['cold']:
+                get_feature_cache().clear()
+            if method == 'post':
+                response = client.post(path, data, content_type='application/json')
+            else:
+                response = client.get(path)
+            # Every response, warmup included: timings of errors would be meaningless
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{method.upper()} {path} returned {response.status_code}: {response.content[:200]}"
+                )
+            return response
+
+        for _ in range(options['warmup']):
+            request()
+
+        timings = []
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # Replicas included: analytics reads may run there
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(count_query))
+            for _ in range(max(options['iterations'], 1)):
+                started = time.perf_counter()
+                request()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        # Separate pass: tracing allocations slows the request down
+        tracemalloc.start()
+        try:
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': round(len(queries) / len(timings), 1),
+            'peak_memory_kb': peak // 1024,
+        }
+
+    def compare(self, baseline_path, results, threshold, min_delta_ms):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        regressions = []
+        for key, current in results.items():
+            before = baseline.get(key)
+            if before is None:
+                continue
+            if current['p95_ms'] > before['p95_ms'] * (1 + threshold) and \
+                    current['p95_ms'] - before['p95_ms'] >= min_delta_ms:
+                regressions.append(f"{key}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+            if current['queries'] > before['queries']:
+                regressions.append(f"{key}: queries {before['queries']} -> {current['queries']}")
+            if current['peak_memory_kb'] > before['peak_memory_kb'] * (1 + threshold) and \
+                    current['peak_memory_kb'] - before['peak_memory_kb'] >= 64:
+                regressions.append(
+                    f"{key}: peak memory {before['peak_memory_kb']} -> {current['peak_memory_kb']} KiB"
+                )
+
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f"✗ {regression}"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {baseline_path}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
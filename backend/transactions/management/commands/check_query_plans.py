@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the endpoint querysets and fail if any plan uses a full scan or a temporary sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=1, help='User id to plan the queries for')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        try:
+            with use_shard(shard_for_user(options['user'])):
+                results = check_query_plans(options['user'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        failures = 0
+        for name, (plan, problems) in results.items():
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"✗ {name}"))
+                for problem in problems:
+                    self.stdout.write(f"    {problem}")
+            else:
+                self.stdout.write(f"✓ {name}")
+            if options['verbose_plans'] or problems:
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+
+        if failures:
+            raise CommandError(f"{failures} queryset(s) have plan regressions")
+        self.stdout.write(self.style.SUCCESS('All query plans use indexes'))
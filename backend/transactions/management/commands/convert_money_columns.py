@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from smartfinance.money import convert_money_columns, decimal_money_columns
+
+
+class Command(BaseCommand):
+    help = ("Convert money columns still stored as decimals to whole minor units (cents), "
+            "on every database that holds them; run it before migrate when upgrading")
+    # The money column check fails until this has run
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='aliases',
+                            help='Limit to this database alias (can be repeated)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report which columns would change')
+
+    def handle(self, *args, **options):
+        converted = 0
+        for alias in options['aliases'] or connections:
+            connection = connections[alias]
+            for model, fields in decimal_money_columns(connection).items():
+                columns = ', '.join(f"{model._meta.db_table}.{field.column}" for field in fields)
+                if not options['dry_run']:
+                    convert_money_columns(connection, model, fields)
+                self.stdout.write(f"{alias}: {columns}")
+                converted += len(fields)
+
+        verb = 'would be converted' if options['dry_run'] else 'converted'
+        self.stdout.write(self.style.SUCCESS(f"{converted} column(s) {verb}"))
@@ -0,0 +1,70 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from transactions.exporters import EXPORT_FORMATS, ExportFormatError, export_stream
+from smartfinance.sharding import shard_aliases, shard_groups, sharding_enabled
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Stream transactions to CSV, NDJSON or Parquet with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (can be repeated); defaults to all users')
+        parser.add_argument('--format', dest='file_format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write; defaults to stdout for csv and ndjson')
+        parser.add_argument('--start-date', help='First date to include (with --end-date)')
+        parser.add_argument('--end-date', help='Last date to include (with --start-date)')
+        parser.add_argument('--type', dest='trans_type', choices=['income', 'expense'])
+        parser.add_argument('--category', type=int, help='Category id')
+        parser.add_argument('--shard', help="Shard to export from when sharding is on; implied by --user")
+
+    def shard(self, options):
+        # One stream reads one database
+        if options['shard']:
+            if options['shard'] not in shard_aliases():
+                raise CommandError(f"Unknown shard '{options['shard']}' (use one of: {', '.join(shard_aliases())})")
+            if options['user_ids'] and set(shard_groups(options['user_ids'])) != {options['shard']}:
+                raise CommandError(f"Not all of the users live on {options['shard']}")
+            return options['shard']
+        if not options['user_ids']:
+            raise CommandError('Sharding is on: pass --shard (one export per shard) or --user')
+        shards = list(shard_groups(options['user_ids']))
+        if len(shards) > 1:
+            raise CommandError(f"The users live on several shards ({', '.join(shards)}); export each with --shard")
+        return shards[0]
+
+    def handle(self, *args, **options):
+        file_format = options['file_format']
+        if file_format == 'parquet' and not options['output']:
+            raise CommandError('Parquet exports need --output')
+
+        queryset = Transaction.objects.matching(
+            start_date=options['start_date'],
+            end_date=options['end_date'],
+            trans_type=options['trans_type'],
+            category=options['category']
+        )
+        if options['user_ids']:
+            queryset = queryset.filter(user_id__in=options['user_ids'])
+        if sharding_enabled():
+            queryset = queryset.using(self.shard(options))
+
+        try:
+            # A per-user export needs no user column; the all-users (BI) export does
+            content, _ = export_stream(queryset, file_format, include_user=options['user_ids'] is None)
+        except ExportFormatError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            if file_format == 'parquet':
+                output = open(options['output'], 'wb')
+            else:
+                output = open(options['output'], 'w', newline='', encoding='utf-8')
+            with output:
+                for chunk in content:
+                    output.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported transactions to {options['output']}"))
+        else:
+            for chunk in content:
+                sys.stdout.write(chunk)
@@ -0,0 +1,84 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from accounts.authentication import user_cache_settings
+from smartfinance.sharding import get_ring, sharding_enabled
+from transactions.rollups import REBUILD_BATCH_SIZE
+from transactions.sharding import copy_user_data, delete_user_data, sync_default_categories
+from transactions.versions import bump_data_versions, versions_shared
+
+
+class Command(BaseCommand):
+    help = ("Move users whose data isn't on the shard the hash ring picks for them, e.g. after adding "
+            "a shard; each user's writes pause while their rows are copied")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (can be repeated)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report which users would move')
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help='Rows per insert')
+        parser.add_argument('--grace', type=float,
+                            help='Seconds to wait for in-flight requests before copying and before deleting '
+                                 '(default and minimum: AUTH_USER_CACHE TTL)')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is off: set DATABASE_SHARD_URLS')
+
+        ring = get_ring()
+        users = get_user_model().objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        if options['user_ids']:
+            users = users.filter(pk__in=options['user_ids'])
+        # (user, target); users left frozen by an interrupted run are finished too
+        moves = [
+            (user, ring.node_for(user.pk))
+            for user in users.only('pk', 'shard', 'shard_moving').iterator()
+            if (user.shard or DEFAULT_DB_ALIAS) != ring.node_for(user.pk) or user.shard_moving
+        ]
+
+        if options['dry_run']:
+            for user, target in moves:
+                self.stdout.write(f"user {user.pk}: {user.shard or DEFAULT_DB_ALIAS} -> {target}")
+            self.stdout.write(self.style.SUCCESS(f"{len(moves)} user(s) would move"))
+            return
+
+        # API processes learn of a move through the profile version, and drop cached
+        # users' shards at the latest after the TTL; the waits must cover both
+        if not versions_shared():
+            raise CommandError('Data versions are in a process-local cache, which API processes '
+                               'cannot see: set CACHE_BACKEND to a shared cache')
+        ttl = user_cache_settings()['TTL']
+        if options['grace'] is None:
+            options['grace'] = ttl
+        elif options['grace'] < ttl:
+            raise CommandError(f"--grace must be at least the AUTH_USER_CACHE TTL ({ttl}s)")
+
+        changed = sync_default_categories()
+        if changed:
+            self.stdout.write(f"Synced default categories to {', '.join(changed)}")
+
+        for user, target in moves:
+            self.move(user, target, options)
+        self.stdout.write(self.style.SUCCESS(f"Moved {len(moves)} user(s)"))
+
+    def move(self, user, target, options):
+        source = user.shard or DEFAULT_DB_ALIAS
+        # Freeze: authentication reads shard_moving from the database for writes and turns
+        # them away; the wait lets writes already past that check finish
+        get_user_model().objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk).update(shard_moving=True)
+        bump_data_versions([user.pk], 'profile')
+        time.sleep(options['grace'])
+
+        if source != target:
+            copy_user_data(user.pk, source, target, options['batch_size'])
+        # save() bumps the profile version, so requests pick up the new shard at once
+        user.shard = target
+        user.shard_moving = False
+        user.save(update_fields=['shard', 'shard_moving'])
+
+        if source != target:
+            # Reads that started on the old shard finish before its rows go
+            time.sleep(options['grace'])
+            delete_user_data(user.pk, source)
+        self.stdout.write(f"user {user.pk}: {source} -> {target}")
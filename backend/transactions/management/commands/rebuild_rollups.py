@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from smartfinance.sharding import shard_groups, use_shard
+from transactions.rollups import find_drift, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the transaction rollup table or check it for drift against raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (can be repeated)')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift; exit with an error if any is found')
+
+    def handle(self, *args, **options):
+        # One pass per shard, each over its own users
+        groups = shard_groups(options['user_ids']).items()
+
+        if options['check']:
+            drift = []
+            for alias, user_ids in groups:
+                with use_shard(alias):
+                    drift.extend(find_drift(user_ids))
+            for entry in drift[:50]:
+                self.stdout.write(
+                    f"{entry['key']}: expected {entry['expected']}, stored {entry['stored']}"
+                )
+            if drift:
+                raise CommandError(f"Found {len(drift)} drifted rollup rows")
+            self.stdout.write(self.style.SUCCESS('Rollups are consistent with transactions'))
+            return
+
+        created = 0
+        for alias, user_ids in groups:
+            with use_shard(alias):
+                created += rebuild_rollups(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} rollup rows"))
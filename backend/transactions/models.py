@@ -1,9 +1,21 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from smartfinance.money import MoneyField
 
 User = get_user_model()
 
 
+class CategoryQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """The user's own categories plus the shared defaults"""
+        # is_default__in rather than is_default=True: SQLite renders the latter as a
+        # bare column, which stops it using the index for this OR. A single-table OR
+        # can't produce duplicates, so no DISTINCT is needed.
+        return self.filter(models.Q(user=user) | models.Q(is_default__in=[True]))
+
+
 class Category(models.Model):
     CATEGORY_TYPES = (
         ('income', 'Income'),
@@ -18,14 +30,32 @@ class Category(models.Model):
     is_default = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Categories'
         unique_together = ['name', 'user']
+        indexes = [
+            models.Index(fields=['is_default'], name='category_default_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.type})"
 
 
+class TransactionQuerySet(models.QuerySet):
+    def matching(self, start_date=None, end_date=None, trans_type=None, category=None):
+        """Apply the list endpoint's optional filters"""
+        queryset = self
+        if start_date and end_date:
+            queryset = queryset.filter(date__gte=start_date, date__lte=end_date)
+        if trans_type:
+            queryset = queryset.filter(type=trans_type)
+        if category:
+            queryset = queryset.filter(category_id=category)
+        return queryset
+
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('income', 'Income'),
@@ -34,32 +64,79 @@ class Transaction(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
     type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='transactions')
     description = models.TextField(blank=True)
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Date-range filters, the default ordering and keyset pagination over a user's history
+            models.Index(fields=['user', '-date', '-created_at', '-id'], name='txn_user_date_idx'),
+            models.Index(fields=['user', 'type', 'date'], name='txn_user_type_date_idx'),
+            models.Index(fields=['user', 'category', 'date'], name='txn_user_category_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.type} - {self.amount}"
 
 
+class BudgetQuerySet(models.QuerySet):
+    def with_spent_amount(self):
+        """Annotate each budget with its expense total over the budget period"""
+        # Here, as rollups imports this module
+        from .rollups import rollups_enabled
+
+        if rollups_enabled():
+            spent = TransactionRollup.objects.filter(
+                user=OuterRef('user'),
+                category=OuterRef('category'),
+                type='expense',
+                granularity='day',
+                period__gte=OuterRef('start_date'),
+                period__lte=OuterRef('end_date')
+            ).order_by().values('category').annotate(total=Sum('total')).values('total')
+        else:
+            spent = Transaction.objects.filter(
+                user=OuterRef('user'),
+                category=OuterRef('category'),
+                type='expense',
+                date__gte=OuterRef('start_date'),
+                date__lte=OuterRef('end_date')
+            ).order_by().values('category').annotate(total=Sum('amount')).values('total')
+
+        return self.annotate(
+            spent_amount=Coalesce(
+                Subquery(spent),
+                Value(0),
+                output_field=MoneyField(max_digits=14)
+            )
+        )
+
+
 class Budget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='budgets')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     period = models.CharField(max_length=20, default='monthly')
     start_date = models.DateField()
     end_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BudgetQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='budget_user_created_idx'),
+            models.Index(fields=['user', 'category', 'start_date'], name='budget_user_category_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.category.name} - {self.amount}"
@@ -68,8 +145,8 @@ class Budget(models.Model):
 class SavingsGoal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='savings_goals')
     name = models.CharField(max_length=200)
-    target_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    current_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    target_amount = MoneyField()
+    current_amount = MoneyField(default=0)
     target_date = models.DateField()
     description = models.TextField(blank=True)
     is_completed = models.BooleanField(default=False)
@@ -78,6 +155,61 @@ class SavingsGoal(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='goal_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.name}"
+
+
+class TransactionRollup(models.Model):
+    GRANULARITIES = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name='rollups')
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    granularity = models.CharField(max_length=5, choices=GRANULARITIES)
+    period = models.DateField()
+    total = MoneyField(max_digits=14, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'period', 'category', 'type'],
+                name='unique_transaction_rollup'
+            ),
+            # NULLs never compare equal in the constraint above, so uncategorized
+            # rows need their own or concurrent first writes would both insert
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'period', 'type'],
+                condition=models.Q(category__isnull=True),
+                name='unique_uncategorized_rollup'
+            ),
+        ]
+        indexes = [
+            # Budget spend looks up one category's expense days
+            models.Index(fields=['user', 'category', 'type', 'granularity', 'period'],
+                         name='rollup_user_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.granularity} {self.period} - {self.type} - {self.total}"
+
+
+class IdSequence(models.Model):
+    """Next unallocated id of a sharded table, on 'default'
+
+    With sharding on, ids come from here in blocks rather than from each
+    shard's own sequence, so they stay unique across shards and rows can move
+    between them unchanged.
+    """
+    table = models.CharField(max_length=100, primary_key=True)
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.table} - {self.next_id}"
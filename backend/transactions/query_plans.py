@@ -0,0 +1,88 @@
+import re
+from datetime import date, timedelta
+from django.db import connections, router, transaction
+from django.db.models import Q, Sum
+from .exporters import EXPORT_ORDERING
+from .models import Category, Transaction, Budget, SavingsGoal, TransactionRollup
+from .pagination import TransactionKeysetPagination
+from .summary import summary_rows
+
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)'),
+    'postgresql': re.compile(r'\bSeq Scan on\b'),
+}
+
+TEMP_SORT_PATTERNS = {
+    'sqlite': re.compile(r'\bUSE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY\b'),
+    'postgresql': re.compile(r'\b(?:Incremental )?Sort\b(?! Key| Method)'),
+}
+
+
+def endpoint_querysets(user_id):
+    """(name, queryset, grouped) for each hot query issued by the API endpoints"""
+    end_date = date.today()
+    start_date = end_date - timedelta(days=30)
+    user_transactions = Transaction.objects.filter(user_id=user_id)
+    day_rollups = TransactionRollup.objects.filter(
+        user_id=user_id,
+        granularity='day',
+        period__gte=start_date,
+        period__lte=end_date
+    )
+
+    return [
+        ('category list', Category.objects.visible_to(user_id), False),
+        ('transaction list', user_transactions, False),
+        ('transaction list page', user_transactions.order_by(*TransactionKeysetPagination.ordering).filter(
+            Q(date__lt=end_date) | Q(date=end_date, id__lt=0), date__lte=end_date), False),
+        ('transaction list by date', user_transactions.filter(date__gte=start_date, date__lte=end_date), False),
+        ('transaction list by type', user_transactions.filter(type='expense'), False),
+        ('transaction list by category', user_transactions.filter(category_id=0), False),
+        ('transaction export', user_transactions.order_by(*EXPORT_ORDERING), False),
+        ('summary', summary_rows(user_transactions.filter(date__gte=start_date, date__lte=end_date)), True),
+        ('summary (rollups)', summary_rows(day_rollups, date_field='period', amount_field='total'), True),
+        ('summary by month (rollups)',
+         summary_rows(day_rollups, group_by='month', date_field='period', amount_field='total'), True),
+        ('budget list', Budget.objects.filter(user_id=user_id).select_related('category').with_spent_amount(), False),
+        ('savings goal list', SavingsGoal.objects.filter(user_id=user_id), False),
+        ('ml transactions', user_transactions.order_by('date'), False),
+        ('ml monthly rollups', TransactionRollup.objects.filter(user_id=user_id, granularity='month').order_by().values(
+            'period', 'type').annotate(total=Sum('total')), True),
+        ('ml daily rollups', TransactionRollup.objects.filter(user_id=user_id, granularity='day').values_list(
+            'period', 'type', 'category__name', 'total', 'count'), False),
+    ]
+
+
+def plan_problems(plan, vendor, grouped=False):
+    """Return the plan lines that fall back to a full scan or a temporary sort"""
+    problems = []
+    full_scan = FULL_SCAN_PATTERNS[vendor]
+    temp_sort = TEMP_SORT_PATTERNS[vendor]
+    for line in plan.splitlines():
+        if full_scan.search(line):
+            problems.append(f"full scan: {line.strip()}")
+        # Grouped queries may sort to aggregate; only row ordering must come from an index
+        elif not grouped and temp_sort.search(line):
+            problems.append(f"temp sort: {line.strip()}")
+    return problems
+
+
+def check_query_plans(user_id):
+    """EXPLAIN every endpoint queryset and collect plan regressions by name"""
+    # The user's shard when sharding is on
+    connection = connections[router.db_for_read(Transaction)]
+    vendor = connection.vendor
+    if vendor not in FULL_SCAN_PATTERNS:
+        raise ValueError(f"Query plan checks are not supported on {vendor}")
+
+    results = {}
+    with transaction.atomic(using=connection.alias):
+        if vendor == 'postgresql':
+            # Small development tables make sequential scans look cheap; force the
+            # planner to show whether an index path exists at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset, grouped in endpoint_querysets(user_id):
+            plan = queryset.explain()
+            results[name] = (plan, plan_problems(plan, vendor, grouped))
+    return results
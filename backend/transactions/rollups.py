@@ -0,0 +1,210 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+from smartfinance.money import Minor, from_minor, to_minor
+from .models import Transaction, TransactionRollup
+
+GRANULARITY_TRUNCS = {
+    'day': TruncDay,
+    'month': TruncMonth,
+}
+
+REBUILD_BATCH_SIZE = 1000
+
+# Above this many touched rollup rows, read them once and write in bulk
+BULK_DELTA_THRESHOLD = 20
+
+
+def rollups_enabled():
+    return getattr(settings, 'USE_TRANSACTION_ROLLUPS', True)
+
+
+def period_start(granularity, date):
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+
+# values_list() fields matching transaction_state()
+STATE_FIELDS = ('user_id', 'category_id', 'type', 'date', Minor('amount'))
+
+
+def transaction_state(trans):
+    """Snapshot of the fields a rollup row depends on, the amount in minor units"""
+    return (trans.user_id, trans.category_id, trans.type, trans.date, to_minor(trans.amount))
+
+
+def apply_states(states, sign=1):
+    """Add (or with sign=-1 remove) transaction snapshots to the rollup table"""
+    # [minor units, count] per rollup row
+    deltas = defaultdict(lambda: [0, 0])
+    for user_id, category_id, trans_type, date, amount in states:
+        for granularity in GRANULARITY_TRUNCS:
+            key = (user_id, category_id, trans_type, granularity, period_start(granularity, date))
+            deltas[key][0] += amount * sign
+            deltas[key][1] += sign
+
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    with transaction.atomic(using=router.db_for_write(TransactionRollup)):
+        if len(deltas) > BULK_DELTA_THRESHOLD:
+            _apply_deltas_bulk(deltas)
+        else:
+            for key, (total, count) in deltas.items():
+                _apply_delta(key, total, count)
+
+
+def _apply_delta(key, total, count):
+    user_id, category_id, trans_type, granularity, period = key
+    rows = TransactionRollup.objects.filter(
+        user_id=user_id,
+        category_id=category_id,
+        type=trans_type,
+        granularity=granularity,
+        period=period
+    )
+
+    if rows.update(total=F('total') + total, count=F('count') + count):
+        if count < 0:
+            rows.filter(count__lte=0).delete()
+        return
+
+    try:
+        with transaction.atomic(using=router.db_for_write(TransactionRollup)):
+            TransactionRollup.objects.create(
+                user_id=user_id,
+                category_id=category_id,
+                type=trans_type,
+                granularity=granularity,
+                period=period,
+                total=from_minor(total),
+                count=count
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(total=F('total') + total, count=F('count') + count)
+
+
+def _apply_deltas_bulk(deltas):
+    """Set-based _apply_delta for large batches: one locking read, then bulk writes"""
+    periods = [key[4] for key in deltas]
+    rows = TransactionRollup.objects.select_for_update().filter(
+        user_id__in={key[0] for key in deltas},
+        period__gte=min(periods),
+        period__lte=max(periods)
+    )
+    existing = {
+        (row.user_id, row.category_id, row.type, row.granularity, row.period): row
+        for row in rows
+    }
+
+    replaced, missing = [], {}
+    for key, (total, count) in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            missing[key] = (total, count)
+            continue
+        replaced.append(row)
+        row.total += from_minor(total)
+        row.count += count
+
+    # Rewriting the locked rows (delete + insert) is far cheaper than a CASE-based
+    # bulk_update, and nothing references rollup ids
+    if replaced:
+        TransactionRollup.objects.filter(pk__in=[row.pk for row in replaced]).delete()
+    for row in replaced:
+        row.pk = None
+    TransactionRollup.objects.bulk_create(
+        [row for row in replaced if row.count > 0], batch_size=REBUILD_BATCH_SIZE
+    )
+
+    if not missing:
+        return
+    try:
+        with transaction.atomic(using=router.db_for_write(TransactionRollup)):
+            TransactionRollup.objects.bulk_create([
+                TransactionRollup(
+                    user_id=user_id,
+                    category_id=category_id,
+                    type=trans_type,
+                    granularity=granularity,
+                    period=period,
+                    total=from_minor(total),
+                    count=count
+                )
+                for (user_id, category_id, trans_type, granularity, period), (total, count) in missing.items()
+            ], batch_size=REBUILD_BATCH_SIZE)
+    except IntegrityError:
+        # Another writer created some of these rows first; merge key by key
+        for key, (total, count) in missing.items():
+            _apply_delta(key, total, count)
+
+
+def _expected_rollups(user_ids=None):
+    """Yield rollup rows computed from the raw transaction table"""
+    transactions = Transaction.objects.order_by()
+    if user_ids is not None:
+        transactions = transactions.filter(user_id__in=user_ids)
+
+    for granularity, trunc in GRANULARITY_TRUNCS.items():
+        rows = transactions.annotate(bucket=trunc('date')).values(
+            'user_id', 'category_id', 'type', 'bucket'
+        ).annotate(total=Sum('amount'), count=Count('id'))
+
+        for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            yield TransactionRollup(
+                user_id=row['user_id'],
+                category_id=row['category_id'],
+                type=row['type'],
+                granularity=granularity,
+                period=row['bucket'],
+                total=row['total'],
+                count=row['count']
+            )
+
+
+def rebuild_rollups(user_ids=None):
+    """Recompute the rollup table from scratch, optionally for a subset of users"""
+    existing = TransactionRollup.objects.all()
+    if user_ids is not None:
+        existing = existing.filter(user_id__in=user_ids)
+
+    created = 0
+    with transaction.atomic(using=router.db_for_write(TransactionRollup)):
+        existing.delete()
+        batch = []
+        for rollup in _expected_rollups(user_ids):
+            batch.append(rollup)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                TransactionRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            TransactionRollup.objects.bulk_create(batch)
+            created += len(batch)
+
+    return created
+
+
+def find_drift(user_ids=None):
+    """Compare stored rollups with the raw transactions and return mismatched keys"""
+    def key(row):
+        return (row.user_id, row.category_id, row.type, row.granularity, row.period)
+
+    expected = {key(row): (row.total, row.count) for row in _expected_rollups(user_ids)}
+
+    stored_rows = TransactionRollup.objects.all()
+    if user_ids is not None:
+        stored_rows = stored_rows.filter(user_id__in=user_ids)
+    stored = {key(row): (row.total, row.count) for row in stored_rows.iterator(chunk_size=REBUILD_BATCH_SIZE)}
+
+    drift = []
+    for rollup_key in expected.keys() | stored.keys():
+        if expected.get(rollup_key) != stored.get(rollup_key):
+            drift.append({
+                'key': rollup_key,
+                'expected': expected.get(rollup_key),
+                'stored': stored.get(rollup_key),
+            })
+    return drift
@@ -1,17 +1,77 @@
 from rest_framework import serializers
+from smartfinance.instrumentation import TimedSerializerMixin
+from smartfinance.money import MoneySerializerMixin
+from .categories import visible_categories
 from .models import Category, Transaction, Budget, SavingsGoal
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Limit read responses to the fields named in the ?fields= query parameter"""
+    fields_query_param = 'fields'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'), self.fields_query_param)
+        if requested is None:
+            return
+
+        unknown = requested - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({
+                self.fields_query_param: f"Unknown field(s): {', '.join(sorted(unknown))}"
+            })
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
+
+def requested_fields(request, param='fields'):
+    """Field names from a GET request's ?fields= parameter, or None for all fields"""
+    if request is None or request.method != 'GET':
+        return None
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def category_of(serializer, obj):
+    """obj's category from the category directory, looked up once per user and serialization"""
+    if obj.category_id is None:
+        return None
+    views = serializer.context.setdefault('category_views', {})
+    view = views.get(obj.user_id)
+    if view is None:
+        view = views[obj.user_id] = visible_categories(obj.user_id)
+    return view.get(obj.category_id)
+
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'type', 'icon', 'color', 'is_default', 'created_at']
         read_only_fields = ['id', 'created_at']
 
 
-class TransactionSerializer(serializers.ModelSerializer):
-    category_name = serializers.CharField(source='category.name', read_only=True)
-    category_color = serializers.CharField(source='category.color', read_only=True)
+class ContextCategoryField(serializers.PrimaryKeyRelatedField):
+    """Resolves category ids from a {id: Category} map in the serializer context when one is given"""
+
+    def to_internal_value(self, data):
+        categories = self.context.get('categories')
+        if categories is None:
+            return super().to_internal_value(data)
+        try:
+            return categories[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class TransactionSerializer(TimedSerializerMixin, SparseFieldsetMixin, MoneySerializerMixin,
+                            serializers.ModelSerializer):
+    category = ContextCategoryField(queryset=Category.objects.all(), allow_null=True, required=False)
+    category_name = serializers.SerializerMethodField()
+    category_color = serializers.SerializerMethodField()
 
     class Meta:
         model = Transaction
@@ -19,9 +79,33 @@ class TransactionSerializer(serializers.ModelSerializer):
                   'description', 'date', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_category_name(self, obj):
+        category = category_of(self, obj)
+        return category.name if category is not None else None
+
+    def get_category_color(self, obj):
+        category = category_of(self, obj)
+        return category.color if category is not None else None
+
+
+class TransactionImportRowSerializer(serializers.Serializer):
+    """One row of an imported statement; category is a name resolved by the importer"""
+    date = serializers.DateField(input_formats=['iso-8601', '%m/%d/%Y', '%d.%m.%Y'])
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPES, required=False)
+    category = serializers.CharField(required=False, allow_blank=True, default='')
+    description = serializers.CharField(required=False, allow_blank=True, default='')
 
-class BudgetSerializer(serializers.ModelSerializer):
-    category_name = serializers.CharField(source='category.name', read_only=True)
+    def validate(self, attrs):
+        # Bank exports usually sign amounts instead of giving a type
+        if 'type' not in attrs:
+            attrs['type'] = 'expense' if attrs['amount'] < 0 else 'income'
+        attrs['amount'] = abs(attrs['amount'])
+        return attrs
+
+
+class BudgetSerializer(TimedSerializerMixin, MoneySerializerMixin, serializers.ModelSerializer):
+    category_name = serializers.SerializerMethodField()
     spent_amount = serializers.SerializerMethodField()
     percentage_used = serializers.SerializerMethodField()
 
@@ -31,16 +115,20 @@ class BudgetSerializer(serializers.ModelSerializer):
                   'percentage_used', 'period', 'start_date', 'end_date', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def get_category_name(self, obj):
+        category = category_of(self, obj)
+        return category.name if category is not None else None
+
     def get_spent_amount(self, obj):
-        transactions = Transaction.objects.filter(
-            user=obj.user,
-            category=obj.category,
-            type='expense',
-            date__gte=obj.start_date,
-            date__lte=obj.end_date
-        )
-        total = sum(t.amount for t in transactions)
-        return float(total)
+        # Budget querysets from the viewset carry a with_spent_amount() annotation;
+        # freshly created or updated instances fall back to a single aggregate query
+        spent = getattr(obj, 'spent_amount', None)
+        if spent is None:
+            spent = Budget.objects.filter(pk=obj.pk).with_spent_amount().values_list(
+                'spent_amount', flat=True
+            ).first() or 0
+            obj.spent_amount = spent
+        return float(spent)
 
     def get_percentage_used(self, obj):
         spent = self.get_spent_amount(obj)
@@ -48,8 +136,14 @@ class BudgetSerializer(serializers.ModelSerializer):
             return round((spent / float(obj.amount)) * 100, 2)
         return 0
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        # Category or period may have changed, so the annotated spend is stale
+        vars(instance).pop('spent_amount', None)
+        return instance
+
 
-class SavingsGoalSerializer(serializers.ModelSerializer):
+class SavingsGoalSerializer(TimedSerializerMixin, MoneySerializerMixin, serializers.ModelSerializer):
     progress_percentage = serializers.SerializerMethodField()
 
     class Meta:
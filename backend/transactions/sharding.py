@@ -0,0 +1,108 @@
+from contextvars import ContextVar
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, transaction
+from smartfinance.sharding import copy_to, home_shard, shard_aliases, use_shard
+from .bulk import suppress_row_signals
+from .models import Budget, Category, SavingsGoal, Transaction
+from .rollups import REBUILD_BATCH_SIZE, rebuild_rollups
+
+# A user's rows that move with them, parents first; rollups and insight
+# accumulators are derived, so they are rebuilt on the new shard instead
+MOVED_MODELS = (Category, Transaction, Budget, SavingsGoal)
+DERIVED_MODELS = ('transactions.TransactionRollup', 'ml_insights.InsightAccumulator')
+
+
+_copying_defaults = ContextVar('copying_defaults', default=False)
+
+
+def copy_default_category(category, delete=False):
+    """Write (or delete) a default category's copies on every other shard"""
+    if _copying_defaults.get():
+        return
+    token = _copying_defaults.set(True)
+    try:
+        for alias in shard_aliases():
+            if alias == category._state.db:
+                continue
+            if delete:
+                with use_shard(alias):
+                    Category.objects.using(alias).filter(pk=category.pk).delete()
+            else:
+                copy_to(category, alias)
+    finally:
+        _copying_defaults.reset(token)
+
+
+def sync_default_categories():
+    """Make every shard's default categories match the home shard's; returns the shards changed"""
+    home = home_shard()
+    defaults = list(Category.objects.using(home).filter(is_default=True))
+    changed = []
+    for alias in shard_aliases():
+        if alias == home:
+            continue
+        existing = {
+            category.pk: category for category in Category.objects.using(alias).filter(is_default=True)
+        }
+        stale = existing.keys() - {category.pk for category in defaults}
+        missing = [category for category in defaults if _fields(category) != _fields(existing.get(category.pk))]
+        if not stale and not missing:
+            continue
+        with use_shard(alias):
+            Category.objects.using(alias).filter(pk__in=stale).delete()
+        for category in missing:
+            copy_to(category, alias)
+        changed.append(alias)
+    return changed
+
+
+def _fields(category):
+    if category is None:
+        return None
+    return tuple(getattr(category, field.attname) for field in Category._meta.concrete_fields)
+
+
+def mirror_user(user_id, alias):
+    """A stand-in row for the user on `alias`, for the foreign keys of their rows there
+
+    It carries no credentials or profile data: users are only ever read from 'default'.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    get_user_model().objects.using(alias).bulk_create([
+        get_user_model()(
+            pk=user_id, username=f'shard-user-{user_id}', email=f'shard-user-{user_id}@invalid',
+            password='!', is_active=False
+        )
+    ], ignore_conflicts=True)
+
+
+def copy_user_data(user_id, source, target, batch_size=REBUILD_BATCH_SIZE):
+    """Copy a user's rows from `source` to `target` with their ids, in one DB transaction on the target"""
+    with use_shard(target), transaction.atomic(using=target):
+        # Left over from an interrupted move
+        delete_user_data(user_id, target, keep_user=True)
+        mirror_user(user_id, target)
+        for model in MOVED_MODELS:
+            manager = model._base_manager
+            batch = []
+            for row in manager.using(source).filter(user_id=user_id).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    manager.using(target).bulk_create(batch)
+                    batch = []
+            if batch:
+                manager.using(target).bulk_create(batch)
+        rebuild_rollups([user_id])
+
+
+def delete_user_data(user_id, alias, keep_user=False):
+    """Remove a user's rows from a shard they don't live on (or no longer do)"""
+    with use_shard(alias), transaction.atomic(using=alias), suppress_row_signals():
+        for label in DERIVED_MODELS:
+            apps.get_model(label)._base_manager.using(alias).filter(user_id=user_id).delete()
+        for model in reversed(MOVED_MODELS):
+            model._base_manager.using(alias).filter(user_id=user_id).delete()
+        if not keep_user and alias != DEFAULT_DB_ALIAS:
+            get_user_model().objects.using(alias).filter(pk=user_id).delete()
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from smartfinance.sharding import on_instance_shard, sharding_enabled
+from .models import Budget, Category, SavingsGoal, Transaction, TransactionRollup
+from .bulk import row_signals_suppressed
+from .rollups import STATE_FIELDS, apply_states, rebuild_rollups, transaction_state
+from .ids import assign_ids
+from .sharding import copy_default_category
+from .versions import SHARED, bump_data_version
+
+
+@receiver(pre_save, sender=Transaction)
+@on_instance_shard
+def capture_previous_transaction(sender, instance, raw=False, **kwargs):
+    instance._previous_state = None
+    if raw or instance.pk is None or row_signals_suppressed():
+        return
+    previous = Transaction.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+    instance._previous_state = previous
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender=Budget)
+@receiver(pre_save, sender=SavingsGoal)
+def allocate_sharded_id(sender, instance, raw=False, **kwargs):
+    # After capture_previous_transaction, which must still see new rows without an id
+    if not raw and instance.pk is None:
+        assign_ids([instance])
+
+
+@receiver(post_save, sender=Transaction)
+@on_instance_shard
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw or row_signals_suppressed():
+        return
+    previous = getattr(instance, '_previous_state', None)
+    current = transaction_state(instance)
+    # Descriptions and timestamps aren't rolled up but are still served
+    bump_data_version(instance.user_id)
+    if previous == current:
+        return
+    if previous is not None:
+        apply_states([previous], sign=-1)
+        if previous[0] != current[0]:
+            bump_data_version(previous[0])
+    apply_states([current])
+
+
+@receiver(post_delete, sender=Transaction)
+@on_instance_shard
+def update_rollups_on_delete(sender, instance, **kwargs):
+    if row_signals_suppressed():
+        return
+    apply_states([transaction_state(instance)], sign=-1)
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=Category)
+def bump_version_on_category_save(sender, instance, raw=False, **kwargs):
+    # Renames and recolours change derived names in summaries and ML features
+    if not raw and instance.user_id is not None:
+        bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_categories_version(sender, instance, raw=False, using=None, **kwargs):
+    # Default categories belong to everyone, so they version as shared data
+    if not raw:
+        owner = SHARED if instance.is_default else instance.user_id
+        bump_data_version(owner, 'categories')
+        # Again once committed: the category directory may have reloaded the
+        # old rows under the first bump while the write was still uncommitted
+        transaction.on_commit(lambda: bump_data_version(owner, 'categories'), using=using)
+
+
+@receiver(post_save, sender=Category)
+def copy_default_category_to_shards(sender, instance, raw=False, **kwargs):
+    if not raw and instance.is_default and sharding_enabled():
+        copy_default_category(instance)
+
+
+@receiver(post_delete, sender=Category)
+def delete_default_category_from_shards(sender, instance, **kwargs):
+    if instance.is_default and sharding_enabled():
+        copy_default_category(instance, delete=True)
+
+
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+def bump_budgets_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(instance.user_id, 'budgets')
+
+
+@receiver(post_save, sender=SavingsGoal)
+@receiver(post_delete, sender=SavingsGoal)
+def bump_savings_goals_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(instance.user_id, 'savings_goals')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def bump_profile_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_data_version(instance.pk, 'profile')
+
+
+@receiver(pre_delete, sender=Category)
+@on_instance_shard
+def capture_category_rollup_users(sender, instance, **kwargs):
+    instance._rollup_user_ids = list(
+        TransactionRollup.objects.filter(category=instance).values_list('user_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Category)
+@on_instance_shard
+def rebuild_rollups_on_category_delete(sender, instance, **kwargs):
+    # Deleting a category nulls out its transactions with a bulk UPDATE that
+    # sends no Transaction signals, so re-derive the affected users' rollups
+    user_ids = getattr(instance, '_rollup_user_ids', None)
+    if user_ids:
+        rebuild_rollups(user_ids)
+        for user_id in user_ids:
+            bump_data_version(user_id)
@@ -0,0 +1,138 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Sum, Q
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from smartfinance.db_router import analytics_db
+from smartfinance.money import MINOR_UNITS, Minor
+from .categories import visible_categories
+from .models import Transaction, TransactionRollup
+from .rollups import rollups_enabled
+
+TIME_BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Names, colours and types come from the category directory, not a join
+CATEGORY_FIELDS = ['category_id']
+
+
+def summary_source(user, start_date, end_date):
+    """(queryset, date field, amount field) to summarize: daily rollups when enabled, else transactions
+
+    The queryset reads from a replica when one is configured (see analytics_db()).
+    """
+    db = analytics_db(user.pk)
+    if rollups_enabled():
+        rollups = TransactionRollup.objects.using(db).filter(
+            user=user,
+            granularity='day',
+            period__gte=start_date,
+            period__lte=end_date
+        )
+        return rollups, 'period', 'total'
+
+    transactions = Transaction.objects.using(db).filter(
+        user=user,
+        date__gte=start_date,
+        date__lte=end_date
+    )
+    return transactions, 'date', 'amount'
+
+
+def summarize_user(user, start_date, end_date, group_by=None):
+    """Summarize a user's transactions, reading daily rollups when they are enabled"""
+    source, date_field, amount_field = summary_source(user, start_date, end_date)
+    return build_summary(source, visible_categories(user.pk), group_by=group_by,
+                         date_field=date_field, amount_field=amount_field)
+
+
+async def asummarize_user(user, start_date, end_date, group_by=None):
+    """summarize_user() reading its rows through the async ORM"""
+    source, date_field, amount_field = await sync_to_async(summary_source)(user, start_date, end_date)
+    rows = [row async for row in summary_rows(source, group_by, date_field, amount_field)]
+    categories = await sync_to_async(visible_categories)(user.pk)
+    return reduce_summary(rows, categories, group_by)
+
+
+def summary_rows(transactions, group_by=None, date_field='date', amount_field='amount'):
+    """Grouped queryset of income/expense sums in minor units per category (and time bucket)"""
+    if group_by is not None and group_by not in TIME_BUCKETS:
+        raise ValueError(f"Unsupported group_by '{group_by}'")
+
+    fields = list(CATEGORY_FIELDS)
+    queryset = transactions
+    if group_by:
+        queryset = queryset.annotate(bucket=TIME_BUCKETS[group_by](date_field))
+        fields.append('bucket')
+
+    # order_by() drops the model's default ordering so it doesn't leak into GROUP BY
+    return queryset.order_by().values(*fields).annotate(
+        income=Minor(Sum(amount_field, filter=Q(type='income'))),
+        expense=Minor(Sum(amount_field, filter=Q(type='expense'))),
+    )
+
+
+def build_summary(transactions, categories, group_by=None, date_field='date', amount_field='amount'):
+    """Compute totals, category breakdown and optional time series in one grouped query"""
+    return reduce_summary(summary_rows(transactions, group_by, date_field, amount_field), categories, group_by)
+
+
+def reduce_summary(rows, categories, group_by=None):
+    """Fold summary_rows() output into totals, category breakdown and optional time series
+
+    `categories` is the owner's UserCategories, which names the breakdown.
+    Sums stay integer minor units until the response is built.
+    """
+    income = 0
+    expenses = 0
+    breakdown = {}
+    periods = {}
+
+    for row in rows:
+        row_income = row['income'] or 0
+        row_expense = row['expense'] or 0
+        income += row_income
+        expenses += row_expense
+
+        category = categories.get(row['category_id'])
+        if category is not None:
+            entry = breakdown.setdefault(category.pk, {
+                'category': category.name,
+                'amount': 0,
+                'color': category.color,
+                'type': category.type,
+            })
+            entry['amount'] += row_income + row_expense
+
+        if group_by:
+            totals = periods.setdefault(row['bucket'], [0, 0])
+            totals[0] += row_income
+            totals[1] += row_expense
+
+    category_breakdown = [
+        {**entry, 'amount': entry['amount'] / MINOR_UNITS}
+        for _, entry in sorted(breakdown.items())
+        if entry['amount'] > 0
+    ]
+
+    summary = {
+        'total_income': income / MINOR_UNITS,
+        'total_expenses': expenses / MINOR_UNITS,
+        'balance': (income - expenses) / MINOR_UNITS,
+        'category_breakdown': category_breakdown,
+    }
+
+    if group_by:
+        summary['group_by'] = group_by
+        summary['time_series'] = [
+            {
+                'period': period,
+                'income': period_income / MINOR_UNITS,
+                'expenses': period_expense / MINOR_UNITS,
+                'balance': (period_income - period_expense) / MINOR_UNITS,
+            }
+            for period, (period_income, period_expense) in sorted(periods.items())
+        ]
+
+    return summary
@@ -0,0 +1,146 @@
+"""Synthetic users with realistic transaction histories, for benchmarks and load tests"""
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+from django.contrib.auth import get_user_model
+from smartfinance.sharding import home_shard, shard_for_user, sharding_enabled, use_shard
+from .bulk import bulk_create_transactions
+from .models import Budget, Category, SavingsGoal, Transaction
+
+# (category, type, weight, median amount, spread, merchants) for day-to-day spending
+VARIABLE_SPENDING = [
+    ('Food & Dining', 'expense', 40, 18, 0.6,
+     ['Starbucks coffee', 'lunch at restaurant', 'Whole Foods grocery', 'pizza delivery', 'Chipotle', 'bakery']),
+    ('Transportation', 'expense', 18, 22, 0.7,
+     ['Uber ride', 'Lyft', 'Shell gas station', 'metro card', 'parking', 'train ticket']),
+    ('Shopping', 'expense', 15, 45, 1.0,
+     ['Amazon order', 'Target', 'clothing store', 'Best Buy electronics', 'IKEA', 'shoe store']),
+    ('Entertainment', 'expense', 10, 25, 0.8,
+     ['Netflix subscription', 'movie tickets', 'Spotify', 'concert', 'steam game', 'bowling']),
+    ('Healthcare', 'expense', 4, 60, 0.9,
+     ['pharmacy', 'doctor visit', 'dentist', 'CVS pharmacy', 'gym membership']),
+    ('Education', 'expense', 2, 80, 0.9,
+     ['online course', 'books', 'Udemy', 'tuition payment']),
+    ('Other', 'expense', 6, 30, 1.1,
+     ['ATM withdrawal', 'gift', 'donation', 'misc purchase', 'haircut']),
+    ('Freelance', 'income', 3, 400, 0.7,
+     ['freelance project', 'consulting invoice', 'Upwork payment']),
+    ('Investment', 'income', 2, 120, 1.0,
+     ['dividend payment', 'interest', 'stock sale']),
+]
+
+# (category, type, amount, day of month, description) paid every month
+RECURRING = [
+    ('Salary', 'income', 4200, 25, 'monthly salary'),
+    ('Rent', 'expense', 1450, 1, 'rent payment'),
+    ('Utilities', 'expense', 140, 10, 'electricity and water bill'),
+]
+
+# Relative activity Monday..Sunday
+WEEKDAY_WEIGHTS = [0.9, 0.9, 1.0, 1.0, 1.2, 1.5, 1.3]
+
+UNCATEGORIZED_SHARE = 0.05
+
+
+def _category_ids():
+    names = {(name, trans_type) for name, trans_type, *_ in VARIABLE_SPENDING + RECURRING}
+    ids = {}
+    # Default categories are written to the home shard and copied from there
+    with use_shard(home_shard() if sharding_enabled() else None):
+        for name, trans_type in sorted(names):
+            category = Category.objects.filter(name=name, type=trans_type, is_default=True).first()
+            if category is None:
+                category = Category.objects.create(name=name, type=trans_type, is_default=True)
+            ids[name] = category.pk
+    return ids
+
+
+def _recurring(user, category_ids, start, end, rng):
+    transactions = []
+    month = start.replace(day=1)
+    while month <= end:
+        for name, trans_type, amount, day, description in RECURRING:
+            when = month.replace(day=day)
+            if start <= when <= end:
+                transactions.append(Transaction(
+                    user=user, type=trans_type, category_id=category_ids[name], description=description,
+                    amount=Decimal(str(round(amount * rng.uniform(0.97, 1.03), 2))), date=when,
+                ))
+        month = (month + timedelta(days=32)).replace(day=1)
+    return transactions
+
+
+def _variable(user, category_ids, count, start, days, rng):
+    weights = np.array([row[2] for row in VARIABLE_SPENDING], dtype=np.float64)
+    kinds = rng.choice(len(VARIABLE_SPENDING), size=count, p=weights / weights.sum())
+
+    # Busier weekends and mildly growing activity towards the present
+    offsets = np.arange(days)
+    day_weights = np.array([WEEKDAY_WEIGHTS[(start + timedelta(days=int(offset))).weekday()] for offset in offsets])
+    day_weights *= np.linspace(0.8, 1.2, days)
+    day_offsets = rng.choice(offsets, size=count, p=day_weights / day_weights.sum())
+
+    medians = np.array([row[3] for row in VARIABLE_SPENDING], dtype=np.float64)[kinds]
+    spreads = np.array([row[4] for row in VARIABLE_SPENDING], dtype=np.float64)[kinds]
+    amounts = np.clip(np.round(medians * rng.lognormal(0, spreads), 2), 0.5, 99999999)
+    uncategorized = rng.random(count) < UNCATEGORIZED_SHARE
+    merchants = rng.integers(0, 1 << 30, size=count)
+
+    for kind, offset, amount, no_category, merchant in zip(
+        kinds.tolist(), day_offsets.tolist(), amounts.tolist(), uncategorized.tolist(), merchants.tolist()
+    ):
+        name, trans_type, _, _, _, descriptions = VARIABLE_SPENDING[kind]
+        yield Transaction(
+            user=user, type=trans_type,
+            category_id=None if no_category else category_ids[name],
+            description=descriptions[merchant % len(descriptions)],
+            amount=Decimal(f'{amount:.2f}'), date=start + timedelta(days=offset),
+        )
+
+
+def generate_user(username, transactions=1000, days=730, seed=0, password='benchmark-password',
+                  batch_size=10000, end=None):
+    """Create a user with `transactions` transactions over the `days` days ending `end` (today)
+
+    Monthly salary, rent and bills plus weighted day-to-day spending with
+    log-normal amounts, busier weekends and per-category merchant
+    descriptions; also a few budgets and a savings goal. Rows go through
+    bulk_create_transactions(), so rollups and data versions stay in step.
+    The same arguments always produce the same data.
+    """
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    category_ids = _category_ids()
+
+    user = get_user_model().objects.create_user(
+        username=username, email=f'{username}@example.com', password=password
+    )
+    with use_shard(shard_for_user(user)):
+        _generate_data(user, category_ids, transactions, start, end, days, rng, batch_size)
+    return user
+
+
+def _generate_data(user, category_ids, transactions, start, end, days, rng, batch_size):
+    recurring = _recurring(user, category_ids, start, end, rng)[:transactions]
+    bulk_create_transactions(recurring, batch_size=batch_size)
+
+    batch = []
+    for trans in _variable(user, category_ids, transactions - len(recurring), start, days, rng):
+        batch.append(trans)
+        if len(batch) >= batch_size:
+            bulk_create_transactions(batch, batch_size=batch_size)
+            batch = []
+    if batch:
+        bulk_create_transactions(batch, batch_size=batch_size)
+
+    month_start = end.replace(day=1)
+    for name, amount in (('Food & Dining', 600), ('Transportation', 250), ('Shopping', 400), ('Entertainment', 150)):
+        Budget.objects.create(
+            user=user, category_id=category_ids[name], amount=Decimal(amount),
+            start_date=month_start, end_date=end
+        )
+    SavingsGoal.objects.create(
+        user=user, name='Emergency fund', target_amount=Decimal('10000'),
+        current_amount=Decimal(str(round(rng.uniform(0, 10000), 2))), target_date=end + timedelta(days=365)
+    )
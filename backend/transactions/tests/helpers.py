@@ -0,0 +1,51 @@
+"""Users, shared categories and API clients for the test cases"""
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from smartfinance.sharding import home_shard, sharding_enabled, use_shard
+from transactions.models import Category
+
+
+def create_user(username, **fields):
+    user = get_user_model().objects.create_user(
+        username=username, email=f'{username}@example.com', password='password', **fields
+    )
+    # Picks up the shard it was placed on
+    user.refresh_from_db()
+    return user
+
+
+def create_default_category(name, type):
+    """A shared category, written on the home shard (and copied to the others) when sharded"""
+    with use_shard(home_shard() if sharding_enabled() else None):
+        return Category.objects.create(name=name, type=type, is_default=True)
+
+
+def client_for(user):
+    """An API client sending a JWT for `user`, so requests take the real authentication path"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+class FreshCacheMixin:
+    """Empties the caches before the class's test data and before each test
+
+    The test database rolls back between tests but the cache does not, and the per-user
+    data versions it holds would otherwise outlive rows whose ids get reused.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        clear_caches()
+        super().setUpClass()
+
+    def setUp(self):
+        clear_caches()
+        super().setUp()
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
@@ -0,0 +1,32 @@
+from unittest import mock
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import Client, TestCase
+from transactions.management.commands.benchmark import Command
+from .helpers import FreshCacheMixin, create_user
+
+OPTIONS = {'cold': False, 'warmup': 1, 'iterations': 3}
+
+
+class BenchmarkScenarioTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('benchmarked')
+
+    def run_scenario(self, responses, **options):
+        with mock.patch.object(Client, 'get', side_effect=responses):
+            return Command().run_scenario(self.user, 'get', '/api/transactions/', None, {**OPTIONS, **options})
+
+    def test_reports_timings_for_successful_responses(self):
+        result = self.run_scenario([HttpResponse() for _ in range(5)])
+        self.assertEqual(set(result), {'p50_ms', 'p95_ms', 'mean_ms', 'queries', 'peak_memory_kb'})
+
+    def test_any_error_response_fails_the_scenario(self):
+        # Warmup, a timed request that isn't the last, and the last one
+        for failing in (0, 1, 3):
+            with self.subTest(request=failing):
+                responses = [HttpResponse(status=500 if index == failing else 200) for index in range(5)]
+                with self.assertRaisesMessage(CommandError, 'returned 500'):
+                    self.run_scenario(responses)
@@ -0,0 +1,129 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from django.db.models import Sum
+from django.test import TestCase
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.models import Category, Transaction, TransactionRollup
+from transactions.rollups import find_drift
+from transactions.versions import get_data_version
+from transactions.views import TransactionViewSet
+from .helpers import FreshCacheMixin, client_for, create_default_category, create_user
+
+URL = '/api/transactions/bulk/'
+
+
+class BulkEndpointTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.food = create_default_category('Food', 'expense')
+        cls.user = create_user('bulk')
+        cls.other = create_user('bulk-other')
+        cls.mine = [transaction.pk for transaction in cls.create(cls.user, '10.00', '20.00', '30.00')]
+        cls.theirs, = cls.create(cls.other, '99.00')
+        with use_shard(shard_for_user(cls.other)):
+            cls.their_category = Category.objects.create(name='Secret', type='expense', user=cls.other)
+
+    @classmethod
+    def create(cls, user, *amounts):
+        with use_shard(shard_for_user(user)):
+            return [Transaction.objects.create(user=user, type='expense', amount=Decimal(amount),
+                                               category=cls.food, date=date(2024, 1, 10))
+                    for amount in amounts]
+
+    def setUp(self):
+        self.client = client_for(self.user)
+
+    def state(self):
+        with use_shard(shard_for_user(self.user)):
+            return (dict(Transaction.objects.filter(user=self.user).values_list('pk', 'amount')),
+                    TransactionRollup.objects.filter(user=self.user).aggregate(total=Sum('total'))['total'])
+
+    def test_writes_everything_and_refreshes_derived_state(self):
+        version = get_data_version(self.user.pk)
+        response = self.client.post(URL, {
+            'create': [{'type': 'expense', 'amount': '5.25', 'category': self.food.pk, 'date': '2024-02-01'},
+                       {'type': 'income', 'amount': '100.00', 'date': '2024-02-02'}],
+            'update': [{'id': self.mine[0], 'amount': '11.00', 'category': None}],
+            'delete': [self.mine[1]],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual(response.data['updated'][0]['amount'], '11.00')
+        self.assertEqual((response.data['deleted'], response.data['not_found']), ([self.mine[1]], []))
+
+        amounts, rollup_total = self.state()
+        self.assertNotIn(self.mine[1], amounts)
+        self.assertEqual(amounts[self.mine[0]], Decimal('11.00'))
+        self.assertEqual(len(amounts), 4)
+        with use_shard(shard_for_user(self.user)):
+            self.assertEqual(find_drift([self.user.pk]), [])
+        # Day and month rollups each hold every amount once
+        self.assertEqual(rollup_total, 2 * (Decimal('11.00') + Decimal('30.00') + Decimal('5.25') + Decimal('100.00')))
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+
+    def test_one_invalid_item_writes_nothing(self):
+        before = self.state()
+        version = get_data_version(self.user.pk)
+        response = self.client.post(URL, {
+            'create': [{'type': 'expense', 'amount': '5.00', 'date': '2024-02-01'},
+                       {'type': 'expense', 'amount': 'five', 'date': '2024-02-01'}],
+            'update': [{'id': self.mine[0], 'amount': '1.00'}],
+            'delete': [self.mine[2]],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']['create']], [1])
+        self.assertIn('amount', response.data['errors']['create'][0]['errors'])
+        self.assertEqual(self.state(), before)
+        self.assertEqual(get_data_version(self.user.pk), version)
+
+    def test_update_id_errors(self):
+        response = self.client.post(URL, {
+            'update': [{'id': self.mine[0], 'amount': '1.00'},
+                       {'id': self.mine[0], 'amount': '2.00'},
+                       {'id': self.mine[1], 'amount': '3.00'},
+                       {'id': 10 ** 9, 'amount': '4.00'},
+                       {'amount': '5.00'},
+                       'not an object'],
+            'delete': [self.mine[1], 'x', True],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['errors']
+        self.assertEqual(
+            [(error['index'], str(error['errors']['id'][0])) for error in errors['update']],
+            [(1, 'Appears more than once.'), (2, 'Also listed for deletion.'),
+             (3, 'Not found.'), (4, 'Not found.'), (5, 'Not found.')]
+        )
+        self.assertEqual([error['index'] for error in errors['delete']], [1, 2])
+
+    def test_other_users_rows_and_categories_are_refused(self):
+        before = self.state()
+        response = self.client.post(URL, {'update': [{'id': self.theirs.pk, 'amount': '1.00'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data['errors']['update'][0]['errors']['id'][0]), 'Not found.')
+
+        response = self.client.post(URL, {'create': [{'type': 'expense', 'amount': '1.00', 'date': '2024-02-01',
+                                                      'category': self.their_category.pk}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data['errors']['create'][0]['errors'])
+
+        # Deletes of ids the user doesn't own are reported, not applied
+        response = self.client.post(URL, {'delete': [self.theirs.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['deleted'], response.data['not_found']), ([], [self.theirs.pk]))
+        with use_shard(shard_for_user(self.other)):
+            self.assertEqual(Transaction.objects.get(pk=self.theirs.pk).amount, Decimal('99.00'))
+        self.assertEqual(self.state(), before)
+
+    def test_request_shape_and_size_limits(self):
+        self.assertEqual(self.client.post(URL, [1, 2], format='json').status_code, 400)
+        self.assertEqual(self.client.post(URL, {'create': {}}, format='json').status_code, 400)
+
+        with mock.patch.object(TransactionViewSet, 'max_bulk_items', 3):
+            response = self.client.post(URL, {'create': [{}, {}], 'delete': [1, 2]}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'At most 3 items per request')
+            response = self.client.post(URL, {'delete': [self.mine[0], self.mine[1], self.mine[2]]}, format='json')
+            self.assertEqual(response.status_code, 200)
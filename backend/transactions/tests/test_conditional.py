@@ -0,0 +1,55 @@
+from django.test import TestCase, override_settings
+from .helpers import FreshCacheMixin, client_for, create_default_category, create_user
+
+URL = '/api/transactions/'
+
+
+class ConditionalGetTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('conditional')
+
+    def setUp(self):
+        self.client = client_for(self.user)
+
+    def test_repeat_get_is_not_modified(self):
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+
+        response = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Validators are per query string and per user
+        self.assertEqual(self.client.get(URL, {'type': 'income'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        other = client_for(create_user('conditional-other'))
+        self.assertEqual(other.get(URL, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(URL)['ETag']
+        response = self.client.post(URL, {'type': 'expense', 'amount': '3.00', 'date': '2024-01-05'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_shared_category_changes_change_the_etag(self):
+        etag = self.client.get(URL)['ETag']
+        create_default_category('Travel', 'expense')
+        self.assertEqual(self.client.get(URL, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_validators_when_versions_are_process_local(self):
+        etag = self.client.get(URL)['ETag']
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            response = self.client.get(URL, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Last-Modified', response)
@@ -0,0 +1,151 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.importers import ImportFormatError, import_transactions, parse_csv, parse_ofx
+from transactions.models import Category, Transaction
+from transactions.serializers import TransactionImportRowSerializer
+from .helpers import FreshCacheMixin, client_for, create_default_category, create_user
+
+OFX_SGML = b"""OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240105120000[0:GMT]<TRNAMT>-42,10<NAME>Grocer<MEMO>Weekly shop</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240131<TRNAMT>2500.00<NAME>Payroll</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+OFX_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<OFX><BANKTRANLIST>
+<STMTTRN><DTPOSTED>20240201</DTPOSTED><TRNAMT>-7.5</TRNAMT><MEMO>Coffee</MEMO></STMTTRN>
+</BANKTRANLIST></OFX>
+"""
+
+
+def upload(content, name='statement.csv'):
+    return SimpleUploadedFile(name, content)
+
+
+class ParserTests(SimpleTestCase):
+    def test_csv_rows_are_numbered_by_line_and_blank_cells_dropped(self):
+        content = ('\ufeffDate, Amount ,Category,Notes,Description\n'
+                   '2024-01-05,-12.50,Food,ignored,Lunch\n'
+                   '\n'
+                   '01/06/2024,30,,,\n').encode()
+        self.assertEqual(list(parse_csv(upload(content))), [
+            (2, {'date': '2024-01-05', 'amount': '-12.50', 'category': 'Food', 'description': 'Lunch'}),
+            (4, {'date': '01/06/2024', 'amount': '30'}),
+        ])
+
+    def test_csv_format_errors(self):
+        with self.assertRaisesMessage(ImportFormatError, 'empty'):
+            list(parse_csv(upload(b'')))
+        with self.assertRaisesMessage(ImportFormatError, 'Missing column(s): amount'):
+            list(parse_csv(upload(b'date,description\n2024-01-05,Lunch\n')))
+
+    def test_ofx_sgml_and_xml(self):
+        self.assertEqual(list(parse_ofx(upload(OFX_SGML, 'statement.ofx'))), [
+            (1, {'date': '2024-01-05', 'amount': '-42.10', 'description': 'Grocer - Weekly shop'}),
+            (2, {'date': '2024-01-31', 'amount': '2500.00', 'description': 'Payroll'}),
+        ])
+        self.assertEqual(list(parse_ofx(upload(OFX_XML, 'statement.qfx'))), [
+            (1, {'date': '2024-02-01', 'amount': '-7.5', 'description': 'Coffee'}),
+        ])
+
+    def test_ofx_tags_split_across_chunks(self):
+        expected = list(parse_ofx(upload(OFX_SGML)))
+        for size in (1, 5, 16):
+            with self.subTest(size=size), mock.patch('transactions.importers.OFX_CHUNK_SIZE', size):
+                self.assertEqual(list(parse_ofx(upload(OFX_SGML))), expected)
+
+
+class ImportRowSerializerTests(SimpleTestCase):
+    def validate(self, **row):
+        return TransactionImportRowSerializer().run_validation({'date': '2024-01-05', **row})
+
+    def test_the_sign_gives_the_type(self):
+        data = self.validate(amount='-12.50')
+        self.assertEqual((data['type'], data['amount']), ('expense', Decimal('12.50')))
+        data = self.validate(amount='30')
+        self.assertEqual((data['type'], data['amount']), ('income', Decimal('30')))
+
+    def test_an_explicit_type_wins_over_the_sign(self):
+        data = self.validate(amount='-5.00', type='income')
+        self.assertEqual((data['type'], data['amount']), ('income', Decimal('5.00')))
+
+
+class ImportTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('importer')
+        cls.default_food = create_default_category('Food', 'expense')
+        cls.salary = create_default_category('Salary', 'income')
+        with use_shard(shard_for_user(cls.user)):
+            cls.own_food = Category.objects.create(name='food', type='expense', user=cls.user)
+
+    def setUp(self):
+        self.client = client_for(self.user)
+
+    def transactions(self):
+        with use_shard(shard_for_user(self.user)):
+            return list(Transaction.objects.filter(user=self.user).order_by('date').values_list(
+                'date', 'type', 'amount', 'category_id', 'description'))
+
+    def post(self, content, name='statement.csv', **data):
+        return self.client.post('/api/transactions/import/', {'file': upload(content, name), **data},
+                                format='multipart')
+
+    def test_csv_import_resolves_categories_and_reports_bad_rows(self):
+        response = self.post(
+            b'date,amount,category,description\n'
+            b'2024-01-05,-12.50,FOOD,Lunch\n'
+            b'2024-01-06,2500,salary,\n'
+            b'not a date,1.00,,\n'
+            b'2024-01-07,lots,,\n'
+            b'2024-01-08,-3.00,Travel,Bus\n'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        self.assertFalse(response.data['errors_truncated'])
+        self.assertEqual([(error['row'], set(error['errors'])) for error in response.data['errors']],
+                         [(4, {'date'}), (5, {'amount'}), (6, {'category'})])
+        self.assertIn("Unknown category 'Travel'", str(response.data['errors'][2]['errors']))
+
+        # Names match case-insensitively, and the user's own category beats the default
+        self.assertEqual(self.transactions(), [
+            (date(2024, 1, 5), 'expense', Decimal('12.50'), self.own_food.pk, 'Lunch'),
+            (date(2024, 1, 6), 'income', Decimal('2500.00'), self.salary.pk, ''),
+        ])
+
+    def test_ofx_import(self):
+        response = self.post(OFX_SGML, 'statement.ofx')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.transactions(), [
+            (date(2024, 1, 5), 'expense', Decimal('42.10'), None, 'Grocer - Weekly shop'),
+            (date(2024, 1, 31), 'income', Decimal('2500.00'), None, 'Payroll'),
+        ])
+
+    def test_rejected_uploads(self):
+        self.assertEqual(self.client.post('/api/transactions/import/', {}, format='multipart').status_code, 400)
+        self.assertEqual(self.post(b'date,amount\n', 'statement.xls').status_code, 400)
+        # file_format overrides the extension
+        self.assertEqual(self.post(OFX_XML, 'statement.txt', file_format='ofx').status_code, 201)
+
+        response = self.post(b'date,description\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Missing column', response.data['error'])
+
+    def test_batches_and_error_limit(self):
+        rows = [(number, {'date': '2024-03-01', 'amount': '-1.00'}) for number in range(1, 6)]
+        rows += [(number, {'date': 'never', 'amount': '1.00'}) for number in range(6, 9)]
+        with use_shard(shard_for_user(self.user)):
+            result = import_transactions(self.user, rows, batch_size=2, max_errors=2)
+        self.assertEqual((result['created'], result['failed']), (5, 3))
+        self.assertEqual([error['row'] for error in result['errors']], [6, 7])
+        self.assertTrue(result['errors_truncated'])
+        self.assertEqual(len(self.transactions()), 5)
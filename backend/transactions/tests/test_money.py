@@ -0,0 +1,173 @@
+from contextlib import ExitStack
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.apps import apps
+from django.db import connection, migrations, models
+from django.db.migrations.state import ProjectState
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from smartfinance.money import MoneyField, Minor, decimal_money_columns, from_minor, minor_array, to_minor
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.checks import check_money_columns, check_version_cache
+from transactions.models import SavingsGoal, Transaction
+from .helpers import FreshCacheMixin, client_for, create_user
+
+
+class MinorUnitTests(SimpleTestCase):
+    def test_to_minor_rounds_half_to_even(self):
+        cases = {
+            Decimal('12.34'): 1234, '-12.34': -1234, 0.1: 10, 7: 700, ' 3.5 ': 350,
+            Decimal('1.005'): 100, Decimal('1.015'): 102, '-2.345': -234, '-2.355': -236, '0.004': 0,
+        }
+        for value, minor in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(to_minor(value), minor)
+
+    def test_to_minor_rejects_non_numbers(self):
+        for value in ('abc', '', None, 'NaN', Decimal('Infinity'), float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                to_minor(value)
+
+    def test_from_minor(self):
+        self.assertEqual(from_minor(1250), Decimal('12.50'))
+        self.assertEqual(str(from_minor(-5)), '-0.05')
+        self.assertEqual(minor_array([1, 2]).dtype, np.int64)
+
+
+class MoneyFieldTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('money')
+
+    def setUp(self):
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        stack.enter_context(use_shard(shard_for_user(self.user)))
+
+    def save(self, amount):
+        transaction = Transaction.objects.create(user=self.user, type='expense', amount=amount, date=date(2024, 1, 1))
+        return Transaction.objects.get(pk=transaction.pk)
+
+    def test_round_trip(self):
+        for amount, stored in [('12.34', 1234), ('-12.34', -1234), ('0.01', 1), ('99999999.99', 9999999999),
+                               ('1.005', 100), ('1.015', 102), ('-7.125', -712), ('3', 300)]:
+            with self.subTest(amount=amount):
+                loaded = self.save(Decimal(amount))
+                self.assertEqual(loaded.amount, from_minor(stored))
+                self.assertEqual(loaded.amount.as_tuple().exponent, -2)
+                self.assertEqual(Transaction.objects.filter(pk=loaded.pk).values_list(Minor('amount'), flat=True)
+                                 .get(), stored)
+                self.assertTrue(Transaction.objects.filter(pk=loaded.pk, amount=Decimal(amount)).exists())
+
+    def test_aggregates(self):
+        for amount in ('0.10', '0.20', '-0.05', '1234.56'):
+            self.save(Decimal(amount))
+        totals = Transaction.objects.filter(user=self.user).aggregate(minor=Minor(Sum('amount')), amount=Sum('amount'))
+        self.assertEqual(totals['minor'], 123481)
+        self.assertIsInstance(totals['minor'], int)
+        self.assertEqual(totals['amount'], Decimal('1234.81'))
+
+    def test_validation_uses_max_digits(self):
+        field = MoneyField(max_digits=5)
+        self.assertEqual(field.clean('123.45', None), Decimal('123.45'))
+        with self.assertRaises(ValidationError):
+            field.clean('1234.56', None)
+
+    def test_api_sends_and_takes_decimal_strings(self):
+        client = client_for(self.user)
+        response = client.post('/api/transactions/', {'type': 'expense', 'amount': '12.30', 'date': '2024-01-02'},
+                               format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['amount'], '12.30')
+        self.assertEqual(client.get(f"/api/transactions/{response.data['id']}/").json()['amount'], '12.30')
+
+        response = client.post('/api/transactions/', {'type': 'expense', 'amount': '1.234', 'date': '2024-01-02'},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('amount', response.data)
+
+
+class VersionCacheCheckTests(SimpleTestCase):
+    def test_process_local_caches_are_errors(self):
+        for backend in ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache'):
+            with self.subTest(backend), override_settings(CACHES={'default': {'BACKEND': backend}}):
+                self.assertEqual([error.id for error in check_version_cache(None)], ['transactions.E001'])
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/versions'
+        }}):
+            self.assertEqual(check_version_cache(None), [])
+
+
+def decimal_column(model, field, max_digits=None):
+    column = models.DecimalField(max_digits=max_digits or field.max_digits, decimal_places=2, null=field.null)
+    column.set_attributes_from_name(field.name)
+    column.model = model
+    return column
+
+
+class ConvertMoneyColumnsTests(FreshCacheMixin, TransactionTestCase):
+    """A savings goal table left with the DECIMAL columns of before MoneyField"""
+    databases = '__all__'
+
+    def setUp(self):
+        # As migrations would, so SQLite's table rebuilds keep the column altered first decimal too
+        state = ProjectState.from_apps(apps)
+        with connection.schema_editor() as schema_editor:
+            for name in ('target_amount', 'current_amount'):
+                operation = migrations.AlterField('savingsgoal', name, models.DecimalField(max_digits=10,
+                                                                                          decimal_places=2))
+                new_state = state.clone()
+                operation.state_forwards('transactions', new_state)
+                operation.database_forwards('transactions', schema_editor, state, new_state)
+                state = new_state
+        self.addCleanup(self.restore)
+
+        self.user = create_user('unconverted')
+        self.goals = {}
+        with use_shard(shard_for_user(self.user)):
+            for target, current in [('1000.01', '333.33'), ('-12.34', '0.10'), ('99999999.99', '0.29')]:
+                goal = SavingsGoal.objects.create(user=self.user, name=target, target_amount=0, target_date=date.today())
+                self.goals[goal.pk] = (Decimal(target), Decimal(current))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {SavingsGoal._meta.db_table} SET target_amount = %s, current_amount = %s WHERE id = %s',
+                [(target, current, pk) for pk, (target, current) in self.goals.items()]
+            )
+
+    def restore(self):
+        # A failed conversion leaves the columns as decimal for the tests after
+        for model, fields in decimal_money_columns(connection).items():
+            with connection.schema_editor() as schema_editor:
+                for field in fields:
+                    schema_editor.alter_field(model, decimal_column(model, field), field)
+
+    def test_check_and_conversion(self):
+        errors = check_money_columns(None)
+        self.assertEqual({(error.id, error.obj.name) for error in errors},
+                         {('transactions.E002', 'target_amount'), ('transactions.E002', 'current_amount')})
+
+        output = StringIO()
+        call_command('convert_money_columns', dry_run=True, stdout=output)
+        self.assertIn('2 column(s) would be converted', output.getvalue())
+        self.assertEqual(len(check_money_columns(None)), 2)
+
+        output = StringIO()
+        call_command('convert_money_columns', stdout=output)
+        self.assertIn('default: transactions_savingsgoal.target_amount, transactions_savingsgoal.current_amount',
+                      output.getvalue())
+        self.assertEqual(check_money_columns(None), [])
+
+        with use_shard(shard_for_user(self.user)):
+            loaded = {goal.pk: (goal.target_amount, goal.current_amount) for goal in SavingsGoal.objects.all()}
+        self.assertEqual(loaded, self.goals)
+
+        output = StringIO()
+        call_command('convert_money_columns', stdout=output)
+        self.assertIn('0 column(s) converted', output.getvalue())
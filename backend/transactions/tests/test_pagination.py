@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from django.test import TestCase
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.models import Transaction
+from .helpers import FreshCacheMixin, client_for, create_user
+
+
+def cursor_for(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+class TransactionPaginationTests(FreshCacheMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('pages')
+        with use_shard(shard_for_user(cls.user)):
+            for day in (3, 3, 3, 2, 2, 2, 1):
+                Transaction.objects.create(user=cls.user, type='expense', amount=Decimal('5.00'),
+                                           date=date(2024, 1, day))
+            # Ties on both date and created_at leave only the id to order by
+            Transaction.objects.filter(user=cls.user).update(
+                created_at=datetime(2024, 1, 5, tzinfo=timezone.utc))
+            cls.expected = list(Transaction.objects.filter(user=cls.user).order_by(
+                '-date', '-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = client_for(self.user)
+
+    def test_pages_follow_a_stable_order_through_ties(self):
+        seen = []
+        url = '/api/transactions/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, self.expected)
+
+    def test_rows_added_behind_the_cursor_do_not_shift_later_pages(self):
+        response = self.client.get('/api/transactions/?page_size=3')
+        with use_shard(shard_for_user(self.user)):
+            Transaction.objects.create(user=self.user, type='expense', amount=Decimal('1.00'),
+                                       date=date(2024, 1, 4))
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], self.expected[3:6])
+
+    def test_tampered_cursors_are_rejected(self):
+        for cursor in ['not-base64!', cursor_for('text')[:-2], cursor_for(['2024-01-01']),
+                       cursor_for({'date': '2024-01-01'}), cursor_for([1, 2, 3]),
+                       cursor_for(['2024-01-01', '2024-01-05T00:00:00+00:00', 'x'])]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/transactions/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get('/api/transactions/', {'fields': 'id,amount'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({tuple(row) for row in response.data['results']}, {('id', 'amount')})
+
+        response = self.client.get('/api/transactions/', {'fields': 'id,balance'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('balance', str(response.data['fields']))
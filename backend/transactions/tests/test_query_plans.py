@@ -0,0 +1,27 @@
+from django.test import TestCase
+from smartfinance.sharding import shard_for_user, use_shard
+from transactions.query_plans import check_query_plans
+from transactions.synthetic import generate_user
+
+
+class QueryPlanTests(TestCase):
+    """Every endpoint queryset must use an index: no full scans, no temporary sorts for row order
+
+    Runs on the configured database, so point DATABASE_URL at PostgreSQL to
+    check its plans too.
+    """
+    # Synthetic users touch every shard when sharding is on
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = generate_user('plans', transactions=500, days=120)
+
+    def test_endpoint_plans_use_indexes(self):
+        with use_shard(shard_for_user(self.user)):
+            results = check_query_plans(self.user.pk)
+
+        self.assertTrue(results)
+        for name, (plan, problems) in results.items():
+            with self.subTest(name):
+                self.assertEqual(problems, [], plan)
@@ -0,0 +1,163 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.authentication import get_user_cache
+from smartfinance.sharding import ShardNotSelected, get_ring, home_shard, shard_for_user, use_shard
+from transactions.models import Category, Transaction, TransactionRollup
+
+SHARDS = ('default', 'shard1', 'shard2')
+# The test settings add shard1 and shard2 unless DATABASE_SHARD_URLS names other shards
+SHARDED = set(SHARDS) <= set(settings.DATABASES)
+User = get_user_model()
+
+
+def two_shards():
+    """Settings as they were before shard2 was added"""
+    return override_settings(SHARDING={**settings.SHARDING, 'SHARDS': ['default', 'shard1']})
+
+
+@skipUnless(SHARDED, 'DATABASE_SHARD_URLS must name two shards (shard1, shard2)')
+@override_settings(SHARDING={**settings.SHARDING, 'ENABLED': True, 'SHARDS': list(SHARDS)},
+                   AUTH_USER_CACHE={**settings.AUTH_USER_CACHE, 'TTL': 0})
+class ShardingTests(TestCase):
+    # The test runner sets up every alias a test class names, skipped or not
+    databases = set(SHARDS) if SHARDED else {DEFAULT_DB_ALIAS}
+
+    def create_user(self, username, transactions=3):
+        user = User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+        user.refresh_from_db()
+        with use_shard(shard_for_user(user)):
+            for day in range(1, transactions + 1):
+                Transaction.objects.create(user=user, type='expense', amount=Decimal('10.25'),
+                                           category=self.food, date=date(2024, 1, day))
+        return user
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def rows_by_shard(self, model, user):
+        return {alias: model.objects.using(alias).filter(user_id=user.pk).count() for alias in SHARDS}
+
+    def setUp(self):
+        with use_shard(home_shard()):
+            self.food = Category.objects.create(name='Food', type='expense', is_default=True)
+
+    def test_new_users_are_placed_by_the_ring(self):
+        for index in range(6):
+            user = self.create_user(f'placed{index}')
+            self.assertEqual(user.shard, get_ring().node_for(user.pk))
+            expected = {alias: 3 if alias == user.shard else 0 for alias in SHARDS}
+            self.assertEqual(self.rows_by_shard(Transaction, user), expected)
+            if user.shard != DEFAULT_DB_ALIAS:
+                # Mirrored for the foreign keys of their rows there
+                self.assertTrue(User.objects.using(user.shard).filter(pk=user.pk).exists())
+
+    def test_requests_run_on_the_users_shard(self):
+        user = self.create_user('routed')
+        other = self.create_user('other', transactions=1)
+        client = self.client_for(user)
+
+        response = client.post('/api/transactions/', {
+            'type': 'expense', 'amount': '4.50', 'category': self.food.pk, 'date': '2024-01-10'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Transaction.objects.using(user.shard).filter(pk=response.data['id']).exists())
+
+        response = client.get('/api/transactions/')
+        self.assertEqual(len(response.data['results']), 4)
+        response = client.get('/api/transactions/summary/?start_date=2024-01-01&end_date=2024-01-31')
+        self.assertEqual(Decimal(str(response.data['total_expenses'])), Decimal('35.25'))
+        self.assertEqual(self.rows_by_shard(Transaction, other)[other.shard], 1)
+
+    def test_queries_without_a_shard_are_refused(self):
+        with self.assertRaises(ShardNotSelected):
+            list(Transaction.objects.all())
+
+    def test_default_categories_are_copied_to_every_shard(self):
+        with use_shard(home_shard()):
+            category = Category.objects.create(name='Gifts', type='expense', is_default=True)
+        self.assertEqual({alias: Category.objects.using(alias).filter(pk=category.pk).exists() for alias in SHARDS},
+                         dict.fromkeys(SHARDS, True))
+
+        category.name = 'Presents'
+        category.save()
+        self.assertEqual({Category.objects.using(alias).get(pk=category.pk).name for alias in SHARDS}, {'Presents'})
+
+        category.delete()
+        self.assertFalse(any(Category.objects.using(alias).filter(pk=category.pk).exists() for alias in SHARDS))
+
+    def test_rebalance_moves_users_to_an_added_shard(self):
+        with two_shards():
+            with use_shard(home_shard()):
+                gifts = Category.objects.create(name='Gifts', type='expense', is_default=True)
+            users = [self.create_user(f'moved{index}') for index in range(12)]
+        moving = [user for user in users if get_ring().node_for(user.pk) != user.shard]
+        self.assertTrue(moving)
+
+        # A dry run writes nothing, default categories included
+        call_command('rebalance_shards', dry_run=True, stdout=StringIO())
+        self.assertFalse(Category.objects.using('shard2').filter(pk=gifts.pk).exists())
+        self.assertFalse(User.objects.filter(pk__in=[user.pk for user in moving], shard='shard2').exists())
+
+        call_command('rebalance_shards', grace=0, stdout=StringIO())
+        self.assertTrue(Category.objects.using('shard2').filter(pk=gifts.pk).exists())
+        for user in users:
+            user.refresh_from_db()
+            self.assertEqual(user.shard, get_ring().node_for(user.pk))
+            self.assertFalse(user.shard_moving)
+            expected = {alias: 3 if alias == user.shard else 0 for alias in SHARDS}
+            self.assertEqual(self.rows_by_shard(Transaction, user), expected)
+            rollups = self.rows_by_shard(TransactionRollup, user)
+            self.assertEqual([alias for alias, count in rollups.items() if count], [user.shard])
+
+        response = self.client_for(moving[0]).get('/api/transactions/')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_rebalance_refuses_a_grace_shorter_than_the_user_cache_ttl(self):
+        with two_shards():
+            self.create_user('waiting')
+        with override_settings(AUTH_USER_CACHE={**settings.AUTH_USER_CACHE, 'TTL': 60}):
+            with self.assertRaisesMessage(Exception, '--grace must be at least'):
+                call_command('rebalance_shards', grace=5, stdout=StringIO())
+
+    @mock.patch.object(get_user_cache(), 'ttl', 60)
+    def test_writes_are_refused_while_the_user_is_moving(self):
+        user = self.create_user('frozen')
+        client = self.client_for(user)
+        # Caches the user as not moving
+        self.assertEqual(client.get('/api/transactions/').status_code, 200)
+
+        # No signal and no version bump: only the database says the user is moving
+        User.objects.filter(pk=user.pk).update(shard_moving=True)
+        response = client.post('/api/transactions/', {
+            'type': 'expense', 'amount': '1.00', 'date': '2024-01-20'
+        }, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(client.get('/api/transactions/').status_code, 200)
+        self.assertEqual(self.rows_by_shard(Transaction, user)[user.shard], 3)
+
+    def test_admin_lists_each_shards_rows(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin)
+        for index in range(6):
+            user = self.create_user(f'admin{index}', transactions=1)
+            transaction = Transaction.objects.using(user.shard).get(user=user)
+            namespace = 'admin' if user.shard == home_shard() else f'admin-{user.shard}'
+            response = self.client.get(reverse(f'{namespace}:transactions_transaction_changelist'))
+            self.assertContains(response, f'{user.username} - expense')
+            response = self.client.get(reverse(f'{namespace}:transactions_transaction_change', args=[transaction.pk]))
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse(f'{namespace}:transactions_transaction_delete', args=[transaction.pk]))
+            self.assertEqual(response.status_code, 200)
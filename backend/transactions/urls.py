@@ -1,13 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, TransactionViewSet, BudgetViewSet, SavingsGoalViewSet
+from .views import CategoryViewSet, TransactionViewSet, BudgetViewSet, SavingsGoalViewSet, TransactionSummaryView
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
-router.register(r'', TransactionViewSet, basename='transaction')
 router.register(r'budgets', BudgetViewSet, basename='budget')
 router.register(r'savings-goals', SavingsGoalViewSet, basename='savings-goal')
+# Registered last so its detail route doesn't shadow the prefixes above
+router.register(r'', TransactionViewSet, basename='transaction')
 
 urlpatterns = [
+    # Ahead of the router, whose transaction detail route would match it
+    path('summary/', TransactionSummaryView.as_view(), name='transaction-summary'),
     path('', include(router.urls)),
 ]
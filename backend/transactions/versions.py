@@ -0,0 +1,67 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_CACHE_ALIAS = 'default'
+
+# Backends whose entries only the writing process sees
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Owner id for data shared by every user, such as the default categories
+SHARED = None
+
+
+def versions_shared():
+    """Whether every process sees the same data versions
+
+    Caches keyed by a version are only invalidated across processes (web
+    workers, ml_worker, management commands) when they are; callers skip
+    caching and validators otherwise.
+    """
+    return settings.CACHES[VERSION_CACHE_ALIAS]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+def _version_key(user_id, scope):
+    owner = 'shared' if user_id is SHARED else user_id
+    return f'data-version:{scope}:{owner}'
+
+
+def get_data_version(user_id, scope='transactions'):
+    """Current version of a user's data; changes whenever bump_data_version is called"""
+    cache = caches[VERSION_CACHE_ALIAS]
+    key = _version_key(user_id, scope)
+    version = cache.get(key)
+    if version is None:
+        # Unknown (first use or evicted): start a fresh version so nothing
+        # cached under an older one can be served
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_data_versions(user_id, scopes):
+    """Current versions of several scopes of a user's data in one cache round trip"""
+    cache = caches[VERSION_CACHE_ALIAS]
+    keys = {_version_key(user_id, scope): scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, scope in keys.items():
+        if key not in found:
+            versions[scope] = get_data_version(user_id, scope)
+    return versions
+
+
+def bump_data_version(user_id, scope='transactions'):
+    """Invalidate everything derived from a user's data"""
+    # Nanosecond timestamps stay unique across processes without an atomic
+    # counter, and double as a modification time
+    caches[VERSION_CACHE_ALIAS].set(_version_key(user_id, scope), time.time_ns(), None)
+
+
+def bump_data_versions(user_ids, scope='transactions'):
+    """bump_data_version() for many users in one cache round trip"""
+    version = time.time_ns()
+    caches[VERSION_CACHE_ALIAS].set_many({_version_key(user_id, scope): version for user_id in user_ids}, None)
@@ -1,59 +1,220 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Q
+import os
 from datetime import datetime, timedelta
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from smartfinance.db_router import analytics_db
+from smartfinance.money import from_minor, to_minor
+from smartfinance.sharding import shard_for_user
 from .models import Category, Transaction, Budget, SavingsGoal
 from .serializers import (
     CategorySerializer, TransactionSerializer,
-    BudgetSerializer, SavingsGoalSerializer
+    BudgetSerializer, SavingsGoalSerializer, requested_fields
 )
+from .async_views import AsyncAPIView
+from .bulk import bulk_write_transactions
+from .categories import visible_categories
+from .conditional import (
+    BUDGET_SCOPES, CATEGORY_SCOPES, SAVINGS_GOAL_SCOPES, SHARED_SCOPES, TRANSACTION_SCOPES,
+    versioned_response
+)
+from .exporters import ExportFormatError, export_stream
+from .importers import IMPORT_PARSERS, import_transactions
+from .pagination import TransactionKeysetPagination
+from .summary import asummarize_user, TIME_BUCKETS
+
+TRANSACTION_COLUMNS = {'id', 'type', 'amount', 'category', 'description', 'date', 'created_at', 'updated_at'}
+
+
+def transaction_filters(params):
+    """The list filters supported by TransactionQuerySet.matching, read from query params"""
+    return {
+        'start_date': params.get('start_date'),
+        'end_date': params.get('end_date'),
+        'trans_type': params.get('type'),
+        'category': params.get('category'),
+    }
 
 
+@method_decorator(versioned_response(CATEGORY_SCOPES, SHARED_SCOPES), name='list')
+@method_decorator(versioned_response(CATEGORY_SCOPES, SHARED_SCOPES), name='retrieve')
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Category.objects.filter(
-            Q(user=self.request.user) | Q(is_default=True)
-        ).distinct()
+        return Category.objects.visible_to(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # From the in-process category directory: no query while it is current
+        categories = visible_categories(request.user.pk).categories
+        return Response(self.get_serializer(categories, many=True).data)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
+@method_decorator(versioned_response(TRANSACTION_SCOPES, SHARED_SCOPES), name='list')
+@method_decorator(versioned_response(TRANSACTION_SCOPES, SHARED_SCOPES), name='retrieve')
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionKeysetPagination
+    max_bulk_items = 1000
 
     def get_queryset(self):
         queryset = Transaction.objects.filter(user=self.request.user)
 
-        # Filter by date range
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
-        if start_date and end_date:
-            queryset = queryset.filter(date__gte=start_date, date__lte=end_date)
-
-        # Filter by type
-        trans_type = self.request.query_params.get('type')
-        if trans_type:
-            queryset = queryset.filter(type=trans_type)
-
-        # Filter by category
-        category = self.request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category_id=category)
+        # Only load the columns a sparse fieldset asks for; category names and
+        # colours come from the category directory rather than a join
+        fields = requested_fields(self.request)
+        if fields is not None:
+            columns = {'id', 'date', 'created_at'} | (fields & TRANSACTION_COLUMNS)
+            if fields & {'category_name', 'category_color'}:
+                columns |= {'user', 'category'}
+            queryset = queryset.only(*columns)
 
-        return queryset
+        return queryset.matching(**transaction_filters(self.request.query_params))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create, partially update and delete many transactions in one DB transaction"""
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Expected an object with create, update and delete lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        creates = request.data.get('create', [])
+        updates = request.data.get('update', [])
+        deletes = request.data.get('delete', [])
+        if not all(isinstance(items, list) for items in (creates, updates, deletes)):
+            return Response(
+                {'error': 'create, update and delete must be lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(creates) + len(updates) + len(deletes) > self.max_bulk_items:
+            return Response(
+                {'error': f'At most {self.max_bulk_items} items per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # One lookup each for categories and the rows being changed, instead of one per item
+        context = {
+            **self.get_serializer_context(),
+            'categories': visible_categories(request.user.pk).by_id,
+        }
+        errors = {'create': [], 'update': [], 'delete': []}
+
+        created = []
+        for index, item in enumerate(creates):
+            serializer = TransactionSerializer(data=item, context=context)
+            if serializer.is_valid():
+                created.append(Transaction(user=request.user, **serializer.validated_data))
+            else:
+                errors['create'].append({'index': index, 'errors': serializer.errors})
+
+        update_ids = [item.get('id') if isinstance(item, dict) else None for item in updates]
+        delete_ids = set()
+        for index, pk in enumerate(deletes):
+            if isinstance(pk, int) and not isinstance(pk, bool):
+                delete_ids.add(pk)
+            else:
+                errors['delete'].append({'index': index, 'errors': ['Expected a transaction id.']})
+
+        instances = Transaction.objects.filter(
+            user=request.user,
+            pk__in=[pk for pk in update_ids if isinstance(pk, int)]
+        ).in_bulk()
+        updated = []
+        seen = set()
+        for index, (pk, item) in enumerate(zip(update_ids, updates)):
+            if pk not in instances:
+                errors['update'].append({'index': index, 'errors': {'id': ['Not found.']}})
+                continue
+            if pk in seen:
+                errors['update'].append({'index': index, 'errors': {'id': ['Appears more than once.']}})
+                continue
+            if pk in delete_ids:
+                errors['update'].append({'index': index, 'errors': {'id': ['Also listed for deletion.']}})
+                continue
+            seen.add(pk)
+            serializer = TransactionSerializer(instances[pk], data=item, partial=True, context=context)
+            if serializer.is_valid():
+                updated.append((instances[pk], serializer.validated_data))
+            else:
+                errors['update'].append({'index': index, 'errors': serializer.errors})
+
+        if any(errors.values()):
+            # Nothing is written unless every item is valid
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, deleted_ids = bulk_write_transactions(
+            created=created,
+            updated=updated,
+            deleted=Transaction.objects.filter(user=request.user, pk__in=delete_ids) if delete_ids else None
+        )
+        return Response({
+            'created': TransactionSerializer(created, many=True, context=context).data,
+            'updated': TransactionSerializer(updated, many=True, context=context).data,
+            'deleted': deleted_ids,
+            'not_found': sorted(delete_ids - set(deleted_ids)),
+        })
+
     @action(detail=False, methods=['get'])
-    def summary(self, request):
+    def export(self, request):
+        file_format = request.query_params.get('file_format', 'csv').lower()
+        # Pinned to the user's shard: the response streams after the request's shard is released
+        queryset = Transaction.objects.using(shard_for_user(request.user)).filter(user=request.user).matching(
+            **transaction_filters(request.query_params)
+        )
+
+        try:
+            content, content_type = export_stream(queryset, file_format)
+        except ExportFormatError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f"transactions-{datetime.now().date().isoformat()}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_file(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'Upload a CSV or OFX statement in the "file" field'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        file_format = request.data.get('file_format') or os.path.splitext(upload.name)[1].lstrip('.')
+        parser = IMPORT_PARSERS.get(file_format.lower())
+        if parser is None:
+            return Response(
+                {'error': f"file_format must be one of: {', '.join(IMPORT_PARSERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = import_transactions(request.user, parser(upload))
+        if 'error' in result and not result['created']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+
+class TransactionSummaryView(AsyncAPIView):
+    """Income/expense totals and category breakdown, served from the async ORM"""
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(versioned_response(TRANSACTION_SCOPES, SHARED_SCOPES))
+    async def get(self, request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
 
@@ -61,48 +222,39 @@ class TransactionViewSet(viewsets.ModelViewSet):
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=30)
 
-        transactions = Transaction.objects.filter(
-            user=request.user,
-            date__gte=start_date,
-            date__lte=end_date
-        )
+        group_by = request.query_params.get('group_by')
+        if group_by and group_by not in TIME_BUCKETS:
+            return Response(
+                {'error': f"group_by must be one of: {', '.join(TIME_BUCKETS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        income = transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
-        expenses = transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
-
-        # Category breakdown
-        category_breakdown = []
-        for category in Category.objects.filter(user=request.user):
-            amount = transactions.filter(category=category).aggregate(Sum('amount'))['amount__sum'] or 0
-            if amount > 0:
-                category_breakdown.append({
-                    'category': category.name,
-                    'amount': float(amount),
-                    'color': category.color,
-                    'type': category.type
-                })
+        summary = await asummarize_user(request.user, start_date, end_date, group_by=group_by or None)
+        summary['start_date'] = start_date
+        summary['end_date'] = end_date
 
-        return Response({
-            'total_income': float(income),
-            'total_expenses': float(expenses),
-            'balance': float(income - expenses),
-            'category_breakdown': category_breakdown,
-            'start_date': start_date,
-            'end_date': end_date
-        })
+        return Response(summary)
 
 
+@method_decorator(versioned_response(BUDGET_SCOPES, SHARED_SCOPES), name='list')
+@method_decorator(versioned_response(BUDGET_SCOPES, SHARED_SCOPES), name='retrieve')
 class BudgetViewSet(viewsets.ModelViewSet):
     serializer_class = BudgetSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Budget.objects.filter(user=self.request.user)
+        budgets = Budget.objects.filter(user=self.request.user).with_spent_amount()
+        if self.action == 'list':
+            # Spend sums transactions: an analytics read
+            budgets = budgets.using(analytics_db(self.request.user.pk))
+        return budgets
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
+@method_decorator(versioned_response(SAVINGS_GOAL_SCOPES), name='list')
+@method_decorator(versioned_response(SAVINGS_GOAL_SCOPES), name='retrieve')
 class SavingsGoalViewSet(viewsets.ModelViewSet):
     serializer_class = SavingsGoalSerializer
     permission_classes = [IsAuthenticated]
@@ -119,8 +271,7 @@ class SavingsGoalViewSet(viewsets.ModelViewSet):
         amount = request.data.get('amount', 0)
 
         try:
-            amount = float(amount)
-            goal.current_amount += amount
+            goal.current_amount += from_minor(to_minor(amount))
             if goal.current_amount >= goal.target_amount:
                 goal.is_completed = True
             goal.save()
@@ -29,13 +29,14 @@ export default function Dashboard() {
       const startDate = new Date()
       startDate.setDate(startDate.getDate() - 30)
 
-      const response = await axios.get('/api/transactions/summary/', {
+      const response = await axios.get('/api/dashboard/', {
         params: {
+          sections: 'summary',
           start_date: startDate.toISOString().split('T')[0],
           end_date: endDate.toISOString().split('T')[0],
         },
       })
-      setSummary(response.data)
+      setSummary(response.data.summary)
     } catch (error) {
       console.error('Failed to fetch summary', error)
     } finally {
@@ -25,6 +25,7 @@ export default function Transactions() {
   const [transactions, setTransactions] = useState<Transaction[]>([])
   const [categories, setCategories] = useState<Category[]>([])
   const [showModal, setShowModal] = useState(false)
+  const [selected, setSelected] = useState<number[]>([])
   const [formData, setFormData] = useState({
     type: 'expense',
     amount: '',
@@ -85,25 +86,63 @@ export default function Transactions() {
     }
   }
 
+  const toggleSelected = (id: number) => {
+    setSelected(selected.includes(id) ? selected.filter(item => item !== id) : [...selected, id])
+  }
+
+  const toggleAll = () => {
+    setSelected(selected.length === transactions.length ? [] : transactions.map(transaction => transaction.id))
+  }
+
+  const handleDeleteSelected = async () => {
+    if (confirm(`Delete ${selected.length} selected transactions?`)) {
+      try {
+        await axios.post('/api/transactions/bulk/', { delete: selected })
+        setSelected([])
+        fetchTransactions()
+      } catch (error) {
+        console.error('Failed to delete transactions', error)
+      }
+    }
+  }
+
   const filteredCategories = categories.filter(cat => cat.type === formData.type)
 
   return (
     <div className="space-y-6">
       <div className="flex justify-between items-center">
         <h1 className="text-3xl font-bold text-gray-900">Transactions</h1>
-        <button
-          onClick={() => setShowModal(true)}
-          className="flex items-center px-4 py-2 bg-primary text-white rounded-lg hover:bg-blue-700"
-        >
-          <Plus className="w-4 h-4 mr-2" />
-          Add Transaction
-        </button>
+        <div className="flex items-center space-x-3">
+          {selected.length > 0 && (
+            <button
+              onClick={handleDeleteSelected}
+              className="flex items-center px-4 py-2 bg-red-600 text-white rounded-lg hover:bg-red-700"
+            >
+              <Trash2 className="w-4 h-4 mr-2" />
+              Delete Selected ({selected.length})
+            </button>
+          )}
+          <button
+            onClick={() => setShowModal(true)}
+            className="flex items-center px-4 py-2 bg-primary text-white rounded-lg hover:bg-blue-700"
+          >
+            <Plus className="w-4 h-4 mr-2" />
+            Add Transaction
+          </button>
+        </div>
       </div>
 
       <div className="bg-white rounded-lg shadow overflow-hidden">
         <table className="min-w-full divide-y divide-gray-200">
           <thead className="bg-gray-50">
             <tr>
+              <th className="px-6 py-3">
+                <input
+                  type="checkbox"
+                  checked={transactions.length > 0 && selected.length === transactions.length}
+                  onChange={toggleAll}
+                />
+              </th>
               <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">
                 Date
               </th>
@@ -127,6 +166,13 @@ export default function Transactions() {
           <tbody className="bg-white divide-y divide-gray-200">
             {transactions.map((transaction) => (
               <tr key={transaction.id}>
+                <td className="px-6 py-4">
+                  <input
+                    type="checkbox"
+                    checked={selected.includes(transaction.id)}
+                    onChange={() => toggleSelected(transaction.id)}
+                  />
+                </td>
                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
                   {format(new Date(transaction.date), 'MMM dd, yyyy')}
                 </td>